@@ -0,0 +1,373 @@
+# batch_vm.py - Ejecución de un programa sobre muchas entradas a la vez
+'''
+Máquina por lotes
+=================
+Ejecuta un mismo IRModule sobre N entradas en una sola pasada, al
+estilo SIMD: cada valor de la pila de operandos, cada local y cada
+global es un arreglo de NumPy con una posición ("carril") por entrada,
+y cada operación se aplica a todos los carriles con una sola operación
+de NumPy.
+
+Las entradas reemplazan la inicialización de globales: con
+run({'num': [15, 21, 35]}) la primera asignación a 'num' guarda el
+arreglo de entradas en lugar del valor del programa.
+
+El control de flujo se ejecuta sobre el IR estructurado (IF / ELSE /
+ENDIF, LOOP / CBREAK / ENDLOOP, CONTINUE) con una máscara de carriles
+activos:
+
+  - IF ejecuta la rama then con los carriles cuya condición es
+    verdadera y la else con el resto; después siguen los que llegaron
+    al final de alguna de las dos,
+  - un bucle repite el cuerpo mientras quede algún carril activo;
+    CBREAK saca del bucle a los carriles con condición falsa y CONTINUE
+    los deja fuera hasta la vuelta siguiente,
+  - RET guarda el valor de los carriles activos y los desactiva hasta
+    el final de la función; las llamadas ejecutan la función con la
+    máscara del llamador,
+  - las escrituras (locales, globales) solo cambian los carriles
+    activos, y la salida de cada carril se guarda aparte.
+
+Un error (división por cero, argumentos inválidos de una intrínseca)
+detiene solo a los carriles donde ocurre: el mensaje queda en
+BatchMachine.errors y los demás siguen.
+
+Limitaciones: los enteros son int64 (la Stack Machine no tiene límite,
+así que un desborde da resultados distintos) y no hay memoria lineal
+(PEEK / POKE / MEMCPY ... se rechazan al cargar). El IR debe venir sin
+evaluación al compilar (consteval.py), que ya habría usado el valor
+inicial de los globales.
+'''
+import numpy as np
+
+from intrinsics import INTRINSICS
+
+
+class BatchError(RuntimeError):
+    '''El módulo no se puede ejecutar por lotes.'''
+    pass
+
+
+_UNSUPPORTED = {'PEEKI', 'POKEI', 'PEEKF', 'POKEF', 'PEEKB', 'POKEB', 'GROW',
+                'MEMCPY', 'MEMSET', 'MEMCMP'}
+
+
+def _float(a):
+    return np.asarray(a, dtype=np.float64)
+
+
+# Misma semántica que los handlers de stack_machine.py (0 / 1 para las comparaciones)
+_BINARY = {
+    'ADDI': np.add,
+    'SUBI': np.subtract,
+    'MULI': np.multiply,
+    'EQI': lambda a, b: (a == b) * 1,
+    'NEI': lambda a, b: (a != b) * 1,
+    'LTI': lambda a, b: (a < b) * 1,
+    'LEI': lambda a, b: (a <= b) * 1,
+    'GTI': lambda a, b: (a > b) * 1,
+    'GEI': lambda a, b: (a >= b) * 1,
+    'ANDI': lambda a, b: ((a != 0) & (b != 0)) * 1,
+    'ORI': lambda a, b: ((a != 0) | (b != 0)) * 1,
+    'ADDF': lambda a, b: _float(a) + _float(b),
+    'SUBF': lambda a, b: _float(a) - _float(b),
+    'MULF': lambda a, b: _float(a) * _float(b),
+    'EQF': lambda a, b: (np.abs(_float(a) - _float(b)) < 1e-9) * 1,
+    'NEF': lambda a, b: (np.abs(_float(a) - _float(b)) >= 1e-9) * 1,
+}
+
+# División: el divisor 0 es un error del carril
+_DIVISIONS = {
+    'DIVI': np.floor_divide,
+    'MODI': np.remainder,
+    'DIVF': lambda a, b: _float(a) / _float(b),
+}
+
+_UNARY = {
+    'ITOF': _float,
+    'FTOI': lambda a: np.asarray(a).astype(np.int64),
+}
+
+
+def _powmod(a, x, n):
+    a, x, n = np.broadcast_arrays(*(np.asarray(v, dtype=np.int64) for v in (a, x, n)))
+    if n.size and np.abs(n).max() >= 2**31:
+        # result * base no entra en int64: un pow de Python por carril
+        return np.array([pow(int(p), int(q), int(r)) for p, q, r in zip(a, x, n)],
+                        dtype=np.int64)
+    result = np.ones_like(a) % n
+    base = a % n
+    x = x.copy()
+    while (x > 0).any():
+        result = np.where(x & 1 == 1, result * base % n, result)
+        base = base * base % n
+        x >>= 1
+    return result
+
+
+def _isqrt(a):
+    a = np.asarray(a, dtype=np.int64)
+    root = np.floor(np.sqrt(a.astype(np.float64))).astype(np.int64)
+    # El redondeo de sqrt puede errar por uno
+    root -= root * root > a
+    root += (root + 1) * (root + 1) <= a
+    return root
+
+
+# nombre -> (función vectorizada, [(argumento, condición inválida, mensaje, reemplazo)])
+_INTRINSICS = {
+    '__mod': (np.remainder, [(1, lambda v: v == 0, "División por cero", 1)]),
+    '__gcd': (np.gcd, []),
+    '__powmod': (_powmod, [(2, lambda v: v == 0, "Módulo cero en __powmod", 1),
+                           (1, lambda v: v < 0, "Exponente negativo en __powmod", 0)]),
+    '__isqrt': (_isqrt, [(0, lambda v: v < 0, "Raíz de un número negativo en __isqrt", 0)]),
+}
+
+
+class _Function:
+    """Cuerpo en árbol de una IRFunction: ('op', instr), ('if', then, else), ('loop', cuerpo)"""
+    __slots__ = ('name', 'params', 'locals', 'returns', 'body')
+
+    def __init__(self, func):
+        self.name = func.name
+        self.params = list(func.params)
+        self.locals = list(func.locals)
+        self.returns = func.return_type != 'V'
+        self.body = _tree(func.name, [tuple(instr) for instr in func.instructions])
+
+
+def _tree(name, instructions):
+    """Anida los marcadores IF / ELSE / ENDIF y LOOP / ENDLOOP"""
+    root = []
+    open_ = [('root', root)]
+    for instr in instructions:
+        op = instr[0]
+        if op in _UNSUPPORTED:
+            raise BatchError(f"{name}: instrucción no soportada en lote: {op}")
+        if op == 'IF':
+            node = ('if', [], [])
+            open_[-1][1].append(node)
+            open_.append(('then', node[1]))
+        elif op == 'ELSE':
+            if open_[-1][0] != 'then':
+                raise BatchError(f"{name}: ELSE sin IF correspondiente")
+            open_.pop()
+            open_.append(('else', open_[-1][1][-1][2]))
+        elif op == 'ENDIF':
+            if open_[-1][0] not in ('then', 'else'):
+                raise BatchError(f"{name}: ENDIF sin IF correspondiente")
+            open_.pop()
+        elif op == 'LOOP':
+            node = ('loop', [])
+            open_[-1][1].append(node)
+            open_.append(('loop', node[1]))
+        elif op == 'ENDLOOP':
+            if open_[-1][0] != 'loop':
+                raise BatchError(f"{name}: ENDLOOP sin LOOP correspondiente")
+            open_.pop()
+        else:
+            open_[-1][1].append(('op', instr))
+    if len(open_) != 1:
+        raise BatchError(f"{name}: {open_[-1][0].upper()} sin cerrar")
+    return root
+
+
+class _Frame:
+    __slots__ = ('locals', 'stack', 'result', 'loops')
+
+    def __init__(self, locals_, result):
+        self.locals = locals_
+        self.stack = []
+        self.result = result
+        self.loops = []     # [carriles que salieron, carriles con CONTINUE] por bucle
+
+
+class BatchMachine:
+    """
+    Ejecuta un IRModule sobre N entradas a la vez. run(inputs) recibe
+    nombre de global -> secuencia de N valores y devuelve la salida de
+    cada carril; errors guarda carril -> mensaje de los que fallaron.
+    """
+
+    def __init__(self):
+        self.functions = {}
+        self.strings = []
+        self.globals = {}
+        self.errors = {}
+        self.outputs = []
+        self.lanes = 0
+        self._assigned = set()
+
+    def load_module(self, module):
+        self.strings = list(module.strings)
+        for func in module.functions:
+            self.functions[func.name] = _Function(func)
+        self._assigned = {instr[1] for func in module.functions
+                          for instr in func.instructions if instr[0] == 'GLOBAL_SET'}
+
+    def run(self, inputs, entry_function="main"):
+        """Ejecuta entry_function en todos los carriles; devuelve la salida de cada uno"""
+        if entry_function not in self.functions:
+            raise RuntimeError(f"Función '{entry_function}' no encontrada")
+        self.inputs = {name: np.asarray(values) for name, values in inputs.items()}
+        sizes = {len(values) for values in self.inputs.values()}
+        if len(sizes) != 1:
+            raise BatchError("Las entradas deben tener la misma cantidad de valores")
+        for name in self.inputs:
+            if name not in self._assigned:
+                raise BatchError(f"Global '{name}' no se asigna en el programa")
+        self.lanes = sizes.pop()
+        self.globals = {}
+        self.errors = {}
+        self.outputs = [[] for _ in range(self.lanes)]
+        self.failed = np.zeros(self.lanes, dtype=bool)
+        self._pending = set(self.inputs)
+        self._call(entry_function, [], np.ones(self.lanes, dtype=bool))
+        return ["".join(parts) for parts in self.outputs]
+
+    # ---------- ejecución ----------
+    def _call(self, name, args, mask):
+        function = self.functions.get(name)
+        if function is None:
+            raise RuntimeError(f"Función '{name}' no encontrada")
+        locals_ = dict.fromkeys(function.locals, 0)
+        locals_.update(zip(function.params, args))
+        frame = _Frame(locals_, 0 if function.returns else None)
+        if mask.any():
+            self._block(function.body, mask, frame, function)
+        return frame.result
+
+    def _block(self, nodes, mask, frame, function):
+        """Ejecuta una lista de nodos; devuelve los carriles que llegan al final"""
+        stack = frame.stack
+        for node in nodes:
+            kind = node[0]
+            if kind == 'if':
+                condition = np.asarray(stack.pop()) != 0
+                then_mask, else_mask = mask & condition, mask & ~condition
+                if then_mask.any():
+                    then_mask = self._block(node[1], then_mask, frame, function)
+                if node[2] and else_mask.any():
+                    else_mask = self._block(node[2], else_mask, frame, function)
+                mask = then_mask | else_mask
+                continue
+            if kind == 'loop':
+                loop = [np.zeros(self.lanes, dtype=bool), None]
+                frame.loops.append(loop)
+                active = mask
+                while active.any():
+                    loop[1] = np.zeros(self.lanes, dtype=bool)
+                    active = self._block(node[1], active, frame, function) | loop[1]
+                frame.loops.pop()
+                mask = loop[0]
+                continue
+
+            instr = node[1]
+            op = instr[0]
+            if op == 'LOCAL_GET':
+                stack.append(frame.locals[instr[1]])
+            elif op == 'LOCAL_SET':
+                frame.locals[instr[1]] = np.where(mask, stack.pop(), frame.locals[instr[1]])
+            elif op in ('CONSTI', 'PUSHI'):
+                stack.append(int(instr[1]))
+            elif op == 'CONSTF':
+                stack.append(float(instr[1]))
+            elif op in _BINARY:
+                b, a = stack.pop(), stack.pop()
+                stack.append(_BINARY[op](a, b))
+            elif op in _DIVISIONS:
+                b, a = stack.pop(), stack.pop()
+                mask = self._guard(mask, b == 0, "División por cero")
+                stack.append(_DIVISIONS[op](a, np.where(b == 0, 1, b)))
+            elif op in _UNARY:
+                stack.append(_UNARY[op](stack.pop()))
+            elif op == 'GLOBAL_GET':
+                stack.append(self.globals.get(instr[1], 0))
+            elif op == 'GLOBAL_SET':
+                value = stack.pop()
+                if instr[1] in self._pending:
+                    # Primera asignación: el valor viene de las entradas
+                    self._pending.discard(instr[1])
+                    value = self.inputs[instr[1]]
+                self.globals[instr[1]] = np.where(mask, value, self.globals.get(instr[1], 0))
+            elif op == 'INTRINSIC':
+                mask = self._intrinsic(instr[1], mask, stack)
+            elif op in ('CALL', 'TAILCALL'):
+                callee = self.functions.get(instr[1])
+                if callee is None:
+                    raise RuntimeError(f"Función '{instr[1]}' no encontrada")
+                count = len(callee.params)
+                args = stack[len(stack) - count:]
+                del stack[len(stack) - count:]
+                result = self._call(instr[1], args, mask)
+                mask = mask & ~self.failed
+                if op == 'TAILCALL':
+                    frame.result = np.where(mask, result, frame.result) if function.returns else None
+                    return mask & False
+                if callee.returns:
+                    stack.append(result)
+            elif op == 'RET':
+                if function.returns:
+                    frame.result = np.where(mask, stack.pop(), frame.result)
+                return mask & False
+            elif op == 'CBREAK':
+                leaving = mask & (stack.pop() == 0)
+                frame.loops[-1][0] |= leaving
+                mask = mask & ~leaving
+                if not mask.any():
+                    return mask
+            elif op == 'CONTINUE':
+                frame.loops[-1][1] |= mask
+                return mask & False
+            elif op == 'DROP':
+                stack.pop()
+            elif op == 'PRINTI':
+                self._print(mask, stack.pop(), lambda v: f"{int(v)}\n")
+            elif op == 'PRINTF':
+                self._print(mask, stack.pop(), lambda v: f"{float(v)}\n")
+            elif op == 'PRINTB':
+                self._print(mask, stack.pop(), lambda v: chr(int(v)))
+            elif op == 'PRINTS':
+                text = self.strings[int(instr[1])]
+                for lane in np.flatnonzero(mask):
+                    self.outputs[lane].append(text)
+            else:
+                raise BatchError(f"Instrucción no implementada en lote: {op}")
+        return mask
+
+    def _guard(self, mask, invalid, message):
+        """Detiene los carriles activos donde 'invalid'; devuelve la máscara sin ellos"""
+        bad = mask & invalid
+        if bad.any():
+            for lane in np.flatnonzero(bad):
+                self.errors.setdefault(int(lane), message)
+            self.failed |= bad
+            mask = mask & ~bad
+        return mask
+
+    def _intrinsic(self, name, mask, stack):
+        if name not in INTRINSICS:
+            raise RuntimeError(f"Intrínseca '{name}' no encontrada")
+        function, guards = _INTRINSICS[name]
+        count = INTRINSICS[name].arity
+        args = stack[len(stack) - count:]
+        del stack[len(stack) - count:]
+        for index, invalid, message, replacement in guards:
+            bad = invalid(args[index])
+            mask = self._guard(mask, bad, message)
+            args[index] = np.where(bad, replacement, args[index])
+        stack.append(function(*args))
+        return mask
+
+    def _print(self, mask, value, text):
+        values = np.broadcast_to(value, (self.lanes,))
+        for lane in np.flatnonzero(mask):
+            self.outputs[lane].append(text(values[lane]))
+
+
+def run_batch(module, inputs, entry_function="main"):
+    """(salida por carril, errores) de ejecutar module con cada entrada"""
+    machine = BatchMachine()
+    machine.load_module(module)
+    outputs = machine.run(inputs, entry_function)
+    return outputs, machine.errors
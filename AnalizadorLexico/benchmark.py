@@ -0,0 +1,481 @@
+# benchmark.py - Mediciones de rendimiento de la Stack Machine
+'''
+Ejecuta programas de ejemplo (variantes de shor.gox y factorize.gox con
+entradas más grandes, un bucle contador, un programa que solo imprime y
+un recorrido de memoria) y reporta instrucciones
+ejecutadas (con y sin las superinstrucciones de peephole.py), tiempo e
+instrucciones por segundo del bucle verificado, y el tiempo del bucle
+con handlers (verify=False) para comparar.
+
+También compara la recursión de cola con y sin TAILCALL sobre un gcd
+recursivo (profundidad máxima de frames y tiempo), y los programas con
+muchas llamadas con y sin inlining (llamadas ejecutadas y tiempo), y
+las optimizaciones de bucles de loopopt.py: sin ellas, con LICM y
+reducción de fuerza, y además desenrollando de a 4.
+
+Compara la máquina de pila con la de registros (register_vm.py):
+instrucciones ejecutadas y tiempo de cada una. Mide la evaluación al
+compilar de consteval.py sobre los ejemplos tal cual: instrucciones que
+quedan para la ejecución e instrucciones gastadas al compilar. La tabla
+de intrínsecas compara shor.gox con la misma versión que llama a
+__powmod, __gcd y __mod (intrinsics.py). La de memoización compara el
+tiempo de un fib recursivo y de shor con y sin StackMachine(memoize=N),
+con aciertos y fallos del cache. La de lotes ejecuta factorize.gox sobre
+muchas entradas con batch_vm.py y con una StackMachine por entrada. La
+del planificador ejecuta un shor largo seguido de muchos factorize cortos
+uno detrás de otro y con scheduler.py para varios tamaños de porción:
+tiempo total, latencia de los programas cortos y cambios de contexto.
+
+Uso:
+    python benchmark.py [--repeat N]
+'''
+import contextlib
+import copy
+import io
+import re
+import sys
+import time
+
+from lexer import tokenize
+from parser import Parser
+from check import Checker
+from ircode import IRCodeGenerator, IRModule, IRFunction
+from consteval import EVAL_BUDGET, evaluate_calls, mark_pure_functions
+from iropt import INLINE_MAX_SIZE, optimize_module
+from loopopt import optimize_loops
+from batch_vm import run_batch
+from register_vm import RegisterMachine
+from scheduler import Scheduler
+from stack_machine import MEMO_SIZE, StackMachine
+
+
+LOOP_PROGRAM = """
+var i int = 0;
+var s int = 0;
+while (i < 200000) {
+    s = s + i % 7;
+    i = i + 1;
+}
+print s;
+"""
+
+OUTPUT_PROGRAM = """
+var i int = 0;
+while (i < 20000) {
+    print "linea " + i;
+    i = i + 1;
+}
+"""
+
+GCD_PROGRAM = """
+func gcd(a int, b int) int {
+    if (b == 0) {
+        return a;
+    }
+    return gcd(b, a % b);
+}
+func sum_to(n int, acc int) int {
+    if (n == 0) {
+        return acc;
+    }
+    return sum_to(n - 1, acc + gcd(n * 832040, 514229));
+}
+print sum_to(3000, 0);
+"""
+
+# shor.gox con las intrínsecas en lugar de mod, gcd y powmod
+SHOR_INTRINSICS_PROGRAM = """
+func find_period(a int, N int) int {
+    var r int = 1;
+    var apow int = __powmod(a, r, N);
+    while (apow != 1) {
+        r = r + 1;
+        apow = __powmod(a, r, N);
+    }
+    return r;
+}
+
+func shor(N int) int {
+    var a int = 2;
+    if (__gcd(a, N) != 1) {
+        return a;
+    }
+
+    var r int = find_period(a, N);
+    if (__mod(r, 2) != 0) {
+        return 0;
+    }
+
+    var x int = __powmod(a, r / 2, N);
+    if (x == N - 1) {
+        return 0;
+    }
+
+    var f1 int = __gcd(x - 1, N);
+    var f2 int = __gcd(x + 1, N);
+    print f1;
+    print f2;
+    return 0;
+}
+
+var num int = 15;
+shor(num);
+"""
+
+FIB_PROGRAM = """
+func fib(n int) int {
+    if (n < 2) {
+        return n;
+    }
+    return fib(n - 1) + fib(n - 2);
+}
+print fib(24);
+"""
+
+INVARIANT_PROGRAM = """
+func suma(n int, a int, b int) int {
+    var s int = 0;
+    var i int = 0;
+    while (i < n) {
+        s = s + (a * b + i) % (a + b) + i * 3;
+        i = i + 1;
+    }
+    return s;
+}
+print suma(100000, 7, 11);
+"""
+
+
+def memory_module(n=50000):
+    """
+    IR escrito a mano (GoxLang no tiene sintaxis de memoria): escribe y
+    relee n enteros alineados, copia el bloque con MEMCPY y lo compara.
+    """
+    main = IRFunction("main", return_type='V')
+    main.add_local("i")
+    main.add_local("s")
+    code = [
+        ("CONSTI", 8 * n), ("GROW",),
+        ("LOOP",),
+        ("LOCAL_GET", "i"), ("CONSTI", n), ("LTI",), ("CBREAK",),
+        ("LOCAL_GET", "i"), ("CONSTI", 4), ("MULI",), ("LOCAL_GET", "i"), ("POKEI",),
+        ("LOCAL_GET", "s"), ("LOCAL_GET", "i"), ("CONSTI", 4), ("MULI",), ("PEEKI",),
+        ("ADDI",), ("LOCAL_SET", "s"),
+        ("LOCAL_GET", "i"), ("CONSTI", 1), ("ADDI",), ("LOCAL_SET", "i"),
+        ("ENDLOOP",),
+        ("CONSTI", 4 * n), ("CONSTI", 0), ("CONSTI", 4 * n), ("MEMCPY",),
+        ("CONSTI", 0), ("CONSTI", 4 * n), ("CONSTI", 4 * n), ("MEMCMP",), ("PRINTI",),
+        ("LOCAL_GET", "s"), ("PRINTI",),
+        ("RET",),
+    ]
+    for instr in code:
+        main.add_instr(*instr)
+    module = IRModule()
+    module.add_function(main)
+    return module
+
+
+def _read(filename):
+    with open(filename, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _with_input(filename, value):
+    """Lee un .gox de ejemplo cambiando el valor de 'var num int'"""
+    source = _read(filename)
+    return re.sub(r"var num int = \d+;", f"var num int = {value};", source)
+
+
+CALL_HEAVY = [("shor(10403)", "shor.gox", 10403), ("factorize(199982)", "factorize.gox", 199982)]
+
+
+def _override_global(module, name, value):
+    """Copia de module con otro valor constante en la inicialización del global"""
+    module = copy.deepcopy(module)
+    entry = next(func for func in module.functions if func.name == "_actual_main")
+    index = entry.instructions.index(("GLOBAL_SET", name))
+    entry.instructions[index - 1] = ("CONSTI", value)
+    return module
+
+
+def workloads():
+    return [
+        *[(name, compile_source(_with_input(filename, value)))
+          for name, filename, value in CALL_HEAVY],
+        ("loop(200000)", compile_source(LOOP_PROGRAM)),
+        ("salida(20000)", compile_source(OUTPUT_PROGRAM)),
+        ("memoria(50000)", memory_module()),
+    ]
+
+
+def loop_workloads():
+    """(nombre, [sin optimizar bucles, LICM + SR, desenrollado x4])"""
+    sources = [*[(name, _with_input(filename, value)) for name, filename, value in CALL_HEAVY],
+               ("loop(200000)", LOOP_PROGRAM), ("invariantes(100000)", INVARIANT_PROGRAM)]
+    result = [(name, [compile_source(source, loops=False), compile_source(source),
+                      compile_source(source, unroll=4)]) for name, source in sources]
+    memory = [memory_module() for _ in range(3)]
+    optimize_loops(memory[1])
+    optimize_loops(memory[2], unroll=4)
+    result.append(("memoria(50000)", memory))
+    return result
+
+
+def compile_source(source, tail_calls=True, optimize=True, inline_limit=INLINE_MAX_SIZE,
+                   loops=True, unroll=0, eval_budget=0):
+    """
+    Compila código GoxLang a un IRModule sin la salida de las fases. Por
+    defecto no evalúa llamadas al compilar (eval_budget=0): los programas
+    de las mediciones se calcularían enteros antes de ejecutar.
+    """
+    ast = Parser(tokenize(source)).parse()
+    with contextlib.redirect_stdout(io.StringIO()):
+        errors = Checker().check(ast)
+    if errors:
+        raise RuntimeError("; ".join(str(e) for e in errors))
+    module = IRCodeGenerator(tail_calls=tail_calls).generate(ast.decls)
+    if optimize:
+        optimize_module(module, inline_limit)
+        if eval_budget:
+            evaluate_calls(module, eval_budget)
+        if loops:
+            optimize_loops(module, unroll)
+    return module
+
+
+class CountingStackMachine(StackMachine):
+    """Stack Machine que cuenta las instrucciones ejecutadas (bucle con handlers)"""
+
+    def __init__(self, superinstructions=True):
+        super().__init__(verify=False, superinstructions=superinstructions)
+        self.executed = 0
+        self.calls = 0
+        self.max_depth = 0
+
+    def _decode(self, func_name, instructions):
+        code = super()._decode(func_name, instructions)
+        ops = [instr[0] for instr in instructions] + ['RET']
+        return [self._counted(h, op in ('CALL', 'TAILCALL')) for h, op in zip(code, ops)]
+
+    def _counted(self, handler, is_call):
+        def counted():
+            self.executed += 1
+            self.calls += is_call
+            if len(self.call_stack) > self.max_depth:
+                self.max_depth = len(self.call_stack)
+            return handler()
+        return counted
+
+
+class _CountedCode(list):
+    """Código de registros que cuenta cada instrucción que se lee"""
+
+    def __init__(self, vm, code):
+        super().__init__(code)
+        self.vm = vm
+
+    def __getitem__(self, index):
+        self.vm.executed += 1
+        return list.__getitem__(self, index)
+
+
+class CountingRegisterMachine(RegisterMachine):
+    """Máquina de registros que cuenta las instrucciones ejecutadas"""
+
+    def __init__(self):
+        super().__init__()
+        self.executed = 0
+
+    def load_module(self, module):
+        super().load_module(module)
+        for function in self.functions.values():
+            function.code = _CountedCode(self, function.code)
+
+
+def count_instructions(module, superinstructions=True):
+    return _counting_run(module, superinstructions).executed
+
+
+def _counting_run(module, superinstructions=True):
+    vm = CountingStackMachine(superinstructions)
+    vm.load_module(module)
+    with contextlib.redirect_stdout(io.StringIO()):
+        vm.run("main")
+    return vm
+
+
+def count_register_instructions(module):
+    vm = CountingRegisterMachine()
+    vm.load_module(module)
+    with contextlib.redirect_stdout(io.StringIO()):
+        vm.run("main")
+    return vm.executed
+
+
+def time_run(module, repeat=3, verify=True, engine=None):
+    """Mejor tiempo de ejecución (sin contar la carga) de varias corridas"""
+    best = None
+    for _ in range(repeat):
+        vm = engine() if engine is not None else StackMachine(verify=verify)
+        vm.load_module(module)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            vm.run("main")
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    repeat = 3
+    if "--repeat" in sys.argv:
+        repeat = int(sys.argv[sys.argv.index("--repeat") + 1])
+
+    print(f"{'programa':<20} {'instrucciones':>14} {'sin fusionar':>14} {'tiempo (s)':>11} "
+          f"{'instr/s':>12} {'sin verificar':>14}")
+    print("-" * 90)
+    for name, module in workloads():
+        count = count_instructions(module)
+        unfused = count_instructions(module, superinstructions=False)
+        elapsed = time_run(module, repeat)
+        checked = time_run(module, repeat, verify=False)
+        print(f"{name:<20} {count:>14,} {unfused:>14,} {elapsed:>11.3f} "
+              f"{count / elapsed:>12,.0f} {checked:>14.3f}")
+
+    print()
+    print(f"{'gcd recursivo':<20} {'frames max':>14} {'tiempo (s)':>11}")
+    print("-" * 47)
+    for label, tail_calls in (("CALL + RET", False), ("TAILCALL", True)):
+        module = compile_source(GCD_PROGRAM, tail_calls=tail_calls)
+        depth = _counting_run(module).max_depth
+        elapsed = time_run(module, repeat)
+        print(f"{label:<20} {depth:>14,} {elapsed:>11.3f}")
+
+    print()
+    print(f"{'inlining':<28} {'llamadas':>12} {'instrucciones':>14} {'tiempo (s)':>11}")
+    print("-" * 68)
+    for name, filename, value in CALL_HEAVY:
+        source = _with_input(filename, value)
+        for label, limit in (("no", 0), ("si", INLINE_MAX_SIZE)):
+            module = compile_source(source, inline_limit=limit)
+            vm = _counting_run(module)
+            elapsed = time_run(module, repeat)
+            print(f"{f'{name} {label}':<28} {vm.calls:>12,} {vm.executed:>14,} {elapsed:>11.3f}")
+
+    print()
+    print(f"{'bucles':<20} {'sin optimizar':>14} {'LICM + SR':>14} {'unroll x4':>14} "
+          f"{'sin opt (s)':>11} {'x4 (s)':>11}")
+    print("-" * 90)
+    for name, variants in loop_workloads():
+        counts = [count_instructions(module) for module in variants]
+        times = [time_run(variants[0], repeat), time_run(variants[2], repeat)]
+        print(f"{name:<20} {counts[0]:>14,} {counts[1]:>14,} {counts[2]:>14,} "
+              f"{times[0]:>11.3f} {times[1]:>11.3f}")
+
+    print()
+    print(f"{'motores':<20} {'instr. pila':>14} {'instr. regs':>14} "
+          f"{'pila (s)':>11} {'registros (s)':>14}")
+    print("-" * 77)
+    for name, module in workloads():
+        stack_count = count_instructions(module)
+        register_count = count_register_instructions(module)
+        stack_time = time_run(module, repeat)
+        register_time = time_run(module, repeat, engine=RegisterMachine)
+        print(f"{name:<20} {stack_count:>14,} {register_count:>14,} "
+              f"{stack_time:>11.3f} {register_time:>14.3f}")
+
+    print()
+    print(f"{'evaluacion':<20} {'sin evaluar':>14} {'evaluando':>14} "
+          f"{'al compilar':>14} {'compilar (s)':>13}")
+    print("-" * 79)
+    examples = [(filename, _read(filename)) for filename in ("shor.gox", "factorize.gox")]
+    examples += [(name, _with_input(filename, value)) for name, filename, value in CALL_HEAVY]
+    for name, source in examples:
+        plain = count_instructions(compile_source(source))
+        start = time.perf_counter()
+        module = compile_source(source, loops=False)
+        stats = evaluate_calls(module, EVAL_BUDGET)
+        optimize_loops(module)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<20} {plain:>14,} {count_instructions(module):>14,} "
+              f"{stats['spent']:>14,} {elapsed:>13.3f}")
+
+    print()
+    print(f"{'intrinsecas':<20} {'instrucciones':>14} {'intrinsecas':>14} "
+          f"{'tiempo (s)':>11} {'intrinsecas (s)':>16}")
+    print("-" * 79)
+    for value in (10403, 1022117):
+        module = compile_source(_with_input("shor.gox", value))
+        intrinsic = compile_source(SHOR_INTRINSICS_PROGRAM.replace("num int = 15", f"num int = {value}"))
+        print(f"{f'shor({value})':<20} {count_instructions(module):>14,} "
+              f"{count_instructions(intrinsic):>14,} {time_run(module, repeat):>11.3f} "
+              f"{time_run(intrinsic, repeat):>16.3f}")
+
+    print()
+    print(f"{'memoizacion':<20} {'sin memo (s)':>13} {'con memo (s)':>13} "
+          f"{'aciertos':>10} {'fallos':>10}")
+    print("-" * 70)
+    memo_examples = [("fib(24)", FIB_PROGRAM), (CALL_HEAVY[0][0], _with_input("shor.gox", 10403))]
+    for name, source in memo_examples:
+        module = compile_source(source)
+        mark_pure_functions(module)
+        vm = StackMachine(memoize=MEMO_SIZE)
+        vm.load_module(module)
+        with contextlib.redirect_stdout(io.StringIO()):
+            vm.run("main")
+        hits = sum(stats[0] for stats in vm.memo_stats().values())
+        misses = sum(stats[1] for stats in vm.memo_stats().values())
+        plain = time_run(module, repeat)
+        memoized = time_run(module, repeat, engine=lambda: StackMachine(memoize=MEMO_SIZE))
+        print(f"{name:<20} {plain:>13.3f} {memoized:>13.3f} {hits:>10,} {misses:>10,}")
+
+    print()
+    print(f"{'lotes':<20} {'entradas':>10} {'por entrada (s)':>16} {'lote (s)':>10} "
+          f"{'entradas/s':>12}")
+    print("-" * 72)
+    module = compile_source(_read("factorize.gox"))
+    for count in (100, 2000):
+        values = list(range(2, count + 2))
+        start = time.perf_counter()
+        for value in values:
+            vm = StackMachine()
+            vm.load_module(_override_global(module, "num", value))
+            with contextlib.redirect_stdout(io.StringIO()):
+                vm.run("main")
+        single = time.perf_counter() - start
+        start = time.perf_counter()
+        run_batch(module, {"num": values})
+        batch = time.perf_counter() - start
+        print(f"{f'factorize x{count}':<20} {count:>10,} {single:>16.3f} {batch:>10.3f} "
+              f"{count / batch:>12,.0f}")
+
+    print()
+    print(f"{'planificador':<20} {'total (s)':>10} {'cortos media':>13} {'cortos max':>11} "
+          f"{'largo (s)':>10} {'cambios':>9}")
+    print("-" * 78)
+    programs = [compile_source(_with_input("shor.gox", 10403))]
+    programs += [_override_global(module, "num", value) for value in range(2, 202)]
+    latencies = []
+    start = time.perf_counter()
+    for program in programs:
+        vm = StackMachine()
+        vm.load_module(program)
+        with contextlib.redirect_stdout(io.StringIO()):
+            vm.run("main")
+        latencies.append(time.perf_counter() - start)
+    short = latencies[1:]
+    print(f"{'secuencial':<20} {latencies[-1]:>10.3f} {sum(short) / len(short):>13.3f} "
+          f"{max(short):>11.3f} {latencies[0]:>10.3f} {0:>9,}")
+    for slice_size in (100, 1000, 10000):
+        scheduler = Scheduler(slice_size)
+        jobs = [scheduler.submit(program) for program in programs]
+        start = time.perf_counter()
+        scheduler.run_all()
+        total = time.perf_counter() - start
+        short = [job.latency for job in jobs[1:]]
+        print(f"{f'porciones de {slice_size}':<20} {total:>10.3f} {sum(short) / len(short):>13.3f} "
+              f"{max(short):>11.3f} {jobs[0].latency:>10.3f} {scheduler.stats()['switches']:>9,}")
+
+
+if __name__ == "__main__":
+    main()
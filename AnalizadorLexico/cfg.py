@@ -0,0 +1,919 @@
+# cfg.py - Grafo de control de flujo y forma SSA del IR
+'''
+CFG y SSA
+=========
+Representación intermedia para pasadas de optimización sobre una
+IRFunction con marcadores estructurados:
+
+  - Bloques básicos: se corta en cada marcador (IF, ELSE, ENDIF, LOOP,
+    CBREAK, ENDLOOP, CONTINUE) y después de RET / TAILCALL. Las aristas
+    son las mismas que produciría lowering.py.
+  - Dominadores (Cooper, Harvey y Kennedy), árbol de dominadores y
+    fronteras de dominancia, solo sobre los bloques alcanzables.
+  - SSA: cada valor de la pila pasa a ser un SSAInstr con un número
+    único; LOCAL_GET / LOCAL_SET desaparecen y los locales se unen con
+    PHI en las fronteras de dominancia (Cytron et al., semi-podada). Los
+    parámetros son PARAM y los demás locales empiezan en CONSTI 0.
+  - loops(): los bucles LOOP / ENDLOOP (preheader, cabecera y bloques),
+    de adentro hacia afuera. insert(), add_phi(), replace_uses() y
+    remove_dead() son la base de las pasadas de loopopt.py.
+  - Lowering de vuelta a una IRFunction: se conserva la secuencia de
+    marcadores y se regenera el código de cada bloque. Un valor usado
+    una sola vez en su bloque se emite como árbol en el lugar del uso
+    (o queda en la pila si no se puede mover); el resto se guarda en un
+    local 'ssa$N'. Los PHI comparten local con sus entradas cuando no
+    interfieren, y las demás copias van al final de cada predecesor.
+  - to_dot(): el grafo en formato DOT, con el código SSA de cada bloque.
+
+El código generado por IRCodeGenerator no deja valores en la pila entre
+sentencias, así que se exige pila vacía en los bordes de los bloques
+(salvo la condición que consume IF / CBREAK); si no, SSAError.
+'''
+from collections import namedtuple
+
+from intrinsics import INTRINSICS
+from ircode import IRFunction
+from peephole import FUSIONS
+from verifier import STACK_EFFECTS
+
+
+class SSAError(RuntimeError):
+    '''La función no se puede llevar a SSA.'''
+    pass
+
+
+MARKERS = ('IF', 'ELSE', 'ENDIF', 'LOOP', 'CBREAK', 'ENDLOOP', 'CONTINUE')
+
+# Marcadores que consumen una condición del bloque que cierran
+BRANCHES = ('IF', 'CBREAK')
+
+_TERMINATORS = ('RET', 'TAILCALL')
+
+_CONSTANTS = ('CONSTI', 'CONSTF')
+
+# Sin efectos, sin leer estado y sin poder fallar: da lo mismo en qué
+# punto se evalúan
+FLOATING_OPS = frozenset({
+    'ADDI', 'SUBI', 'MULI', 'ADDF', 'SUBF', 'MULF',
+    'EQI', 'NEI', 'LTI', 'LEI', 'GTI', 'GEI', 'EQF', 'NEF',
+    'ANDI', 'ORI', 'ITOF',
+})
+
+# Efectos de pila de las instrucciones comunes: sin saltos ya resueltos
+# ni superinstrucciones, que no aparecen en una IRFunction
+_EFFECTS = {op: effect for op, effect in STACK_EFFECTS.items()
+            if op not in ('JUMP', 'JUMPZ') and op not in {f.name for f in FUSIONS}}
+
+
+# Un bucle LOOP / ENDLOOP: el bloque que termina en LOOP, el primero del
+# bucle y los ids de todos sus bloques alcanzables
+Loop = namedtuple('Loop', 'preheader header blocks')
+
+
+class SSAInstr:
+    """dest = op args (operands); PHI guarda sus argumentos en 'incoming'"""
+    __slots__ = ('op', 'dest', 'args', 'operands', 'incoming', 'var')
+
+    def __init__(self, op, dest=None, args=(), operands=()):
+        self.op = op
+        self.dest = dest
+        self.args = list(args)
+        self.operands = tuple(operands)
+        self.incoming = {}   # PHI: id del bloque predecesor -> valor
+        self.var = None      # PHI: local del que viene
+
+    def __repr__(self):
+        parts = [self.op, *(str(o) for o in self.operands), *(f"%{a}" for a in self.args)]
+        if self.op == 'PHI':
+            parts += [f"[B{block}: %{value}]" for block, value in sorted(self.incoming.items())]
+        text = " ".join(parts)
+        return f"%{self.dest} = {text}" if self.dest is not None else text
+
+
+class BasicBlock:
+    def __init__(self, index):
+        self.id = index
+        self.code = []        # Instrucciones originales (sin marcadores)
+        self.succs = []
+        self.preds = []
+        self.phis = []
+        self.instrs = []      # Código SSA, sin los PHI
+        self.branch = None    # Valor de la condición que consume IF / CBREAK
+
+    def __repr__(self):
+        return f"B{self.id}"
+
+
+class ControlFlowGraph:
+    """
+    CFG de una IRFunction. 'separators[i]' es lo que sigue al bloque i:
+    un marcador, 'RET' si el bloque termina en RET / TAILCALL, o None
+    para el último bloque.
+    """
+
+    def __init__(self, func, arities):
+        self.func = func
+        self.arities = arities    # nombre -> (param_count, returns) de las funciones llamables
+        self.blocks = [BasicBlock(0)]
+        self.separators = []
+        self.idom = {}
+        self.dom_children = {}
+        self.frontiers = {}
+        self.defs = {}            # id de valor -> SSAInstr que lo define
+        self.ssa = False
+        self._split()
+        self._connect()
+        self.reachable = self._reverse_postorder()
+        reached = set(self.reachable)
+        for block in self.blocks:
+            if block.id not in reached:
+                for succ in block.succs:
+                    succ.preds.remove(block)
+                block.succs = []
+        self._dominators()
+
+    # ---------- bloques y aristas ----------
+    def _new_block(self, separator):
+        self.separators.append(separator)
+        block = BasicBlock(len(self.blocks))
+        self.blocks.append(block)
+        return block
+
+    def _split(self):
+        block = self.blocks[0]
+        for instr in self.func.instructions:
+            instr = tuple(instr)
+            if instr[0] in MARKERS:
+                block = self._new_block(instr)
+            else:
+                block.code.append(instr)
+                if instr[0] in _TERMINATORS:
+                    block = self._new_block(('RET',))
+        self.separators.append(None)
+
+    @staticmethod
+    def _edge(a, b):
+        if b not in a.succs:
+            a.succs.append(b)
+            b.preds.append(a)
+
+    def _connect(self):
+        control = []   # [tipo, bloque, dato]
+        for index, separator in enumerate(self.separators):
+            if separator is None or separator[0] == 'RET':
+                continue
+            block = self.blocks[index]
+            op = separator[0]
+            after = self.blocks[index + 1]
+            if op == 'IF':
+                self._edge(block, after)
+                control.append(['IF', block, None])
+            elif op == 'ELSE':
+                entry = self._innermost(control, 'IF', op)
+                self._edge(entry[1], after)
+                entry[2] = block          # fin de la rama then
+            elif op == 'ENDIF':
+                entry = self._innermost(control, 'IF', op)
+                if control.pop() is not entry:
+                    raise SSAError("ENDIF sin IF correspondiente")
+                self._edge(entry[2] if entry[2] is not None else entry[1], after)
+                self._edge(block, after)
+            elif op == 'LOOP':
+                self._edge(block, after)
+                control.append(['LOOP', after, []])
+            elif op == 'CBREAK':
+                self._edge(block, after)
+                self._innermost(control, 'LOOP', op)[2].append(block)
+            elif op == 'CONTINUE':
+                self._edge(block, self._innermost(control, 'LOOP', op)[1])
+            elif op == 'ENDLOOP':
+                entry = self._innermost(control, 'LOOP', op)
+                if control.pop() is not entry:
+                    raise SSAError("ENDLOOP sin LOOP correspondiente")
+                self._edge(block, entry[1])
+                for exit_from in entry[2]:
+                    self._edge(exit_from, after)
+        if control:
+            raise SSAError(f"{control[-1][0]} sin cierre correspondiente")
+
+    @staticmethod
+    def _innermost(control, kind, op):
+        for entry in reversed(control):
+            if entry[0] == kind:
+                return entry
+        raise SSAError(f"{op} sin {kind} correspondiente")
+
+    def _reverse_postorder(self):
+        order, seen = [], {0}
+        work = [(self.blocks[0], iter(self.blocks[0].succs))]
+        while work:
+            block, succs = work[-1]
+            for succ in succs:
+                if succ.id not in seen:
+                    seen.add(succ.id)
+                    work.append((succ, iter(succ.succs)))
+                    break
+            else:
+                work.pop()
+                order.append(block.id)
+        return order[::-1]
+
+    # ---------- dominadores ----------
+    def _dominators(self):
+        position = {block: index for index, block in enumerate(self.reachable)}
+        idom = {0: 0}
+
+        def intersect(a, b):
+            while a != b:
+                while position[a] > position[b]:
+                    a = idom[a]
+                while position[b] > position[a]:
+                    b = idom[b]
+            return a
+
+        changed = True
+        while changed:
+            changed = False
+            for index in self.reachable[1:]:
+                preds = [p.id for p in self.blocks[index].preds if p.id in idom]
+                new = preds[0]
+                for pred in preds[1:]:
+                    new = intersect(pred, new)
+                if idom.get(index) != new:
+                    idom[index] = new
+                    changed = True
+
+        self.idom = idom
+        self.dom_children = {index: [] for index in self.reachable}
+        for index in self.reachable[1:]:
+            self.dom_children[idom[index]].append(index)
+
+        self.frontiers = {index: set() for index in self.reachable}
+        for index in self.reachable:
+            preds = self.blocks[index].preds
+            if len(preds) < 2:
+                continue
+            for pred in preds:
+                runner = pred.id
+                while runner != idom[index]:
+                    self.frontiers[runner].add(index)
+                    runner = idom[runner]
+
+    def dominates(self, a, b):
+        """True si el bloque a domina al bloque b (ids)"""
+        while b != a:
+            if b == 0:
+                return False
+            b = self.idom[b]
+        return True
+
+    def loops(self):
+        """Los bucles alcanzables, los más internos primero"""
+        reached = set(self.reachable)
+        found, open_loops = [], []
+        for index, separator in enumerate(self.separators):
+            if separator is None or separator[0] not in ('LOOP', 'ENDLOOP'):
+                continue
+            if separator[0] == 'LOOP':
+                open_loops.append(index)
+                continue
+            start = open_loops.pop()
+            if start + 1 in reached:
+                blocks = frozenset(b for b in range(start + 1, index + 1) if b in reached)
+                found.append(Loop(start, start + 1, blocks))
+        return found
+
+    # ---------- construcción de SSA ----------
+    def _value(self, block_list, op, args=(), operands=()):
+        instr = SSAInstr(op, len(self.defs), args, operands)
+        self.defs[instr.dest] = instr
+        block_list.append(instr)
+        return instr.dest
+
+    def build_ssa(self):
+        func = self.func
+        entry = self.blocks[0]
+        initial = {}
+        for index, name in enumerate(func.params):
+            initial[name] = self._value(entry.instrs, 'PARAM', operands=(name, index))
+        zero = None
+        for name in func.locals:
+            if name not in initial:
+                if zero is None:
+                    zero = self._value(entry.instrs, 'CONSTI', operands=(0,))
+                initial[name] = zero
+
+        self._place_phis(initial)
+
+        work = [(0, initial)]
+        while work:
+            index, env = work.pop()
+            block = self.blocks[index]
+            env = dict(env)
+            for phi in block.phis:
+                env[phi.var] = phi.dest
+            self._convert(block, env)
+            for succ in block.succs:
+                for phi in succ.phis:
+                    phi.incoming[block.id] = env[phi.var]
+            for child in self.dom_children[index]:
+                work.append((child, env))
+
+        self._simplify_phis()
+        self.ssa = True
+        return self
+
+    def _place_phis(self, initial):
+        # Semi-podada: solo locales leídos en un bloque antes de asignarlos en él
+        live_in, defined_in = set(), {name: {0} for name in initial}
+        for index in self.reachable:
+            assigned = set()
+            for instr in self.blocks[index].code:
+                if instr[0] == 'LOCAL_GET' and instr[1] not in assigned:
+                    live_in.add(instr[1])
+                elif instr[0] == 'LOCAL_SET':
+                    assigned.add(instr[1])
+                    defined_in.setdefault(instr[1], {0}).add(index)
+
+        for name in sorted(live_in):
+            if name not in initial:
+                raise SSAError(f"Local '{name}' no declarado en '{self.func.name}'")
+            placed = set()
+            pending = list(defined_in[name])
+            while pending:
+                for frontier in self.frontiers[pending.pop()]:
+                    if frontier not in placed:
+                        placed.add(frontier)
+                        phi = SSAInstr('PHI', len(self.defs))
+                        phi.var = name
+                        self.defs[phi.dest] = phi
+                        self.blocks[frontier].phis.append(phi)
+                        pending.append(frontier)
+
+    def _convert(self, block, env):
+        """Simula la pila del bloque y emite su código SSA"""
+        stack = []
+        out = block.instrs
+        for instr in block.code:
+            op = instr[0]
+            if op == 'LOCAL_GET':
+                if instr[1] not in env:
+                    raise SSAError(f"Local '{instr[1]}' no declarado en '{self.func.name}'")
+                stack.append(env[instr[1]])
+                continue
+            if op == 'LOCAL_SET':
+                env[instr[1]] = self._pop(stack, 1, block)[0]
+                continue
+            if op == 'DROP':
+                self._pop(stack, 1, block)
+                continue
+            if op == 'PUSHI':
+                op = 'CONSTI'
+            if op in ('CALL', 'TAILCALL'):
+                if instr[1] not in self.arities:
+                    raise SSAError(f"Función '{instr[1]}' no encontrada")
+                pops, pushes = self.arities[instr[1]]
+                if op == 'TAILCALL':
+                    pushes = 0
+            elif op == 'INTRINSIC':
+                if instr[1] not in INTRINSICS:
+                    raise SSAError(f"Intrínseca '{instr[1]}' no encontrada")
+                pops, pushes = INTRINSICS[instr[1]].arity, 1
+            elif op == 'RET':
+                pops, pushes = (1 if self.func.return_type != 'V' else 0), 0
+            elif op in _EFFECTS:
+                pops, pushes = _EFFECTS[op]
+            else:
+                raise SSAError(f"Instrucción no soportada en SSA: {op}")
+            args = self._pop(stack, pops, block)
+            if pushes:
+                stack.append(self._value(out, op, args, instr[1:]))
+            else:
+                out.append(SSAInstr(op, None, args, instr[1:]))
+
+        separator = self.separators[block.id]
+        if separator is not None and separator[0] in BRANCHES:
+            block.branch = self._pop(stack, 1, block)[0]
+        if stack:
+            raise SSAError(f"{self.func.name}: B{block.id} termina con {len(stack)} "
+                           f"valores en la pila")
+
+    def _pop(self, stack, count, block):
+        if len(stack) < count:
+            raise SSAError(f"{self.func.name}: pila vacía en B{block.id}")
+        if not count:
+            return []
+        args = stack[-count:]
+        del stack[-count:]
+        return args
+
+    def _simplify_phis(self):
+        """Quita PHI triviales (un solo valor distinto de sí mismos) y sin usos"""
+        changed = True
+        while changed:
+            changed = False
+            for block in self.blocks:
+                for phi in list(block.phis):
+                    values = set(phi.incoming.values()) - {phi.dest}
+                    if len(values) == 1:
+                        block.phis.remove(phi)
+                        self.replace_uses(phi.dest, values.pop())
+                        changed = True
+            used = self._used_values()
+            for block in self.blocks:
+                for phi in list(block.phis):
+                    if phi.dest not in used:
+                        block.phis.remove(phi)
+                        changed = True
+
+    def _used_values(self):
+        used = set()
+        for block in self.blocks:
+            for instr in block.instrs:
+                used.update(instr.args)
+            for phi in block.phis:
+                used.update(value for value in phi.incoming.values() if value != phi.dest)
+            if block.branch is not None:
+                used.add(block.branch)
+        return used
+
+    def insert(self, block, position, op, args=(), operands=()):
+        """Crea un valor nuevo con 'op' en block.instrs[position]; devuelve su id"""
+        instr = SSAInstr(op, len(self.defs), args, operands)
+        self.defs[instr.dest] = instr
+        block.instrs.insert(position, instr)
+        return instr.dest
+
+    def add_phi(self, block, var=None):
+        phi = SSAInstr('PHI', len(self.defs))
+        phi.var = var
+        self.defs[phi.dest] = phi
+        block.phis.append(phi)
+        return phi
+
+    def remove_dead(self):
+        """Quita las instrucciones FLOATING_OPS y GLOBAL_GET cuyo valor nadie usa"""
+        removed = 0
+        while True:
+            used = self._used_values()
+            dead = [(block, instr) for block in self.blocks for instr in block.instrs
+                    if instr.dest is not None and instr.dest not in used
+                    and (instr.op in FLOATING_OPS or instr.op == 'GLOBAL_GET')]
+            if not dead:
+                return removed
+            for block, instr in dead:
+                block.instrs.remove(instr)
+            removed += len(dead)
+
+    def replace_uses(self, old, new):
+        """Reemplaza todos los usos del valor old por new"""
+        for block in self.blocks:
+            for instr in block.instrs:
+                instr.args = [new if arg == old else arg for arg in instr.args]
+            for phi in block.phis:
+                for pred, value in phi.incoming.items():
+                    if value == old:
+                        phi.incoming[pred] = new
+            if block.branch == old:
+                block.branch = new
+
+    # ---------- lowering ----------
+    def to_function(self):
+        """IRFunction equivalente, regenerada desde el código SSA"""
+        if not self.ssa:
+            raise SSAError("to_function() requiere build_ssa()")
+        func = self.func
+        result = IRFunction(func.name, list(func.params), list(func.param_types),
+                            func.return_type)
+        result.locals = dict(func.locals)
+        _Lowering(self, result).run()
+        return result
+
+    # ---------- DOT ----------
+    def to_dot(self, name=None):
+        """El CFG como digraph DOT; con SSA muestra el código SSA de cada bloque"""
+        name = name or self.func.name
+        lines = [f'digraph "{name}" {{', '  node [shape=box, fontname="monospace"];']
+        reached = set(self.reachable)
+        for block in self.blocks:
+            if self.ssa:
+                body = [repr(phi) for phi in block.phis] + [repr(i) for i in block.instrs]
+                if block.branch is not None:
+                    body.append(f"{self.separators[block.id][0]} %{block.branch}")
+            else:
+                body = [" ".join(str(part) for part in instr) for instr in block.code]
+            label = "\\l".join([f"B{block.id}"] + [_dot_escape(line) for line in body]) + "\\l"
+            style = "" if block.id in reached else ", style=dashed"
+            lines.append(f'  "{name}.B{block.id}" [label="{label}"{style}];')
+        for block in self.blocks:
+            for succ in block.succs:
+                lines.append(f'  "{name}.B{block.id}" -> "{name}.B{succ.id}";')
+            if block.id in self.idom and block.id != 0:
+                lines.append(f'  "{name}.B{self.idom[block.id]}" -> "{name}.B{block.id}" '
+                             f'[style=dotted, color=gray, constraint=false];')
+        lines.append("}")
+        return "\n".join(lines)
+
+
+def _dot_escape(text):
+    return text.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class _Lowering:
+    """
+    Regenera código de pila desde el SSA de un ControlFlowGraph.
+
+    Un valor usado una sola vez en su propio bloque no necesita local: se
+    emite dentro de la expresión que lo usa ('inlined'), en orden postfijo
+    como lo habría generado IRCodeGenerator. Si eso cambia el orden de
+    las instrucciones que no son FLOATING_OPS (llamadas, lecturas de
+    globales o memoria, divisiones) se emite en su lugar y queda en la
+    pila ('on_stack'), o en un local si el orden no coincide. Los PHI se
+    unen con sus entradas y con los parámetros en un mismo local cuando
+    sus vidas no se cruzan, para que las copias desaparezcan.
+    """
+
+    def __init__(self, cfg, result):
+        self.cfg = cfg
+        self.result = result
+        self.code = []
+        self.pending = []        # valores que quedaron en la pila, en orden
+        self.stored = set()      # valores ya escritos en su local
+        self.inlined = set()     # valores que se emiten dentro de quien los usa
+        self.on_stack = set()    # valores que se consumen desde la pila
+        self.at = {}             # inlined -> posición de la raíz que los emite
+        self.home = {}           # valor -> local que comparte con otros
+        self._plan()
+        self._coalesce()
+
+    # ---------- plan ----------
+    def _plan(self):
+        cfg = self.cfg
+        uses = {}
+        for block in cfg.blocks:
+            end = len(block.instrs)
+            for position, instr in enumerate(block.instrs):
+                for arg in instr.args:
+                    uses.setdefault(arg, []).append((block.id, position))
+            if block.branch is not None:
+                uses.setdefault(block.branch, []).append((block.id, end))
+            # Las copias a los PHI de los sucesores van después de la condición
+            for succ in block.succs:
+                for phi in succ.phis:
+                    uses.setdefault(phi.incoming[block.id], []).append((block.id, end + 1))
+        self.uses = uses
+
+        for block in cfg.blocks:
+            # Los PHI siempre viven en su local; las copias los escriben
+            self.stored.update(phi.dest for phi in block.phis)
+            end = len(block.instrs)
+            single = set()
+            for instr in block.instrs:
+                value = instr.dest
+                if value is None or instr.op in ('PARAM', *_CONSTANTS):
+                    continue
+                where = uses.get(value, [])
+                if len(where) != 1 or where[0][0] != block.id:
+                    continue
+                if where[0][1] > end and block.branch is not None:
+                    continue
+                single.add(value)
+            self.on_stack |= single
+            inlined = set(single)
+            while True:
+                late = self._out_of_order(block, inlined)
+                if late is None:
+                    break
+                inlined.discard(late)
+            self.inlined |= inlined
+            for position, args in self._roots(block, inlined):
+                for value in self._tree(args, inlined):
+                    self.at[value] = position
+        self.on_stack -= self.inlined
+
+    def _roots(self, block, inlined):
+        """(posición, argumentos) de cada raíz del bloque, en orden de emisión"""
+        end = len(block.instrs)
+        roots = [(position, instr.args) for position, instr in enumerate(block.instrs)
+                 if instr.dest not in inlined and instr.op not in ('PARAM', *_CONSTANTS)]
+        if block.branch is not None:
+            roots.append((end, [block.branch]))
+        roots.append((end + 1, [phi.incoming[block.id]
+                                for succ in block.succs for phi in succ.phis]))
+        return roots
+
+    def _tree(self, values, inlined):
+        """Valores inlined que se emiten al preparar 'values', en orden postfijo"""
+        out = []
+        for value in values:
+            if value in inlined:
+                out.extend(self._tree(self.cfg.defs[value].args, inlined))
+                out.append(value)
+        return out
+
+    def _out_of_order(self, block, inlined):
+        """Un valor inlined que se emitiría después de una instrucción con efectos posterior"""
+        position = {instr.dest: index for index, instr in enumerate(block.instrs)
+                    if instr.dest is not None}
+        last = -1
+        for root, args in self._roots(block, inlined):
+            for value in self._tree(args, inlined):
+                if self.cfg.defs[value].op not in FLOATING_OPS:
+                    if position[value] < last:
+                        return value
+                    last = position[value]
+            if root < len(block.instrs) and block.instrs[root].op not in FLOATING_OPS:
+                last = root
+        return None
+
+    def _homed(self, value):
+        instr = self.cfg.defs[value]
+        return (instr.op not in _CONSTANTS and value not in self.inlined
+                and value not in self.on_stack)
+
+    # ---------- unión de locales ----------
+    def _coalesce(self):
+        cfg = self.cfg
+        phis = [phi for block in cfg.blocks for phi in block.phis]
+        params = {instr.dest: instr.operands[0] for instr in cfg.blocks[0].instrs
+                  if instr.op == 'PARAM'}
+        self.home.update(params)
+        if not phis:
+            return
+
+        members = set(params)
+        for phi in phis:
+            members.add(phi.dest)
+            members.update(value for value in phi.incoming.values() if self._homed(value))
+        edges = self._interference(members)
+        for a in params:
+            edges[a].update(b for b in params if b != a)
+
+        groups = {value: {value} for value in members}
+        for phi in phis:
+            for value in phi.incoming.values():
+                a, b = groups[phi.dest], groups.get(value)
+                if b is None or a is b or any(edges[x] & b for x in a):
+                    continue
+                if a & params.keys() and b & params.keys():
+                    continue
+                a |= b
+                for x in b:
+                    groups[x] = a
+
+        for group in {id(g): g for g in groups.values()}.values():
+            if len(group) < 2:
+                continue
+            owner = group & params.keys()
+            name = params[owner.pop()] if owner else f"ssa${min(group)}"
+            for value in group:
+                self.home[value] = name
+
+    def _liveness(self, members):
+        """Valores de 'members' vivos a la entrada y a la salida de cada bloque"""
+        cfg = self.cfg
+        gen, kill = {}, {}
+        for index in cfg.reachable:
+            block = cfg.blocks[index]
+            defined = {phi.dest for phi in block.phis}
+            used = set()
+            for instr in block.instrs:
+                used.update(arg for arg in instr.args if arg in members and arg not in defined)
+                if instr.dest is not None:
+                    defined.add(instr.dest)
+            if block.branch in members and block.branch not in defined:
+                used.add(block.branch)
+            gen[index], kill[index] = used, defined
+
+        live_in = {index: set() for index in cfg.reachable}
+        live_out = {index: set() for index in cfg.reachable}
+        changed = True
+        while changed:
+            changed = False
+            for index in reversed(cfg.reachable):
+                block = cfg.blocks[index]
+                out = set()
+                for succ in block.succs:
+                    out |= live_in[succ.id]
+                    out.update(value for phi in succ.phis
+                               if (value := phi.incoming[index]) in members)
+                new_in = gen[index] | (out - kill[index])
+                if new_in != live_in[index] or out != live_out[index]:
+                    live_in[index], live_out[index] = new_in, out
+                    changed = True
+        return live_in, live_out
+
+    def _interference(self, members):
+        cfg = self.cfg
+        live_in, live_out = self._liveness(members)
+        edges = {value: set() for value in members}
+
+        def interfere(value, live):
+            for other in live:
+                if other != value:
+                    edges[value].add(other)
+                    edges[other].add(value)
+
+        for index in cfg.reachable:
+            block = cfg.blocks[index]
+            end = len(block.instrs)
+            # Las copias al final escriben los PHI de los sucesores
+            after = set().union(*(live_in[succ.id] for succ in block.succs))
+            # (la entrada de cada PHI tiene su mismo valor: no cuenta)
+            for succ in block.succs:
+                dests = {phi.dest for phi in succ.phis}
+                for phi in succ.phis:
+                    interfere(phi.dest, (after - {phi.incoming[index]}) | dests)
+
+            used_at = {}
+            for position, instr in enumerate(block.instrs):
+                where = self.at.get(instr.dest, position)
+                used_at.setdefault(where, []).extend(a for a in instr.args if a in members)
+            if block.branch in members:
+                used_at.setdefault(end, []).append(block.branch)
+
+            live = live_out[index] | set(used_at.get(end + 1, ()))
+            for position in range(end, -1, -1):
+                if position < end:
+                    value = block.instrs[position].dest
+                    if value in members:
+                        interfere(value, live)
+                        live.discard(value)
+                live.update(used_at.get(position, ()))
+            dests = {phi.dest for phi in block.phis}
+            for dest in dests:
+                interfere(dest, dests)
+        return edges
+
+    # ---------- emisión ----------
+    def local(self, value):
+        name = self.home.get(value, f"ssa${value}")
+        self.result.add_local(name)
+        return name
+
+    def load(self, value):
+        instr = self.cfg.defs[value]
+        if instr.op in _CONSTANTS:
+            self.code.append((instr.op, *instr.operands))
+        else:
+            if instr.op != 'PARAM' and value not in self.stored:
+                raise SSAError(f"%{value} se usa antes de guardarse")
+            self.code.append(('LOCAL_GET', self.local(value)))
+
+    def loadable(self, value):
+        return value in self.stored or self.cfg.defs[value].op in ('PARAM', *_CONSTANTS)
+
+    def flush(self):
+        while self.pending:
+            value = self.pending.pop()
+            self.code.append(('LOCAL_SET', self.local(value)))
+            self.stored.add(value)
+
+    def tokens(self, values):
+        """Orden postfijo de 'values': valores a cargar y operaciones diferidas"""
+        out = []
+        for value in values:
+            if value in self.inlined:
+                instr = self.cfg.defs[value]
+                out.extend(self.tokens(instr.args))
+                out.append(instr)
+            else:
+                out.append(value)
+        return out
+
+    def reads(self, value):
+        """Locales que lee el código que calcula 'value'"""
+        return {self.local(token) for token in self.tokens([value])
+                if not isinstance(token, SSAInstr)
+                and self.cfg.defs[token].op not in _CONSTANTS}
+
+    def prepare(self, args):
+        """Deja args en el tope de la pila, reusando lo que ya quedó ahí"""
+        tokens = self.tokens(args)
+        pending = self.pending
+        leading = 0
+        while leading < len(tokens) and not isinstance(tokens[leading], SSAInstr):
+            leading += 1
+        for k in range(min(leading, len(pending)), -1, -1):
+            if (pending[len(pending) - k:] == tokens[:k]
+                    and all(self.loadable(t) for t in tokens[k:] if not isinstance(t, SSAInstr))):
+                break
+        else:
+            self.flush()
+            k = 0
+        for token in tokens[k:]:
+            if isinstance(token, SSAInstr):
+                self.code.append((token.op, *token.operands))
+            else:
+                self.load(token)
+        if k:
+            del pending[-k:]
+
+    def order(self, copies):
+        """
+        Ordena las copias para que las que pisan un local que otra todavía
+        lee vayan después (i = i + 1 al final del cuerpo). Solo adelanta
+        copias que no pueden fallar ni tienen efectos, o que saltan por
+        encima de copias así.
+        """
+        pure = {value: all(token.op in FLOATING_OPS for token in self.tokens([value])
+                           if isinstance(token, SSAInstr))
+                for _, value in copies}
+        remaining = list(copies)
+        ordered = []
+        while remaining:
+            for index, (dest, value) in enumerate(remaining):
+                others = remaining[:index] + remaining[index + 1:]
+                if (not any(self.local(dest) in self.reads(other) for _, other in others)
+                        and (pure[value] or all(pure[v] for _, v in remaining[:index]))):
+                    break
+            else:
+                index = 0
+            ordered.append(remaining.pop(index))
+        return ordered
+
+    def define(self, value):
+        if value is None:
+            return
+        if value in self.on_stack:
+            self.pending.append(value)
+        elif value in self.uses:
+            self.code.append(('LOCAL_SET', self.local(value)))
+            self.stored.add(value)
+        else:
+            self.code.append(('DROP',))
+
+    def run(self):
+        cfg = self.cfg
+        reached = set(cfg.reachable)
+        for block in cfg.blocks:
+            if block.id in reached:
+                self.emit_block(block)
+            else:
+                # Código inalcanzable: se conserva tal cual
+                self.code.extend(block.code)
+            separator = cfg.separators[block.id]
+            if separator is not None and separator[0] != 'RET':
+                self.code.append(separator)
+        self.result.instructions = self.code
+
+    def emit_block(self, block):
+        for instr in block.instrs:
+            if instr.op in ('PARAM', *_CONSTANTS) or instr.dest in self.inlined:
+                continue
+            self.prepare(instr.args)
+            self.code.append((instr.op, *instr.operands))
+            self.define(instr.dest)
+
+        # Copias a los PHI de los sucesores, en paralelo a través de la pila
+        copies = []
+        for succ in block.succs:
+            for phi in succ.phis:
+                value = phi.incoming[block.id]
+                if self.home.get(value, value) != self.home.get(phi.dest, phi.dest):
+                    copies.append((phi.dest, value))
+        if block.branch is not None:
+            self.prepare([block.branch])
+        if self.pending:
+            # Con valores pendientes en la pila no se pueden intercalar
+            # copias retrasadas: se preparan todas juntas
+            self.prepare([value for _, value in copies])
+            delayed = [dest for dest, _ in copies]
+        else:
+            # Cada copia se guarda apenas se calcula, salvo que una copia
+            # posterior todavía lea ese local: esas esperan en la pila
+            copies = self.order(copies)
+            delayed = []
+            for index, (dest, value) in enumerate(copies):
+                self.prepare([value])
+                if any(self.local(dest) in self.reads(later) for _, later in copies[index + 1:]):
+                    delayed.append(dest)
+                else:
+                    self.code.append(('LOCAL_SET', self.local(dest)))
+                    self.stored.add(dest)
+        if self.pending:
+            raise SSAError(f"B{block.id}: quedan valores sin consumir")
+        for dest in reversed(delayed):
+            self.code.append(('LOCAL_SET', self.local(dest)))
+            self.stored.add(dest)
+
+
+def function_arities(module):
+    """nombre -> (param_count, returns) de las funciones de un IRModule"""
+    return {func.name: (len(func.params), 0 if func.return_type == 'V' else 1)
+            for func in module.functions}
+
+
+def build_ssa(func, arities):
+    """CFG de func con el código ya en SSA"""
+    return ControlFlowGraph(func, arities).build_ssa()
+
+
+def module_to_dot(module, ssa=True):
+    """Un digraph por función, concatenados (dot acepta varios grafos por archivo)"""
+    arities = function_arities(module)
+    graphs = []
+    for func in module.functions:
+        cfg = ControlFlowGraph(func, arities)
+        graphs.append((cfg.build_ssa() if ssa else cfg).to_dot())
+    return "\n".join(graphs) + "\n"
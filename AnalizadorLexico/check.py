@@ -14,7 +14,7 @@ from model import (
 )
 
 from symtab import Symtab
-from typesys import check_binop, check_unaryop
+from typesys import check_binop, check_builtin, check_unaryop
 
 # ────────────────────────────────────────────────
 #  Estructura de error semántico enriquecido
@@ -240,6 +240,8 @@ class Checker:
 
     def visit_FunctionCall(self, node: FunctionCall, env):
         func = env.get(node.name)
+        if not func and check_builtin(node.name):
+            return self._check_builtin_call(node, env)
         if not func:
             self._err(node, "UndeclaredFunc",
                       f"Funcion '{node.name}' no declarada")
@@ -263,4 +265,25 @@ class Checker:
                           f"se esperaba {expected_t}, se recibio {actual_t}")
 
         node.type = normalize_type(getattr(func, 'return_type', 'void'))
-        return node.type
\ No newline at end of file
+        return node.type
+
+    def _check_builtin_call(self, node: FunctionCall, env):
+        """Llamada a una intrínseca (typesys.builtin_funcs)"""
+        param_types, return_type = check_builtin(node.name)
+        actual_args = node.arguments or []
+
+        if len(param_types) != len(actual_args):
+            self._err(node, "ArgMismatch",
+                      f"La funcion '{node.name}' esperaba "
+                      f"{len(param_types)} argumentos, "
+                      f"se pasaron {len(actual_args)}")
+
+        for expected_t, actual in zip(param_types, actual_args):
+            actual_t = normalize_type(self.visit(actual, env))
+            if actual_t != expected_t:
+                self._err(node, "TypeError",
+                          f"Tipo de argumento invalido para '{node.name}': "
+                          f"se esperaba {expected_t}, se recibio {actual_t}")
+
+        node.type = return_type
+        return node.type
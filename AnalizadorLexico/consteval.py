@@ -0,0 +1,244 @@
+# consteval.py - Evaluación de llamadas en tiempo de compilación
+'''
+Evaluación al compilar
+======================
+Los programas de ejemplo (shor.gox, factorize.gox) no leen ninguna
+entrada: 'var num int = 15; shor(num);' hace siempre el mismo trabajo.
+Este módulo ejecuta ese trabajo al compilar:
+
+  - function_purity(): clasifica cada función del IRModule como
+      PURE    sin globales, memoria ni salida; solo llama a funciones puras,
+      OUTPUT  como PURE, pero imprime (o llama a funciones que imprimen),
+      IMPURE  lee o escribe globales o memoria.
+  - mark_pure_functions(): marca func.pure en las funciones PURE que
+    devuelven un valor; StackMachine(memoize=N) memoiza sus resultados.
+  - propagate_global_constants(): un global que se escribe una sola vez
+    en todo el módulo, en el nivel superior de _actual_main y con una
+    constante (las inicializaciones de IRCodeGenerator.global_inits), se
+    reemplaza por la constante en las lecturas posteriores de
+    _actual_main; si ya nadie lo lee, la asignación desaparece.
+  - evaluate_calls(): un CALL / TAILCALL a una función PURE (u OUTPUT,
+    con allow_output=True) cuyos argumentos son todos constantes se
+    ejecuta en una StackMachine con un presupuesto de instrucciones por
+    llamada. Si termina, la llamada se reemplaza por la constante que
+    devolvió, precedida de un PRINTS con el texto que imprimió; si se
+    pasa del presupuesto o falla (división por cero), queda como está y
+    el error ocurre al ejecutar.
+
+Las tres pasadas se repiten junto con iropt.optimize_function hasta que
+no cambia nada, así un valor calculado puede volver constantes los
+argumentos de otra llamada. Al final solo queda en tiempo de ejecución
+la salida de lo que se pudo evaluar.
+'''
+import io
+from collections import Counter
+
+from iropt import CONST_OPS, ENTRY_POINTS, optimize_function, remove_unused_functions
+from stack_machine import OutputBuffer, StackMachine
+
+EVAL_BUDGET = 100_000
+
+PURE, OUTPUT, IMPURE = 'pure', 'output', 'impure'
+
+_LEVELS = {PURE: 0, OUTPUT: 1, IMPURE: 2}
+
+_OUTPUT_OPS = {'PRINTI', 'PRINTF', 'PRINTB', 'PRINTS'}
+
+_IMPURE_OPS = {'GLOBAL_GET', 'GLOBAL_SET', 'PEEKI', 'POKEI', 'PEEKF', 'POKEF',
+               'PEEKB', 'POKEB', 'GROW', 'MEMCPY', 'MEMSET', 'MEMCMP'}
+
+
+def function_purity(module):
+    """nombre -> PURE / OUTPUT / IMPURE de cada función del módulo"""
+    by_name = {func.name: func for func in module.functions}
+    purity = {}
+    calls = {}
+    for func in module.functions:
+        level = PURE
+        calls[func.name] = set()
+        for instr in func.instructions:
+            op = instr[0]
+            if op in _IMPURE_OPS:
+                level = IMPURE
+            elif op in _OUTPUT_OPS and level == PURE:
+                level = OUTPUT
+            elif op in ('CALL', 'TAILCALL'):
+                if instr[1] in by_name:
+                    calls[func.name].add(instr[1])
+                else:
+                    level = IMPURE
+        purity[func.name] = level
+
+    # Una función es tan impura como lo peor que llama (punto fijo)
+    changed = True
+    while changed:
+        changed = False
+        for name, callees in calls.items():
+            worst = max((purity[callee] for callee in callees),
+                        key=_LEVELS.get, default=PURE)
+            if _LEVELS[worst] > _LEVELS[purity[name]]:
+                purity[name] = worst
+                changed = True
+    return purity
+
+
+def mark_pure_functions(module):
+    """
+    Marca func.pure en las funciones PURE que devuelven un valor, las que
+    StackMachine(memoize=N) puede memoizar; devuelve sus nombres.
+    """
+    purity = function_purity(module)
+    for func in module.functions:
+        func.pure = (purity[func.name] == PURE and func.return_type != 'V'
+                     and func.name not in ENTRY_POINTS)
+    return [func.name for func in module.functions if func.pure]
+
+
+def propagate_global_constants(module):
+    """
+    Reemplaza las lecturas de globales de una sola asignación constante
+    en _actual_main; devuelve cuántas lecturas reemplazó.
+    """
+    writes = Counter(instr[1] for func in module.functions
+                     for instr in func.instructions if instr[0] == 'GLOBAL_SET')
+    entry = next((func for func in module.functions if func.name == '_actual_main'), None)
+    if entry is None:
+        return 0
+
+    code = list(entry.instructions)
+    known = {}
+    replaced = 0
+    depth = 0
+    for index, instr in enumerate(code):
+        op = instr[0]
+        if op in ('IF', 'LOOP'):
+            depth += 1
+        elif op in ('ENDIF', 'ENDLOOP'):
+            depth -= 1
+        elif (op == 'GLOBAL_SET' and depth == 0 and index > 0
+              and writes[instr[1]] == 1 and code[index - 1][0] in CONST_OPS):
+            known[instr[1]] = code[index - 1]
+        elif op == 'GLOBAL_GET' and instr[1] in known:
+            code[index] = known[instr[1]]
+            replaced += 1
+
+    # Globales que ya nadie lee: la asignación pasa a DROP
+    bodies = [func.instructions for func in module.functions if func is not entry] + [code]
+    read = {instr[1] for body in bodies for instr in body if instr[0] == 'GLOBAL_GET'}
+    code = [('DROP',) if instr[0] == 'GLOBAL_SET' and instr[1] in known
+            and instr[1] not in read else instr for instr in code]
+    if code != entry.instructions:
+        entry.instructions = code
+        optimize_function(entry)
+    return replaced
+
+
+class _OverBudget(Exception):
+    pass
+
+
+class _Evaluator(StackMachine):
+    """
+    StackMachine con el bucle de handlers que cuenta instrucciones y corta
+    la ejecución al pasar el presupuesto de una llamada.
+    """
+
+    def __init__(self, module, budget):
+        super().__init__(verify=False)
+        self.budget = budget
+        self.left = 0
+        self.spent = 0
+        self.load_module(module)
+
+    def _decode(self, func_name, instructions):
+        return [self._counted(handler) for handler in super()._decode(func_name, instructions)]
+
+    def _counted(self, handler):
+        def counted():
+            self.left -= 1
+            if self.left < 0:
+                raise _OverBudget()
+            return handler()
+        return counted
+
+    def evaluate(self, name, args):
+        """(texto impreso, valor devuelto) de name(*args), o None si no terminó"""
+        self.stack = []
+        self.call_stack = []
+        self.output = OutputBuffer(io.StringIO())
+        self.left = self.budget
+        frame = self._start(name)
+        frame.locals[:len(args)] = args
+        try:
+            self._execute()
+        except (_OverBudget, RuntimeError, IndexError, ValueError, OverflowError):
+            return None
+        finally:
+            self.spent += self.budget - max(self.left, 0)
+        self.output.flush()
+        value = self.stack.pop() if frame.returns else None
+        return self.output.sink.getvalue(), value
+
+
+def _evaluate_sites(module, func, allowed, evaluator, results, stats):
+    """Reemplaza las llamadas evaluables de func; devuelve si cambió algo"""
+    by_name = {f.name: f for f in module.functions}
+    out = []
+    changed = False
+    for instr in func.instructions:
+        op = instr[0]
+        callee = by_name.get(instr[1]) if op in ('CALL', 'TAILCALL') else None
+        if callee is not None and callee.name not in ENTRY_POINTS and callee.name in allowed:
+            count = len(callee.params)
+            args = out[len(out) - count:] if count else []
+            if len(args) == count and all(arg[0] in CONST_OPS for arg in args):
+                key = (callee.name, tuple(arg[1] for arg in args))
+                if key not in results:
+                    results[key] = evaluator.evaluate(*key)
+                    stats['evaluated' if results[key] is not None else 'failed'] += 1
+                result = results[key]
+                if result is not None:
+                    text, value = result
+                    del out[len(out) - count:]
+                    if text:
+                        out.append(('PRINTS', module.add_string(text)))
+                    if value is not None:
+                        out.append(('CONSTF', value) if callee.return_type == 'F'
+                                   else ('CONSTI', int(value)))
+                    if op == 'TAILCALL':
+                        out.append(('RET',))
+                    stats['replaced'] += 1
+                    changed = True
+                    continue
+        out.append(instr)
+    if changed:
+        func.instructions = out
+        optimize_function(func)
+    return changed
+
+
+def evaluate_calls(module, budget=EVAL_BUDGET, allow_output=True):
+    """
+    Evalúa al compilar las llamadas con argumentos constantes a funciones
+    puras (y que solo imprimen, si allow_output). Devuelve un Counter con
+    'replaced' (llamadas reemplazadas), 'evaluated' / 'failed' (llamadas
+    distintas que terminaron o no), 'spent' (instrucciones ejecutadas) y
+    'globals' (lecturas de globales constantes reemplazadas).
+    """
+    stats = Counter()
+    purity = function_purity(module)
+    levels = (PURE, OUTPUT) if allow_output else (PURE,)
+    allowed = {name for name, level in purity.items() if level in levels}
+    evaluator = _Evaluator(module, budget)
+    results = {}
+    changed = True
+    while changed:
+        replaced = propagate_global_constants(module)
+        stats['globals'] += replaced
+        changed = bool(replaced)
+        for func in module.functions:
+            if _evaluate_sites(module, func, allowed, evaluator, results, stats):
+                changed = True
+    remove_unused_functions(module)
+    stats['spent'] = evaluator.spent
+    return stats
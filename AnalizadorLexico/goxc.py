@@ -0,0 +1,305 @@
+# goxc.py - Formato binario de módulos compilados (.goxc)
+'''
+Módulos compilados
+==================
+Un archivo .goxc guarda un IRModule ya generado para que la máquina de
+pila pueda ejecutarlo sin volver a compilar ni re-parsear texto. El
+archivo se abre con mmap y el código de cada función se decodifica
+solo la primera vez que se usa (normalmente en su primer CALL), así
+que el arranque depende del código que realmente se ejecuta.
+
+Estructura (little endian):
+
+    Header          magic 'GOXC', versión, flags, nº de constantes,
+                    nº de funciones, offsets del pool, la tabla y el código,
+                    y nº y offset de la tabla de cadenas
+    Pool            constantes (enteros, flotantes y cadenas) referidas
+                    por índice desde la tabla de funciones y el código
+    Funciones       por función: nombre, offset y tamaño del código,
+                    parámetros con sus tipos, locales, tipo de retorno y
+                    profundidad máxima de la pila (calculada por verifier.py)
+    Cadenas         pool de cadenas del módulo (operando de PRINTS): un
+                    índice al pool de constantes (u32) por cadena
+    Código          instrucciones empaquetadas: opcode (u8), número de
+                    operandos (u8) y un índice al pool (u32) por operando
+'''
+import mmap
+import struct
+from collections.abc import Mapping
+
+from verifier import max_stack_depths
+
+MAGIC = b'GOXC'
+VERSION = 3
+
+# Los opcodes se numeran por su posición: agregar siempre al final
+OPCODES = (
+    'CONSTI', 'PUSHI', 'CONSTF',
+    'ADDI', 'SUBI', 'MULI', 'DIVI',
+    'ADDF', 'SUBF', 'MULF', 'DIVF',
+    'EQI', 'NEI', 'LTI', 'LEI', 'GTI', 'GEI',
+    'EQF', 'NEF',
+    'ANDI', 'ORI',
+    'ITOF', 'FTOI',
+    'PEEKI', 'POKEI', 'PEEKF', 'POKEF', 'PEEKB', 'POKEB', 'GROW',
+    'LOCAL_GET', 'LOCAL_SET', 'GLOBAL_GET', 'GLOBAL_SET',
+    'CALL', 'RET',
+    'IF', 'ELSE', 'ENDIF', 'LOOP', 'CBREAK', 'ENDLOOP', 'CONTINUE',
+    'JUMP', 'JUMPZ',
+    'PRINTI', 'PRINTF', 'PRINTB',
+    'MODI', 'TAILCALL', 'DROP',
+    'MEMCPY', 'MEMSET', 'MEMCMP',
+    'PRINTS',
+    # Superinstrucciones de peephole.py (solo en código cargado)
+    'INC_LOCAL', 'LOCAL_GET2', 'LOCAL_CONST', 'INC_GLOBAL', 'GLOBAL_CONST',
+    'JUMP_IF_EQ', 'JUMP_IF_NE', 'JUMP_IF_LT', 'JUMP_IF_LE', 'JUMP_IF_GT', 'JUMP_IF_GE',
+    'INTRINSIC',
+)
+OPCODE_NUMBERS = {name: number for number, name in enumerate(OPCODES)}
+
+_HEADER = struct.Struct('<4sHHIIIIIII')
+_FUNC_ENTRY = struct.Struct('<IIIHHIH')
+_INSTR = struct.Struct('<BB')
+_U32 = struct.Struct('<I')
+_I64 = struct.Struct('<q')
+_F64 = struct.Struct('<d')
+
+# Etiquetas del pool de constantes
+_TAG_INT, _TAG_FLOAT, _TAG_STR, _TAG_BIGINT = range(4)
+
+
+class GoxcError(Exception):
+    '''Archivo .goxc inválido o instrucción no representable.'''
+    pass
+
+
+# ════════════════════════════════════════════════════════════════
+#  ESCRITURA
+# ════════════════════════════════════════════════════════════════
+
+class _ConstantPool:
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def add(self, value):
+        key = (type(value), value)
+        if key not in self.index:
+            self.index[key] = len(self.values)
+            self.values.append(value)
+        return self.index[key]
+
+    def encode(self):
+        out = bytearray()
+        for value in self.values:
+            if isinstance(value, str):
+                data = value.encode('utf-8')
+                out += bytes([_TAG_STR]) + _U32.pack(len(data)) + data
+            elif isinstance(value, float):
+                out += bytes([_TAG_FLOAT]) + _F64.pack(value)
+            elif -2**63 <= value < 2**63:
+                out += bytes([_TAG_INT]) + _I64.pack(value)
+            else:
+                data = str(value).encode('ascii')
+                out += bytes([_TAG_BIGINT]) + _U32.pack(len(data)) + data
+        return bytes(out)
+
+
+def dumps(module):
+    """Serializa un IRModule al formato .goxc"""
+    pool = _ConstantPool()
+    code = bytearray()
+    entries = bytearray()
+    depths = max_stack_depths(module)
+
+    for func in module.functions:
+        offset = len(code)
+        for instr in func.instructions:
+            op = instr[0]
+            if op not in OPCODE_NUMBERS:
+                raise GoxcError(f"Instrucción no soportada en .goxc: {op}")
+            args = instr[1:]
+            code += _INSTR.pack(OPCODE_NUMBERS[op], len(args))
+            for arg in args:
+                code += _U32.pack(pool.add(arg))
+
+        params = list(func.params)
+        locals_only = [name for name in func.locals if name not in params]
+        entries += _FUNC_ENTRY.pack(pool.add(func.name), offset, len(code) - offset,
+                                    len(params), len(locals_only), pool.add(func.return_type),
+                                    depths[func.name])
+        for name, typ in zip(params, func.param_types):
+            entries += _U32.pack(pool.add(name)) + _U32.pack(pool.add(typ))
+        for name in locals_only:
+            entries += _U32.pack(pool.add(name)) + _U32.pack(pool.add(func.locals[name]))
+
+    strings = b''.join(_U32.pack(pool.add(text)) for text in module.strings)
+    constants = pool.encode()
+    const_offset = _HEADER.size
+    functab_offset = const_offset + len(constants)
+    strings_offset = functab_offset + len(entries)
+    code_offset = strings_offset + len(strings)
+    header = _HEADER.pack(MAGIC, VERSION, 0, len(pool.values), len(module.functions),
+                          const_offset, functab_offset, code_offset,
+                          len(module.strings), strings_offset)
+    # Los offsets de cada función son relativos al inicio de la sección de código
+    return header + constants + bytes(entries) + strings + bytes(code)
+
+
+def write_goxc(module, filename):
+    """Guarda un IRModule en un archivo .goxc"""
+    with open(filename, 'wb') as f:
+        f.write(dumps(module))
+
+
+# ════════════════════════════════════════════════════════════════
+#  LECTURA
+# ════════════════════════════════════════════════════════════════
+
+class FunctionInfo:
+    """Metadatos de una función tal como aparecen en la tabla"""
+    def __init__(self, name, params, param_types, locals_, return_type, offset, size,
+                 max_stack=None):
+        self.name = name
+        self.params = params
+        self.param_types = param_types
+        self.locals = locals_        # Solo locales, sin parámetros
+        self.return_type = return_type
+        self.offset = offset
+        self.size = size
+        self.max_stack = max_stack   # Profundidad máxima de la pila de operandos
+
+
+class GoxcModule:
+    """
+    Módulo .goxc mapeado en memoria. El pool y la tabla de funciones
+    se leen al abrir; el código de cada función se decodifica bajo
+    demanda con decode_function().
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.constants = []
+        self.strings = []
+        self.function_info = {}
+        self.decoded_count = 0
+        self._read_tables()
+
+    @classmethod
+    def open(cls, filename):
+        with open(filename, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(data)
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def _read_tables(self):
+        data = self.data
+        if len(data) < _HEADER.size:
+            raise GoxcError("Archivo .goxc truncado")
+        (magic, version, _flags, n_consts, n_funcs, const_offset, functab_offset,
+         self.code_offset, n_strings, strings_offset) = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise GoxcError("No es un módulo .goxc")
+        if version != VERSION:
+            raise GoxcError(f"Versión de .goxc no soportada: {version}")
+
+        pos = const_offset
+        for _ in range(n_consts):
+            tag = data[pos]
+            pos += 1
+            if tag == _TAG_INT:
+                self.constants.append(_I64.unpack_from(data, pos)[0])
+                pos += _I64.size
+            elif tag == _TAG_FLOAT:
+                self.constants.append(_F64.unpack_from(data, pos)[0])
+                pos += _F64.size
+            elif tag in (_TAG_STR, _TAG_BIGINT):
+                length = _U32.unpack_from(data, pos)[0]
+                pos += _U32.size
+                text = bytes(data[pos:pos + length]).decode('utf-8')
+                self.constants.append(text if tag == _TAG_STR else int(text))
+                pos += length
+            else:
+                raise GoxcError(f"Constante con etiqueta desconocida: {tag}")
+
+        const = self.constants
+        pos = functab_offset
+        for _ in range(n_funcs):
+            (name, offset, size, n_params, n_locals, ret,
+             max_stack) = _FUNC_ENTRY.unpack_from(data, pos)
+            pos += _FUNC_ENTRY.size
+            pairs = []
+            for _ in range(n_params + n_locals):
+                name_idx, type_idx = struct.unpack_from('<II', data, pos)
+                pos += 8
+                pairs.append((const[name_idx], const[type_idx]))
+            params = pairs[:n_params]
+            self.function_info[const[name]] = FunctionInfo(
+                const[name],
+                [p for p, _ in params],
+                [t for _, t in params],
+                dict(pairs[n_params:]),
+                const[ret],
+                offset,
+                size,
+                max_stack,
+            )
+
+        self.strings = [const[_U32.unpack_from(data, strings_offset + 4 * i)[0]]
+                        for i in range(n_strings)]
+
+    def decode_function(self, name):
+        """Decodifica las instrucciones de una función"""
+        info = self.function_info[name]
+        data, const = self.data, self.constants
+        pos = self.code_offset + info.offset
+        end = pos + info.size
+        instructions = []
+        while pos < end:
+            opcode, argc = _INSTR.unpack_from(data, pos)
+            pos += _INSTR.size
+            args = struct.unpack_from(f'<{argc}I', data, pos)
+            pos += 4 * argc
+            instructions.append((OPCODES[opcode], *(const[i] for i in args)))
+        self.decoded_count += 1
+        return instructions
+
+    def lazy_functions(self, transform=None):
+        """Tabla de funciones que decodifica cada una en su primer acceso"""
+        return LazyFunctionTable(self, transform)
+
+
+class LazyFunctionTable(Mapping):
+    """
+    Mapping nombre -> instrucciones. Los nombres están disponibles de
+    inmediato; el código se decodifica (y se transforma, p. ej. con
+    resolve_jumps) solo la primera vez que se pide.
+    """
+
+    def __init__(self, module, transform=None):
+        self.module = module
+        self.transform = transform
+        self.cache = {}
+
+    def __getitem__(self, name):
+        code = self.cache.get(name)
+        if code is None:
+            if name not in self.module.function_info:
+                raise KeyError(name)
+            code = self.module.decode_function(name)
+            if self.transform:
+                code = self.transform(code)
+            self.cache[name] = code
+        return code
+
+    def __contains__(self, name):
+        return name in self.module.function_info
+
+    def __iter__(self):
+        return iter(self.module.function_info)
+
+    def __len__(self):
+        return len(self.module.function_info)
@@ -0,0 +1,76 @@
+# intrinsics.py - Funciones intrínsecas implementadas en Python
+'''
+Intrínsecas
+===========
+Rutinas enteras que los programas de ejemplo escriben en GoxLang (mod,
+gcd y powmod en shor.gox) y que dominan su tiempo de ejecución. Un
+programa puede llamar en su lugar a las intrínsecas:
+
+    __mod(a, b)         a % b (error si b es 0, como MODI)
+    __gcd(a, b)         math.gcd(a, b)
+    __powmod(a, x, n)   pow(a, x, n) (x >= 0, n != 0)
+    __isqrt(a)          math.isqrt(a) (a >= 0)
+
+Sus firmas están en typesys.builtin_funcs, así que el Checker las
+verifica como cualquier llamada. Si el programa no define una función
+con ese nombre, IRCodeGenerator emite 'INTRINSIC nombre' en vez de
+CALL: la instrucción desapila los argumentos y apila el resultado sin
+abrir un frame. Los enteros de la máquina no tienen límite, así que
+pow(a, x, n) trabaja con módulos de cualquier tamaño.
+'''
+import math
+from collections import namedtuple
+
+from typesys import builtin_funcs
+
+# arity: valores que desapila; function: implementación (devuelve un entero)
+Intrinsic = namedtuple('Intrinsic', 'name arity function')
+
+
+def _mod(a, b):
+    if b == 0:
+        raise RuntimeError("División por cero")
+    return a % b
+
+
+def _powmod(a, x, n):
+    if n == 0:
+        raise RuntimeError("Módulo cero en __powmod")
+    if x < 0:
+        raise RuntimeError("Exponente negativo en __powmod")
+    return pow(a, x, n)
+
+
+def _isqrt(a):
+    if a < 0:
+        raise RuntimeError("Raíz de un número negativo en __isqrt")
+    return math.isqrt(a)
+
+
+_IMPLEMENTATIONS = {
+    '__mod': _mod,
+    '__gcd': math.gcd,
+    '__powmod': _powmod,
+    '__isqrt': _isqrt,
+}
+
+INTRINSICS = {
+    name: Intrinsic(name, len(builtin_funcs[name][0]), function)
+    for name, function in _IMPLEMENTATIONS.items()
+}
+
+
+def lookup(name):
+    """Intrínseca registrada con ese nombre; RuntimeError si no existe"""
+    intrinsic = INTRINSICS.get(name)
+    if intrinsic is None:
+        raise RuntimeError(f"Intrínseca '{name}' no encontrada")
+    return intrinsic
+
+
+def evaluate(name, args):
+    """Resultado de la intrínseca con argumentos constantes, o None si falla"""
+    try:
+        return lookup(name).function(*(int(arg) for arg in args))
+    except RuntimeError:
+        return None
@@ -1,3 +1,4 @@
+from intrinsics import INTRINSICS
 from model import (
     Program, FunctionDef, ParamList, Param, Block, VarDecl,
     Assign, Return, BinOp, UnaryOp, VarRef, FunctionCall,
@@ -5,13 +6,25 @@ from model import (
     Print, Char
 )
 
+# Tipos del lenguaje -> tipos del IR ('V' = sin valor de retorno)
+IR_TYPES = {'int': 'I', 'bool': 'I', 'char': 'I', 'float': 'F', 'void': 'V'}
+
+
+def ir_type(type_name) -> str:
+    return IR_TYPES.get(str(type_name).lower(), 'I')
+
+
 class IRFunction:
-    def __init__(self, name, params=None):
+    def __init__(self, name, params=None, param_types=None, return_type='I'):
         self.name = name
         self.instructions: list = []
         self.params = params or []  # Lista de nombres de parámetros (en orden)
+        self.param_types = param_types or ['I'] * len(self.params)
+        self.return_type = return_type
         # Todos los locales (incluye parámetros), valor es tipo, ej. 'I'
-        self.locals: dict[str, str] = {p: 'I' for p in self.params}
+        self.locals: dict[str, str] = dict(zip(self.params, self.param_types))
+        # Sin efectos y con resultado: la VM puede memoizarla (consteval.py)
+        self.pure = False
 
     def add_local(self, name: str, typ='I') -> None:
         # Solo agrega si no existe
@@ -30,6 +43,9 @@ class IRModule:
     def __init__(self):
         self.functions: list[IRFunction] = []
         self.global_vars: set[str] = set()
+        # Pool de cadenas literales; PRINTS recibe el índice
+        self.strings: list[str] = []
+        self._string_index: dict[str, int] = {}
 
     def add_function(self, func: IRFunction):
         self.functions.append(func)
@@ -37,18 +53,24 @@ class IRModule:
     def add_global(self, name: str):
         self.global_vars.add(name)
 
+    def add_string(self, text: str) -> int:
+        if text not in self._string_index:
+            self._string_index[text] = len(self.strings)
+            self.strings.append(text)
+        return self._string_index[text]
+
     def dump(self) -> str:
         out: list[str] = []
         out.append("MODULE:::")
+        if self.strings:
+            out.append(f"STRINGS::: {self.strings}")
         for func in self.functions:
             param_names = func.params
-            param_types = ['I'] * len(param_names)  # ajusta si tienes tipos reales
-            return_type = 'I'  # ajusta si tienes tipos reales
 
             # Los locales, excluyendo los parámetros
             locals_only = {k: v for k, v in func.locals.items() if k not in param_names}
 
-            out.append(f"FUNCTION::: {func.name}, {param_names}, {param_types} {return_type}")
+            out.append(f"FUNCTION::: {func.name}, {param_names}, {func.param_types} {func.return_type}")
             out.append(f"locals: {locals_only}")
             for instr in func.instructions:
                 out.append(str(instr))
@@ -56,24 +78,31 @@ class IRModule:
 
 
 class IRCodeGenerator:
-    def __init__(self):
+    def __init__(self, tail_calls=True):
         self.module = IRModule()
         self.global_inits: list[tuple[str, any]] = []
+        self.tail_calls = tail_calls  # Emitir TAILCALL para 'return f(...)'
+        self.return_types: dict[str, str] = {}
 
     def generic_visit(self, node, context):
         raise NotImplementedError(f"No se implementó visit_{node.__class__.__name__} en IRCodeGenerator")
 
     def generate(self, ast_root: list):
+        # 0) Tipos de retorno, para descartar valores de llamadas usadas como sentencia
+        for node in ast_root:
+            if isinstance(node, FunctionDef):
+                self.return_types[node.name] = ir_type(node.return_type)
+
         # 1) Todas las funciones definidas por el usuario primero
         for node in ast_root:
             if isinstance(node, FunctionDef):
                 self.visit_FunctionDef(node, None)
 
         # 2) main wrapper
-        main_func = IRFunction("main", [])
+        main_func = IRFunction("main", [], return_type='V')
         self.module.add_function(main_func)
         # 3) _actual_main para statements globales
-        actual_main_func = IRFunction("_actual_main", [])
+        actual_main_func = IRFunction("_actual_main", [], return_type='V')
         self.module.add_function(actual_main_func)
 
         # 4) Registrar variables globales Y recopilar inicializaciones
@@ -94,7 +123,7 @@ class IRCodeGenerator:
         statements_instrs: list = []
         for node in ast_root:
             if not isinstance(node, (FunctionDef, VarDecl)):
-                node.accept(self, actual_main_func)
+                self.visit_statement(node, actual_main_func)
                 statements_instrs.extend(actual_main_func.instructions)
                 actual_main_func.instructions = []  # Limpiar para siguiente
 
@@ -109,16 +138,23 @@ class IRCodeGenerator:
 
     # ─── Visitors ───────────────────────────────────────────
 
+    def visit_statement(self, stmt, context):
+        stmt.accept(self, context)
+        # 'f(x);' como sentencia: el valor de retorno no se usa
+        if isinstance(stmt, FunctionCall) and self.return_types.get(stmt.name, 'I') != 'V':
+            context.add_instr("DROP")
+
     def visit_Program(self, node: Program, context):
         pass
 
     def visit_FunctionDef(self, node: FunctionDef, context):
         param_names = [param.name for param in node.params.params]
-        func = IRFunction(node.name, param_names)
+        param_types = [ir_type(param.type) for param in node.params.params]
+        func = IRFunction(node.name, param_names, param_types, ir_type(node.return_type))
         self.module.add_function(func)
         # Parámetros ya están en func.locals (por __init__)
         for stmt in node.body.statements:
-            stmt.accept(self, func)
+            self.visit_statement(stmt, func)
 
     def visit_VarDecl(self, node: VarDecl, context):
         name = node.name
@@ -141,18 +177,18 @@ class IRCodeGenerator:
 
     def visit_Print(self, node: Print, context):
         node.expr.accept(self, context)
-        if not isinstance(node.expr, String) and not isinstance(node.expr, BinOp):
+        if not self._is_string_expr(node.expr):
             context.add_instr("PRINTI")
 
     def visit_If(self, node: If, context):
         node.condition.accept(self, context)
         context.add_instr("IF")
         for stmt in node.then_block.statements:
-            stmt.accept(self, context)
+            self.visit_statement(stmt, context)
         if node.else_block:
             context.add_instr("ELSE")
             for stmt in node.else_block.statements:
-                stmt.accept(self, context)
+                self.visit_statement(stmt, context)
         context.add_instr("ENDIF")
 
     def visit_While(self, node: While, context):
@@ -160,10 +196,17 @@ class IRCodeGenerator:
         node.condition.accept(self, context)
         context.add_instr("CBREAK")
         for stmt in node.body.statements:
-            stmt.accept(self, context)
+            self.visit_statement(stmt, context)
         context.add_instr("ENDLOOP")
 
     def visit_Return(self, node: Return, context):
+        if (self.tail_calls and isinstance(node.expr, FunctionCall)
+                and not self._is_intrinsic(node.expr.name)):
+            # 'return f(...)' en posición de cola: reutiliza el frame actual
+            for arg in node.expr.arguments:
+                arg.accept(self, context)
+            context.add_instr("TAILCALL", node.expr.name)
+            return
         if node.expr:
             node.expr.accept(self, context)
         context.add_instr("RET")
@@ -171,30 +214,36 @@ class IRCodeGenerator:
     def visit_FunctionCall(self, node: FunctionCall, context):
         for arg in node.arguments:
             arg.accept(self, context)
-        context.add_instr("CALL", node.name)
+        if self._is_intrinsic(node.name):
+            context.add_instr("INTRINSIC", node.name)
+        else:
+            context.add_instr("CALL", node.name)
+
+    def _is_intrinsic(self, name) -> bool:
+        # Una función del programa con el mismo nombre tiene prioridad
+        return name in INTRINSICS and name not in self.return_types
+
+    def _is_string_expr(self, node) -> bool:
+        # "texto" + expr (en cualquier orden y anidado) se imprime por partes
+        if isinstance(node, String):
+            return True
+        return (isinstance(node, BinOp) and node.op == '+' and
+                (self._is_string_expr(node.left) or self._is_string_expr(node.right)))
 
     def visit_BinOp(self, node: BinOp, context):
-        if node.op == '+' and isinstance(node.left, String):
-            for ch in node.left.value:
-                context.add_instr("PUSHI", ord(ch))
-                context.add_instr("PRINTB")
-            node.right.accept(self, context)
-            context.add_instr("PRINTI")
-            return
-        if node.op == '+' and isinstance(node.right, String):
-            node.left.accept(self, context)
-            context.add_instr("PRINTI")
-            for ch in node.right.value:
-                context.add_instr("PUSHI", ord(ch))
-                context.add_instr("PRINTB")
+        if self._is_string_expr(node):
+            for part in (node.left, node.right):
+                part.accept(self, context)
+                if not self._is_string_expr(part):
+                    context.add_instr("PRINTI")
             return
 
         node.left.accept(self, context)
         node.right.accept(self, context)
         op_map = {
-            '+':'ADDI','-':'SUBI','*':'MULI','/':'DIVI',
+            '+':'ADDI','-':'SUBI','*':'MULI','/':'DIVI','%':'MODI',
             '<':'LTI','<=':'LEI','>':'GTI','>=':'GEI',
-            '==':'EQI','!=':'NEI'
+            '==':'EQI','!=':'NEI','&&':'ANDI','||':'ORI'
         }
         if node.op in op_map:
             context.add_instr(op_map[node.op])
@@ -218,9 +267,7 @@ class IRCodeGenerator:
         context.add_instr("CONSTI", 0)
 
     def visit_String(self, node: String, context):
-        for ch in node.value:
-            context.add_instr("PUSHI", ord(ch))
-            context.add_instr("PRINTB")
+        context.add_instr("PRINTS", self.module.add_string(node.value))
 
     def visit_VarRef(self, node: VarRef, context):
         if context.get_local(node.name):
@@ -230,7 +277,7 @@ class IRCodeGenerator:
 
     def visit_Block(self, node: Block, context):
         for stmt in node.statements:
-            stmt.accept(self, context)
+            self.visit_statement(stmt, context)
 
     def visit_ParamList(self, node: ParamList, context):
         pass
@@ -0,0 +1,521 @@
+# iropt.py - Optimizaciones sobre el IR estructurado
+'''
+Optimizador de IR
+=================
+Pasadas sobre IRFunction.instructions (antes de lowering.py, con los
+marcadores IF/ELSE/ENDIF y LOOP/CBREAK/ENDLOOP todavía presentes):
+
+  - Plegado de constantes: 'CONSTI 2; CONSTI 3; MULI' -> 'CONSTI 6', igual
+    para comparaciones, lógica, flotantes, conversiones e intrínsecas.
+    Solo se pliegan instrucciones contiguas; como todo punto de unión del
+    control de flujo es un marcador, nunca se pliega a través de un salto.
+  - Propagación de constantes: un local (no parámetro) que se asigna una
+    sola vez, fuera de IF y bucles, con un valor constante, se reemplaza
+    por la constante en las lecturas posteriores; si ya no se lee, la
+    asignación desaparece.
+  - IF / CBREAK con condición constante: se descarta la rama muerta.
+  - Código inalcanzable: lo que sigue a RET, TAILCALL o CONTINUE hasta
+    el marcador que cierra el bloque (ELSE, ENDIF o ENDLOOP).
+  - Asignaciones muertas: 'LOCAL_SET x' de un local que nunca se lee se
+    convierte en DROP, y un DROP se cancela con las instrucciones puras
+    que calcularon el valor; los locales sin uso salen de la función.
+
+Las pasadas se repiten hasta que ninguna cambia el código. La división
+por cero no se pliega ni se elimina, para que el error siga ocurriendo
+al ejecutar.
+
+A nivel de módulo:
+
+  - Inlining: 'CALL f' se reemplaza por el cuerpo de f cuando f no es
+    recursiva (ni a través de otras) y tiene a lo sumo INLINE_MAX_SIZE
+    instrucciones. Los locales de f pasan al llamador como 'f$x'; los
+    argumentos ya apilados se guardan en los parámetros en orden inverso
+    y los demás locales vuelven a 0, como en un frame nuevo. Un return
+    en medio del cuerpo se normaliza: 'IF ... RET ENDIF resto' pasa a
+    'IF ... ELSE resto ENDIF' y cada RET guarda el valor en 'f$return'
+    (return es palabra reservada, así que no choca con ningún local).
+    No se expanden funciones con RET dentro de un bucle ni con TAILCALL,
+    y un cuerpo con marcadores solo se expande donde no quedan otros
+    valores en la pila (el backend Python vacía la pila en cada bloque).
+  - remove_unused_functions() recorre el grafo de llamadas desde main /
+    _actual_main y quita las funciones que nadie llama.
+'''
+from collections import Counter
+
+from intrinsics import INTRINSICS, evaluate as evaluate_intrinsic
+from verifier import Arity, STACK_EFFECTS
+
+CONST_OPS = ('CONSTI', 'PUSHI', 'CONSTF')
+
+
+def _eq_float(a, b):
+    return 1 if abs(float(a) - float(b)) < 1e-9 else 0
+
+
+# Misma semántica que los handlers de stack_machine.py
+BINARY_FOLDS = {
+    'ADDI': lambda a, b: a + b,
+    'SUBI': lambda a, b: a - b,
+    'MULI': lambda a, b: a * b,
+    'DIVI': lambda a, b: a // b,
+    'MODI': lambda a, b: a % b,
+    'EQI': lambda a, b: 1 if a == b else 0,
+    'NEI': lambda a, b: 1 if a != b else 0,
+    'LTI': lambda a, b: 1 if a < b else 0,
+    'LEI': lambda a, b: 1 if a <= b else 0,
+    'GTI': lambda a, b: 1 if a > b else 0,
+    'GEI': lambda a, b: 1 if a >= b else 0,
+    'ANDI': lambda a, b: 1 if a and b else 0,
+    'ORI': lambda a, b: 1 if a or b else 0,
+    'ADDF': lambda a, b: float(a) + float(b),
+    'SUBF': lambda a, b: float(a) - float(b),
+    'MULF': lambda a, b: float(a) * float(b),
+    'DIVF': lambda a, b: float(a) / float(b),
+    'EQF': _eq_float,
+    'NEF': lambda a, b: 1 - _eq_float(a, b),
+}
+
+UNARY_FOLDS = {
+    'ITOF': float,
+    'FTOI': int,
+}
+
+_DIVISIONS = {'DIVI', 'MODI', 'DIVF'}
+
+# Producen un valor sin efectos: se pueden quitar si el valor se descarta
+PURE_PUSHES = CONST_OPS + ('LOCAL_GET', 'GLOBAL_GET')
+
+# Después de estas, el resto del bloque no se ejecuta
+TERMINATORS = ('RET', 'TAILCALL', 'CONTINUE')
+
+ENTRY_POINTS = ('main', '_actual_main')
+
+INLINE_MAX_SIZE = 24
+
+STRUCTURED_MARKERS = ('IF', 'ELSE', 'ENDIF', 'LOOP', 'CBREAK', 'ENDLOOP', 'CONTINUE')
+
+
+def _const(instr):
+    """Valor de una instrucción constante, o None"""
+    if instr[0] in CONST_OPS:
+        return instr[1]
+    return None
+
+
+def _const_instr(value):
+    return ('CONSTF', value) if isinstance(value, float) else ('CONSTI', value)
+
+
+def fold_constants(instructions):
+    """Pliega operaciones cuyos operandos son constantes contiguas"""
+    out = []
+    for instr in instructions:
+        op = instr[0]
+        if op in BINARY_FOLDS and len(out) >= 2:
+            a, b = _const(out[-2]), _const(out[-1])
+            if a is not None and b is not None and not (op in _DIVISIONS and b == 0):
+                del out[-2:]
+                out.append(_const_instr(BINARY_FOLDS[op](a, b)))
+                continue
+        elif op in UNARY_FOLDS and out:
+            a = _const(out[-1])
+            if a is not None:
+                out[-1] = _const_instr(UNARY_FOLDS[op](a))
+                continue
+        elif op == 'INTRINSIC' and instr[1] in INTRINSICS:
+            count = INTRINSICS[instr[1]].arity
+            args = [_const(arg) for arg in out[len(out) - count:]]
+            value = None
+            if len(args) == count and None not in args:
+                value = evaluate_intrinsic(instr[1], args)
+            if value is not None:
+                del out[len(out) - count:]
+                out.append(('CONSTI', value))
+                continue
+        out.append(instr)
+    return out
+
+
+def _matching(instructions, start, opening, closing, middle=None):
+    """Índices del marcador intermedio (o None) y del cierre de la estructura en 'start'"""
+    depth = 0
+    middle_at = None
+    for index in range(start + 1, len(instructions)):
+        op = instructions[index][0]
+        if op == opening:
+            depth += 1
+        elif op == closing:
+            if depth == 0:
+                return middle_at, index
+            depth -= 1
+        elif op == middle and depth == 0:
+            middle_at = index
+    raise RuntimeError(f"{opening} sin {closing} correspondiente")
+
+
+def prune_constant_branches(instructions):
+    """IF / CBREAK cuya condición es una constante"""
+    out = list(instructions)
+    index = 1
+    while index < len(out):
+        op = out[index][0]
+        condition = _const(out[index - 1])
+        if op == 'IF' and condition is not None:
+            else_at, end = _matching(out, index, 'IF', 'ENDIF', 'ELSE')
+            if condition:
+                kept = out[index + 1:else_at if else_at is not None else end]
+            else:
+                kept = out[else_at + 1:end] if else_at is not None else []
+            out[index - 1:end + 1] = kept
+            index -= 1
+        elif op == 'CBREAK' and condition:
+            # El bucle no sale por aquí: la comprobación sobra
+            del out[index - 1:index + 1]
+            index -= 1
+        else:
+            index += 1
+    return out
+
+
+def propagate_constants(func, instructions):
+    """Locales de una sola asignación constante, hecha fuera de IF y bucles"""
+    writes = {}
+    for instr in instructions:
+        if instr[0] == 'LOCAL_SET':
+            writes[instr[1]] = writes.get(instr[1], 0) + 1
+
+    constants = {}   # local -> (índice de la asignación, valor)
+    depth = 0
+    for index, instr in enumerate(instructions):
+        op = instr[0]
+        if op in ('IF', 'LOOP'):
+            depth += 1
+        elif op in ('ENDIF', 'ENDLOOP'):
+            depth -= 1
+        elif (op == 'LOCAL_SET' and depth == 0 and index > 0
+              and writes[instr[1]] == 1 and instr[1] not in func.params):
+            value = _const(instructions[index - 1])
+            if value is not None:
+                constants[instr[1]] = (index, value)
+
+    if not constants:
+        return instructions
+
+    out = list(instructions)
+    for name, (set_at, value) in constants.items():
+        for index in range(set_at + 1, len(out)):
+            if out[index] == ('LOCAL_GET', name):
+                out[index] = _const_instr(value)
+
+    # Asignaciones que ya nadie lee (las lecturas previas ven el 0 inicial)
+    read = {instr[1] for instr in out if instr[0] == 'LOCAL_GET'}
+    dead = {constants[name][0] for name in constants if name not in read}
+    return [instr for index, instr in enumerate(out)
+            if index not in dead and index + 1 not in dead]
+
+
+def remove_unreachable(instructions):
+    """Quita lo que sigue a RET / TAILCALL / CONTINUE hasta el cierre del bloque"""
+    out = []
+    skipping = False
+    depth = 0
+    for instr in instructions:
+        op = instr[0]
+        if skipping:
+            if op in ('IF', 'LOOP'):
+                depth += 1
+                continue
+            if op in ('ENDIF', 'ENDLOOP') and depth:
+                depth -= 1
+                continue
+            if depth or op not in ('ELSE', 'ENDIF', 'ENDLOOP'):
+                continue
+            skipping = False
+        out.append(instr)
+        if op in TERMINATORS:
+            skipping = True
+            depth = 0
+    return out
+
+
+def _append_drop(out):
+    """Agrega un DROP cancelando las instrucciones puras que produjeron el valor"""
+    pending = 1
+    while pending and out:
+        op = out[-1][0]
+        if op in PURE_PUSHES:
+            pending -= 1
+        elif op in BINARY_FOLDS and op not in _DIVISIONS:
+            pending += 1
+        elif op not in UNARY_FOLDS:
+            break
+        out.pop()
+    out.extend([('DROP',)] * pending)
+
+
+def remove_dead_stores(func, instructions):
+    """Asignaciones a locales que nunca se leen"""
+    read = {instr[1] for instr in instructions if instr[0] == 'LOCAL_GET'}
+    out = []
+    for instr in instructions:
+        if instr[0] == 'DROP' or (instr[0] == 'LOCAL_SET' and instr[1] not in read):
+            _append_drop(out)
+        else:
+            out.append(instr)
+    return out
+
+
+def _remove_unused_locals(func):
+    used = {instr[1] for instr in func.instructions if instr[0] in ('LOCAL_GET', 'LOCAL_SET')}
+    for name in list(func.locals):
+        if name not in used and name not in func.params:
+            del func.locals[name]
+
+
+def optimize_function(func):
+    """Aplica las pasadas hasta un punto fijo; devuelve instrucciones eliminadas"""
+    before = len(func.instructions)
+    code = [tuple(instr) for instr in func.instructions]
+    while True:
+        new = fold_constants(code)
+        new = prune_constant_branches(new)
+        new = propagate_constants(func, new)
+        new = remove_unreachable(new)
+        new = remove_dead_stores(func, new)
+        if new == code:
+            break
+        code = new
+    func.instructions = code
+    _remove_unused_locals(func)
+    return before - len(code)
+
+
+def reachable_functions(module, roots=ENTRY_POINTS):
+    """Nombres de las funciones alcanzables desde 'roots' por CALL / TAILCALL"""
+    by_name = {func.name: func for func in module.functions}
+    reached = set()
+    pending = [name for name in roots if name in by_name]
+    while pending:
+        name = pending.pop()
+        if name in reached:
+            continue
+        reached.add(name)
+        for instr in by_name[name].instructions:
+            if instr[0] in ('CALL', 'TAILCALL') and instr[1] in by_name:
+                pending.append(instr[1])
+    return reached
+
+
+def remove_unused_functions(module, roots=ENTRY_POINTS):
+    """Quita las funciones que nadie llama; devuelve nombre -> instrucciones"""
+    reached = reachable_functions(module, roots)
+    removed = {func.name: len(func.instructions)
+               for func in module.functions if func.name not in reached}
+    module.functions = [func for func in module.functions if func.name in reached]
+    return removed
+
+
+def _call_graph_order(calls):
+    """
+    Componentes fuertemente conexas del grafo de llamadas (Tarjan, sin
+    recursión de Python). Devuelve las funciones recursivas y un orden en
+    que cada función aparece después de las que llama.
+    """
+    index, low = {}, {}
+    stack, on_stack = [], set()
+    recursive, order = set(), []
+    for root in calls:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(calls[root]))]
+        while work:
+            node, callees = work[-1]
+            for callee in callees:
+                if callee not in index:
+                    index[callee] = low[callee] = len(index)
+                    stack.append(callee)
+                    on_stack.add(callee)
+                    work.append((callee, iter(calls[callee])))
+                    break
+                if callee in on_stack:
+                    low[node] = min(low[node], index[callee])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1 or node in calls[node]:
+                        recursive.update(component)
+                    order.extend(component)
+    return recursive, order
+
+
+def _single_exit(code, exit, fall):
+    """
+    Reescribe un bloque en posición de cola para que no tenga RET: cada
+    RET se reemplaza por 'exit' y lo que seguía a un IF que retorna pasa
+    a sus dos ramas. 'fall' cierra los caminos que llegan al final. None
+    si hay un RET dentro de un bucle.
+    """
+    out = []
+    index = 0
+    while index < len(code):
+        op = code[index][0]
+        if op == 'RET':
+            return out + exit
+        if op == 'LOOP':
+            _, end = _matching(code, index, 'LOOP', 'ENDLOOP')
+            if any(instr[0] == 'RET' for instr in code[index + 1:end]):
+                return None
+            out.extend(code[index:end + 1])
+            index = end + 1
+        elif op == 'IF':
+            else_at, end = _matching(code, index, 'IF', 'ENDIF', 'ELSE')
+            if not any(instr[0] == 'RET' for instr in code[index + 1:end]):
+                out.extend(code[index:end + 1])
+                index = end + 1
+                continue
+            rest = code[end + 1:]
+            then = _single_exit(code[index + 1:else_at if else_at is not None else end] + rest,
+                                exit, fall)
+            other = _single_exit((code[else_at + 1:end] if else_at is not None else []) + rest,
+                                 exit, fall)
+            if then is None or other is None:
+                return None
+            return out + [('IF',)] + then + [('ELSE',)] + other + [('ENDIF',)]
+        else:
+            out.append(code[index])
+            index += 1
+    return out + fall
+
+
+def _inline_body(func):
+    """
+    Código que reemplaza a 'CALL func' (los argumentos ya están en la
+    pila) y locales que agrega al llamador; None si no se puede expandir.
+    """
+    code = [tuple(instr) for instr in func.instructions]
+    returns = func.return_type != 'V'
+    if any(instr[0] == 'TAILCALL' for instr in code):
+        return None
+    ends_with_ret = bool(code) and code[-1][0] == 'RET'
+    body = code[:-1] if ends_with_ret else code
+    fall = [('CONSTI', 0)] if returns else []
+    if not any(instr[0] == 'RET' for instr in body):
+        body = body if ends_with_ret else body + fall
+        result_locals = {}
+    else:
+        result = [('LOCAL_SET', 'return')] if returns else []
+        body = _single_exit(code, result, fall + result)
+        if body is None:
+            return None
+        if returns:
+            body.append(('LOCAL_GET', 'return'))
+        result_locals = {'return': func.return_type} if returns else {}
+
+    read = {instr[1] for instr in body if instr[0] == 'LOCAL_GET'}
+    prologue = [('LOCAL_SET', param) for param in reversed(func.params)]
+    for name in func.locals:
+        if name not in func.params and name in read:
+            prologue += [('CONSTI', 0), ('LOCAL_SET', name)]
+
+    def renamed(instr):
+        if instr[0] in ('LOCAL_GET', 'LOCAL_SET'):
+            return (instr[0], f"{func.name}${instr[1]}")
+        return instr
+
+    locals_ = {f"{func.name}${name}": typ
+               for name, typ in {**func.locals, **result_locals}.items()}
+    return [renamed(instr) for instr in prologue + body], locals_
+
+
+def _stack_effect(instr, arities):
+    """Cambio de altura de la pila; los marcadores y RET la dejan en 0"""
+    op = instr[0]
+    if op in ('CALL', 'TAILCALL'):
+        arity = arities[instr[1]]
+        return arity.returns - arity.param_count
+    if op == 'INTRINSIC':
+        return 1 - INTRINSICS[instr[1]].arity
+    pops, pushes = STACK_EFFECTS.get(op, (0, 0))
+    return pushes - pops
+
+
+def _expand_calls(func, bodies, arities, inlined):
+    """Reemplaza las llamadas de func a funciones de 'bodies' por su cuerpo"""
+    out = []
+    height = 0
+    for instr in func.instructions:
+        op = instr[0]
+        if op in ('CALL', 'TAILCALL') and instr[1] in bodies:
+            code, locals_, structured = bodies[instr[1]]
+            if not structured or height == arities[instr[1]].param_count:
+                out.extend(code)
+                if op == 'TAILCALL':
+                    out.append(('RET',))
+                for name, typ in locals_.items():
+                    func.add_local(name, typ)
+                inlined[instr[1]] += 1
+                height += _stack_effect(instr, arities)
+                continue
+        out.append(instr)
+        if op in STRUCTURED_MARKERS or op in ('RET', 'TAILCALL'):
+            # El código generado no deja valores en la pila entre sentencias
+            height = 0
+        else:
+            height += _stack_effect(instr, arities)
+    func.instructions = out
+
+
+def inline_functions(module, max_size=INLINE_MAX_SIZE):
+    """Expande las llamadas a funciones chicas no recursivas; devuelve nombre -> sitios"""
+    by_name = {func.name: func for func in module.functions}
+    calls = {func.name: [instr[1] for instr in func.instructions
+                         if instr[0] in ('CALL', 'TAILCALL') and instr[1] in by_name]
+             for func in module.functions}
+    arities = {func.name: Arity(len(func.params), 0 if func.return_type == 'V' else 1)
+               for func in module.functions}
+    recursive, order = _call_graph_order(calls)
+
+    bodies = {}
+    inlined = Counter()
+    for name in order:
+        func = by_name[name]
+        _expand_calls(func, bodies, arities, inlined)
+        if name in recursive or name in ENTRY_POINTS:
+            continue
+        expansion = _inline_body(func)
+        if expansion is not None and len(expansion[0]) <= max_size:
+            code, locals_ = expansion
+            structured = any(instr[0] in STRUCTURED_MARKERS for instr in code)
+            bodies[name] = (code, locals_, structured)
+    return inlined
+
+
+def optimize_module(module, inline_limit=INLINE_MAX_SIZE):
+    """
+    Optimiza todas las funciones, expande las llamadas a funciones chicas
+    (inline_limit=0 lo desactiva) y quita las que quedan sin llamar;
+    devuelve nombre -> instrucciones eliminadas (negativo si el inlining
+    la hizo crecer; una función quitada cuenta todas las suyas y ya no
+    está en module.functions).
+    """
+    removed = {func.name: optimize_function(func) for func in module.functions}
+    if inline_limit:
+        inline_functions(module, inline_limit)
+        for func in module.functions:
+            removed[func.name] += optimize_function(func)
+    for name, count in remove_unused_functions(module).items():
+        removed[name] += count
+    return removed
@@ -0,0 +1,341 @@
+# loopopt.py - Optimizaciones de bucles LOOP / ENDLOOP
+'''
+Optimizaciones de bucles
+========================
+Pasadas sobre las funciones con bucles de un IRModule, después de
+iropt.optimize_module:
+
+  - hoist_invariants(): LICM sobre la forma SSA de cfg.py. Las
+    operaciones cuyos argumentos no cambian dentro del bucle pasan al
+    bloque que termina en LOOP (el preheader) y se calculan una sola
+    vez. Como el preheader corre aunque el bucle no dé ninguna vuelta,
+    solo se mueve lo que no puede fallar: FLOATING_OPS, divisiones por
+    una constante distinta de cero y GLOBAL_GET de globales que el
+    bucle no escribe (si el bucle no llama a nadie).
+  - reduce_strength(): para una variable de inducción i (un PHI de la
+    cabecera que avanza de a una constante s) cada i * k se reemplaza
+    por un PHI nuevo que empieza en i0 * k y avanza de a s * k. En esta
+    máquina MULI y ADDI cuestan un despacho cada una, así que solo se
+    aplica si alguna de las multiplicaciones corre en todas las vueltas
+    (la suma nueva también). i * i no se reduce: necesita dos
+    recurrencias y ejecutaría más instrucciones que la multiplicación.
+  - unroll_loops(): desenrolla bucles internos chicos con cantidad de
+    vueltas conocida al compilar (condición 'i < C' sobre una variable
+    que empieza en una constante y avanza de a una constante, sin break
+    ni continue). Con T vueltas y factor U, copia T % U veces el cuerpo
+    antes del bucle y U veces dentro, con una sola comprobación por
+    grupo; si T <= U el bucle desaparece. Es opcional (unroll=0).
+
+optimize_loops() hace el viaje de ida y vuelta a SSA solo en las
+funciones que tienen bucles, y de paso propaga las copias entre locales
+que dejó el inlining (mod$a, mod$b, ...).
+'''
+from collections import Counter
+
+from cfg import FLOATING_OPS, SSAError, build_ssa, function_arities
+from iropt import CONST_OPS, STRUCTURED_MARKERS, optimize_function
+from verifier import STACK_EFFECTS
+
+UNROLL_MAX_SIZE = 24
+
+_DIVISIONS = ('DIVI', 'MODI', 'DIVF')
+
+_COMPARISONS = ('EQI', 'NEI', 'LTI', 'LEI', 'GTI', 'GEI', 'EQF', 'NEF')
+
+
+# ---------- LICM ----------
+def _hoistable(cfg, instr, written, calls):
+    op = instr.op
+    if op in FLOATING_OPS:
+        return True
+    if op in _DIVISIONS:
+        divisor = cfg.defs[instr.args[1]]
+        return divisor.op in CONST_OPS and divisor.operands[0] != 0
+    if op == 'GLOBAL_GET':
+        return not calls and instr.operands[0] not in written
+    return False
+
+
+def hoist_invariants(cfg):
+    """Mueve al preheader las operaciones invariantes; devuelve cuántas"""
+    moved = 0
+    for loop in cfg.loops():
+        instrs = [(index, instr) for index in cfg.reachable if index in loop.blocks
+                  for instr in cfg.blocks[index].instrs]
+        written = {instr.operands[0] for _, instr in instrs if instr.op == 'GLOBAL_SET'}
+        calls = any(instr.op in ('CALL', 'TAILCALL') for _, instr in instrs)
+        inside = {instr.dest for _, instr in instrs if instr.dest is not None}
+        inside.update(phi.dest for index in loop.blocks for phi in cfg.blocks[index].phis)
+
+        invariant = {}
+        for index, instr in instrs:
+            if (instr.dest is not None and _hoistable(cfg, instr, written, calls)
+                    and all(arg not in inside or arg in invariant
+                            or cfg.defs[arg].op in CONST_OPS for arg in instr.args)):
+                invariant[instr.dest] = (index, instr)
+
+        # Lo que vale la pena, con los invariantes que usa: operaciones con
+        # algún argumento no constante (las constantes se pliegan después).
+        # Una comparación de locales y constantes no: con peephole.py
+        # cuesta lo mismo que leer su resultado de un local
+        chosen = set()
+        pending = [value for value, (_, instr) in invariant.items()
+                   if any(cfg.defs[arg].op not in CONST_OPS for arg in instr.args)
+                   and (instr.op not in _COMPARISONS
+                        or any(arg in invariant for arg in instr.args))]
+        while pending:
+            value = pending.pop()
+            if value not in chosen:
+                chosen.add(value)
+                pending.extend(arg for arg in invariant[value][1].args if arg in invariant)
+
+        preheader = cfg.blocks[loop.preheader]
+        for value, (index, instr) in invariant.items():
+            if value in chosen:
+                cfg.blocks[index].instrs.remove(instr)
+                preheader.instrs.append(instr)
+                moved += 1
+    return moved
+
+
+# ---------- reducción de fuerza ----------
+def _induction_variables(cfg, loop):
+    """PHI de la cabecera -> (valor inicial, paso, SSAInstr del siguiente valor)"""
+    ivs = {}
+    for phi in cfg.blocks[loop.header].phis:
+        outside = phi.incoming.get(loop.preheader)
+        inside = {value for pred, value in phi.incoming.items() if pred in loop.blocks}
+        if outside is None or len(inside) != 1:
+            continue
+        step = cfg.defs[inside.pop()]
+        if step.op not in ('ADDI', 'SUBI') or len(step.args) != 2:
+            continue
+        a, b = (cfg.defs[arg] for arg in step.args)
+        if step.args[0] == phi.dest and b.op == 'CONSTI':
+            amount = b.operands[0]
+        elif step.op == 'ADDI' and step.args[1] == phi.dest and a.op == 'CONSTI':
+            amount = a.operands[0]
+        else:
+            continue
+        ivs[phi.dest] = (outside, amount if step.op == 'ADDI' else -amount, step)
+    return ivs
+
+
+def _block_of(cfg, blocks):
+    return {instr.dest: index for index in blocks
+            for instr in cfg.blocks[index].instrs if instr.dest is not None}
+
+
+def reduce_strength(cfg):
+    """Reemplaza i * k por variables de inducción derivadas; devuelve cuántas se crearon"""
+    created = 0
+    for loop in cfg.loops():
+        ivs = _induction_variables(cfg, loop)
+        if not ivs:
+            continue
+        after = {step.dest: phi for phi, (_, _, step) in ivs.items()}
+        where = _block_of(cfg, loop.blocks)
+
+        # (phi, k) -> [(multiplicación, True si usa el valor ya incrementado)]
+        products = {}
+        for index in loop.blocks:
+            for instr in cfg.blocks[index].instrs:
+                if instr.op != 'MULI':
+                    continue
+                for var, factor in (instr.args, instr.args[::-1]):
+                    constant = cfg.defs[factor]
+                    if constant.op != 'CONSTI':
+                        continue
+                    if var in ivs:
+                        products.setdefault((var, constant.operands[0]), []).append((instr, False))
+                        break
+                    if var in after:
+                        products.setdefault((after[var], constant.operands[0]), []).append((instr, True))
+                        break
+
+        preheader = cfg.blocks[loop.preheader]
+        for (phi, factor), muls in products.items():
+            initial, amount, step = ivs[phi]
+            step_block = where[step.dest]
+            if not any(cfg.dominates(where[mul.dest], step_block) for mul, _ in muls):
+                continue
+
+            start = cfg.defs[initial]
+            if start.op == 'CONSTI':
+                first = cfg.insert(preheader, len(preheader.instrs), 'CONSTI',
+                                   operands=(start.operands[0] * factor,))
+            else:
+                k = cfg.insert(preheader, len(preheader.instrs), 'CONSTI', operands=(factor,))
+                first = cfg.insert(preheader, len(preheader.instrs), 'MULI', (initial, k))
+            increment = cfg.insert(preheader, len(preheader.instrs), 'CONSTI',
+                                   operands=(amount * factor,))
+
+            derived = cfg.add_phi(cfg.blocks[loop.header], f"{cfg.defs[phi].var}*{factor}")
+            block = cfg.blocks[step_block]
+            position = block.instrs.index(step) + 1
+            following = cfg.insert(block, position, 'ADDI', (derived.dest, increment))
+            for pred in cfg.blocks[loop.header].preds:
+                derived.incoming[pred.id] = first if pred.id == loop.preheader else following
+
+            for mul, incremented in muls:
+                cfg.replace_uses(mul.dest, following if incremented else derived.dest)
+            created += 1
+    return created
+
+
+# ---------- desenrollado ----------
+_MIRRORED = {'LTI': 'GTI', 'LEI': 'GEI', 'GTI': 'LTI', 'GEI': 'LEI', 'NEI': 'NEI'}
+
+
+def _trip_count(compare, start, limit, step):
+    """Vueltas de 'while (i compare limit) { ...; i = i + step; }', o None"""
+    if step == 0:
+        return None
+    if compare in ('LTI', 'LEI') and step > 0:
+        span = limit - start + (1 if compare == 'LEI' else 0)
+        return max(0, -(-span // step))
+    if compare in ('GTI', 'GEI') and step < 0:
+        span = start - limit + (1 if compare == 'GEI' else 0)
+        return max(0, -(-span // -step))
+    if compare == 'NEI' and (limit - start) % step == 0 and (limit - start) // step >= 0:
+        return (limit - start) // step
+    return None
+
+
+def _loop_condition(code):
+    """(GET, variable, comparación, límite) de 'LOOP; i < C; CBREAK', o None"""
+    if len(code) < 4 or code[3] != ('CBREAK',) or code[2][0] not in _MIRRORED:
+        return None
+    first, second, compare = code[0], code[1], code[2][0]
+    if first[0] in ('LOCAL_GET', 'GLOBAL_GET') and second[0] == 'CONSTI':
+        return first[0], first[1], compare, second[1]
+    if second[0] in ('LOCAL_GET', 'GLOBAL_GET') and first[0] == 'CONSTI':
+        return second[0], second[1], _MIRRORED[compare], first[1]
+    return None
+
+
+def _step(body, get, name):
+    """Paso de la única asignación a 'name' del cuerpo, fuera de todo IF; o None"""
+    setter = 'LOCAL_SET' if get == 'LOCAL_GET' else 'GLOBAL_SET'
+    writes = [index for index, instr in enumerate(body) if instr == (setter, name)]
+    if len(writes) != 1 or writes[0] < 3:
+        return None
+    index = writes[0]
+    depth = 0
+    for instr in body[:index]:
+        depth += instr[0] == 'IF'
+        depth -= instr[0] == 'ENDIF'
+    load, constant, op = body[index - 3:index]
+    if depth or load != (get, name) or constant[0] != 'CONSTI' or op[0] not in ('ADDI', 'SUBI'):
+        return None
+    return constant[1] if op[0] == 'ADDI' else -constant[1]
+
+
+def _initial_value(code, name, setter, value=None):
+    """Constante que 'code' (en línea recta) deja en 'name' al final, o None"""
+    stack = []
+    for instr in code:
+        op = instr[0]
+        if op in CONST_OPS:
+            stack.append(instr[1])
+        elif op == setter and instr[1] == name:
+            value = stack.pop() if stack else None
+        elif op in STACK_EFFECTS:
+            pops, pushes = STACK_EFFECTS[op]
+            if pops > len(stack):
+                stack = []
+            else:
+                del stack[len(stack) - pops:]
+            stack.extend([None] * pushes)
+        else:
+            # CALL / TAILCALL: aridad desconocida aquí, y puede escribir globales
+            stack = []
+            if setter == 'GLOBAL_SET':
+                value = None
+    return value
+
+
+def unroll_loops(func, factor, max_size=UNROLL_MAX_SIZE):
+    """Desenrolla los bucles internos con vueltas conocidas; devuelve cuántos"""
+    code = list(func.instructions)
+    unrolled = 0
+    index = 0
+    while index < len(code):
+        if code[index][0] != 'LOOP':
+            index += 1
+            continue
+        end = index + 1
+        while end < len(code) and code[end][0] not in ('LOOP', 'ENDLOOP'):
+            end += 1
+        replacement = None
+        if end < len(code) and code[end][0] == 'ENDLOOP':
+            replacement = _unrolled(code, index, end, factor, max_size, func.params)
+        if replacement is None:
+            index += 1
+            continue
+        code[index:end + 1] = replacement
+        index += len(replacement)
+        unrolled += 1
+    func.instructions = code
+    return unrolled
+
+
+def _unrolled(code, start, end, factor, max_size, params):
+    condition = _loop_condition(code[start + 1:end])
+    if condition is None:
+        return None
+    get, name, compare, limit = condition
+    body = code[start + 5:end]
+    if (len(body) > max_size
+            or any(instr[0] in ('CBREAK', 'CONTINUE') for instr in body)
+            or (get == 'GLOBAL_GET' and any(instr[0] in ('CALL', 'TAILCALL') for instr in body))):
+        return None
+    step = _step(body, get, name)
+    if step is None:
+        return None
+
+    # Valor inicial: la línea recta desde el último marcador antes del LOOP
+    region = start
+    while region > 0 and code[region - 1][0] not in STRUCTURED_MARKERS:
+        region -= 1
+    setter = 'LOCAL_SET' if get == 'LOCAL_GET' else 'GLOBAL_SET'
+    # Un local que no se asignó antes en la función todavía vale 0
+    unset = 0 if region == 0 and get == 'LOCAL_GET' and name not in params else None
+    initial = _initial_value(code[region:start], name, setter, unset)
+    if initial is None:
+        return None
+    trips = _trip_count(compare, initial, limit, step)
+    if trips is None or trips < 2:
+        return None
+
+    if trips <= factor:
+        return body * trips
+    return body * (trips % factor) + code[start:start + 5] + body * factor + [('ENDLOOP',)]
+
+
+# ---------- módulo ----------
+def optimize_loops(module, unroll=0, max_size=UNROLL_MAX_SIZE):
+    """
+    Aplica LICM y reducción de fuerza a las funciones con bucles y, si
+    unroll > 1, desenrolla con ese factor. Devuelve un Counter con
+    'hoisted', 'reduced' y 'unrolled'.
+    """
+    stats = Counter()
+    arities = function_arities(module)
+    for func in module.functions:
+        if not any(instr[0] == 'LOOP' for instr in func.instructions):
+            continue
+        try:
+            cfg = build_ssa(func, arities)
+        except SSAError:
+            continue
+        stats['hoisted'] += hoist_invariants(cfg)
+        stats['reduced'] += reduce_strength(cfg)
+        cfg.remove_dead()
+        lowered = cfg.to_function()
+        func.instructions = lowered.instructions
+        func.locals = lowered.locals
+        optimize_function(func)
+        if unroll > 1:
+            stats['unrolled'] += unroll_loops(func, unroll, max_size)
+    return stats
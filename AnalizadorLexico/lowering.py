@@ -0,0 +1,84 @@
+# lowering.py - Resolución de saltos del IR estructurado
+'''
+Lowering de control de flujo
+============================
+El IRCodeGenerator emite control de flujo estructurado con marcadores
+(IF / ELSE / ENDIF, LOOP / CBREAK / ENDLOOP, CONTINUE). Ejecutarlos tal
+cual obliga a la máquina a buscar el marcador correspondiente en cada
+rama no tomada y a mantener una pila de bucles en tiempo de ejecución.
+
+Este módulo resuelve esos marcadores una sola vez, antes de ejecutar,
+y los reemplaza por saltos absolutos con el destino ya calculado:
+
+    JUMP   destino    # salto incondicional
+    JUMPZ  destino    # desapila la condición y salta si es 0
+
+Los marcadores ENDIF y LOOP no generan código: solo fijan el destino
+de los saltos que los referencian.
+'''
+
+STRUCTURED_OPS = {'IF', 'ELSE', 'ENDIF', 'LOOP', 'CBREAK', 'ENDLOOP', 'CONTINUE'}
+
+# Instrucciones cuyo primer operando es un índice de instrucción
+JUMP_OPS = {'JUMP', 'JUMPZ'}
+
+
+def resolve_jumps(instructions):
+    """
+    Convierte una lista de instrucciones con marcadores estructurados
+    en una lista equivalente con saltos absolutos.
+    """
+    out = []
+    control = []    # [tipo, índice del salto pendiente | inicio del bucle, breaks]
+
+    for instr in instructions:
+        if not instr:
+            continue
+        op = instr[0]
+
+        if op == 'IF':
+            control.append(['IF', len(out), None])
+            out.append(['JUMPZ', None])
+        elif op == 'ELSE':
+            entry = _innermost(control, 'IF', op)
+            out.append(['JUMP', None])
+            out[entry[1]][1] = len(out)
+            entry[1] = len(out) - 1
+        elif op == 'ENDIF':
+            entry = _innermost(control, 'IF', op)
+            if control[-1] is not entry:
+                raise RuntimeError("ENDIF sin IF correspondiente")
+            control.pop()
+            out[entry[1]][1] = len(out)
+        elif op == 'LOOP':
+            control.append(['LOOP', len(out), []])
+        elif op == 'CBREAK':
+            entry = _innermost(control, 'LOOP', op)
+            entry[2].append(len(out))
+            out.append(['JUMPZ', None])
+        elif op == 'CONTINUE':
+            entry = _innermost(control, 'LOOP', op)
+            out.append(['JUMP', entry[1]])
+        elif op == 'ENDLOOP':
+            entry = _innermost(control, 'LOOP', op)
+            if control[-1] is not entry:
+                raise RuntimeError("ENDLOOP sin LOOP correspondiente")
+            control.pop()
+            out.append(['JUMP', entry[1]])
+            for index in entry[2]:
+                out[index][1] = len(out)
+        else:
+            out.append(instr)
+
+    if control:
+        raise RuntimeError(f"{control[-1][0]} sin cierre correspondiente")
+
+    return [tuple(instr) for instr in out]
+
+
+def _innermost(control, kind, op):
+    """Busca la estructura abierta más interna del tipo indicado"""
+    for entry in reversed(control):
+        if entry[0] == kind:
+            return entry
+    raise RuntimeError(f"{op} sin {kind} correspondiente")
@@ -6,21 +6,73 @@ from check import Checker
 from ast_utility import generate_json_output, save_ast_graph
 from symtab_utility import save_symbol_table_json
 from ircode import IRCodeGenerator
-from stack_machine import StackMachine  # Nueva máquina de pila
+from iropt import optimize_module
+from loopopt import optimize_loops
+from consteval import (EVAL_BUDGET, OUTPUT, PURE, evaluate_calls, function_purity,
+                       mark_pure_functions)
+from goxc import write_goxc
+from cfg import module_to_dot
+from stack_machine import StackMachine, MEMORY_KINDS, MEMO_SIZE  # Nueva máquina de pila
+from pybackend import PythonEngine
+from register_vm import RegisterMachine
+from profiler import Profiler
+
+ENGINES = ("stack", "python", "register")
+
+
+def get_option(name, default=None):
+    """Lee opciones de la forma '--nombre=valor' o '--nombre valor'"""
+    for i, arg in enumerate(sys.argv):
+        if arg.startswith(name + "="):
+            return arg.split("=", 1)[1]
+        if arg == name and i + 1 < len(sys.argv):
+            return sys.argv[i + 1]
+    return default
 
 def main():
     if len(sys.argv) < 2:
         print("Uso: python main.py archivo.gox [opciones]")
+        print("     python main.py archivo.goxc   (ejecuta un modulo compilado)")
         print("   Opciones:")
         print("     --execute     : Ejecuta con Stack Machine")
         print("     --vm-debug    : Ejecuta con informacion de debug")
         print("     --compare-vm  : Compara VM vieja vs Stack Machine")
+        print("     --engine=X    : Motor de ejecucion: stack (defecto), python o register")
+        print("     --memory=X    : Memoria lineal: flat (defecto) o paged")
+        print("     --profile     : Perfil por opcode/función/instrucción (profile.folded)")
+        print("     --cfg         : Guarda el CFG en SSA de cada función en cfg.dot")
+        print("     --eval-budget=N : Instrucciones por llamada evaluada al compilar (0 desactiva)")
+        print("     --eval-pure   : Evalua al compilar solo funciones puras (sin print)")
+        print("     --memo=N      : Entradas del cache de funciones puras en la Stack Machine (0 desactiva)")
+        print("     --batch=G:ARCH : Ejecuta por lotes, un valor del global G por linea de ARCH (NumPy)")
+        print("     --unroll=N    : Desenrolla bucles con cantidad de vueltas conocida (factor N)")
+        print("     -O0           : Sin optimizaciones del IR")
         return
 
     filepath = sys.argv[1]
     should_execute = "--execute" in sys.argv
     debug_mode = "--vm-debug" in sys.argv
     compare_vms = "--compare-vm" in sys.argv
+    profiler = Profiler() if "--profile" in sys.argv else None
+    optimize = "-O0" not in sys.argv
+    dump_cfg = "--cfg" in sys.argv
+    should_execute = should_execute or profiler is not None
+    engine = get_option("--engine", "stack")
+    if engine not in ENGINES:
+        print(f"ERROR: motor desconocido '{engine}' (opciones: {', '.join(ENGINES)})")
+        return
+    memory_kind = get_option("--memory", "flat")
+    if memory_kind not in MEMORY_KINDS:
+        print(f"ERROR: memoria desconocida '{memory_kind}' "
+              f"(opciones: {', '.join(MEMORY_KINDS)})")
+        return
+    memory_class = MEMORY_KINDS[memory_kind]
+    memo_size = int(get_option("--memo", MEMO_SIZE))
+    batch_spec = get_option("--batch")
+
+    if filepath.endswith(".goxc"):
+        run_compiled(filepath, debug_mode, memory_class())
+        return
 
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
@@ -88,12 +140,46 @@ def main():
     try:
         ir_generator = IRCodeGenerator()
         module_ir = ir_generator.generate(ast.decls)
+        if optimize:
+            removed = optimize_module(module_ir)
+            kept = {func.name for func in module_ir.functions}
+            for name, count in removed.items():
+                if name not in kept:
+                    print(f"    Optimizacion: {name}: funcion sin llamadas eliminada")
+                elif count:
+                    print(f"    Optimizacion: {name}: {-count:+d} instrucciones")
+            budget = int(get_option("--eval-budget", EVAL_BUDGET))
+            if batch_spec:
+                # Al compilar se usaría el valor inicial del global, no las entradas
+                budget = 0
+            if budget > 0:
+                purity = function_purity(module_ir)
+                evaluated = evaluate_calls(module_ir, budget,
+                                           allow_output="--eval-pure" not in sys.argv)
+                if evaluated['replaced'] or evaluated['failed']:
+                    print(f"    Evaluacion: {evaluated['replaced']} llamadas evaluadas al compilar "
+                          f"({evaluated['spent']} instrucciones, {evaluated['failed']} "
+                          f"sin terminar con presupuesto {budget})")
+                    for label, level in (("puras", PURE), ("con salida", OUTPUT)):
+                        names = [name for name, value in purity.items() if value == level]
+                        print(f"      Funciones {label}: {', '.join(names) or '-'}")
+            loops = optimize_loops(module_ir, unroll=int(get_option("--unroll", 0)))
+            if any(loops.values()):
+                print(f"    Bucles: {loops['hoisted']} invariantes movidas, "
+                      f"{loops['reduced']} reducciones de fuerza, "
+                      f"{loops['unrolled']} desenrollados")
+        mark_pure_functions(module_ir)
         ir_content = module_ir.dump()
         
         # Guardar IR
         with open("output.ir", "w", encoding="utf-8") as f:
             f.write(ir_content)
-        print("    OK: IR generado y guardado en 'output.ir'")
+        write_goxc(module_ir, "output.goxc")
+        print("    OK: IR generado y guardado en 'output.ir' y 'output.goxc'")
+        if dump_cfg:
+            with open("cfg.dot", "w", encoding="utf-8") as f:
+                f.write(module_to_dot(module_ir))
+            print("    OK: CFG guardado en 'cfg.dot'")
     except Exception as e:
         print(f"    ERROR generando IR: {e}")
         return
@@ -136,8 +222,8 @@ def main():
         # Stack Machine Nueva
         print("Ejecutando con Stack Machine:")
         try:
-            new_vm = StackMachine()
-            new_vm.load_ir_from_string(ir_content)
+            new_vm = StackMachine(memory=memory_class())
+            new_vm.load_module(module_ir)
             new_vm.run("main")
         except Exception as e:
             print(f"    ERROR en Stack Machine: {e}")
@@ -145,13 +231,81 @@ def main():
                 print(f"    Stack trace: {new_vm.get_stack_trace()}")
                 print(f"    Estado: {new_vm.debug_state()}")
     
+    elif batch_spec:
+        print("\n[6/6] Ejecutando por lotes...")
+        print("=" * 60)
+        
+        try:
+            from batch_vm import BatchMachine  # Requiere NumPy
+            name, _, filename = batch_spec.partition(":")
+            with open(filename, "r", encoding="utf-8") as f:
+                values = [int(line) for line in f if line.strip()]
+            batch = BatchMachine()
+            batch.load_module(module_ir)
+            outputs = batch.run({name: values})
+            
+            for lane, (value, text) in enumerate(zip(values, outputs)):
+                print(f"--- {name} = {value} ---")
+                print(text, end="" if text.endswith("\n") or not text else "\n")
+                if lane in batch.errors:
+                    print(f"ERROR: {batch.errors[lane]}")
+            
+            print(f"\nEJECUCION COMPLETADA: {len(values)} entradas, {len(batch.errors)} con error")
+            
+        except Exception as e:
+            print(f"\nERROR durante la ejecucion: {e}")
+    
+    elif should_execute and engine == "python":
+        print("\n[6/6] Ejecutando con el backend Python...")
+        print("=" * 60)
+        
+        try:
+            py_engine = PythonEngine(memory=memory_class())
+            py_engine.load_module(module_ir)
+            
+            if debug_mode:
+                print("Codigo Python generado:")
+                print(py_engine.source)
+            
+            py_engine.run("main")
+            
+            if debug_mode:
+                print(f"\nGlobales finales: {py_engine.globals}")
+            
+            print("\nEJECUCION COMPLETADA EXITOSAMENTE")
+            
+        except Exception as e:
+            print(f"\nERROR durante la ejecucion: {e}")
+    
+    elif should_execute and engine == "register":
+        print("\n[6/6] Ejecutando con la maquina de registros...")
+        print("=" * 60)
+        
+        try:
+            register_vm = RegisterMachine(memory=memory_class())
+            register_vm.load_module(module_ir)
+            
+            if debug_mode:
+                print("Codigo de registros:")
+                print(register_vm.dump())
+            
+            register_vm.run("main")
+            
+            if debug_mode:
+                print(f"\nGlobales finales: {register_vm.globals}")
+            
+            print("\nEJECUCION COMPLETADA EXITOSAMENTE")
+            
+        except Exception as e:
+            print(f"\nERROR durante la ejecucion: {e}")
+    
     elif should_execute:
         print("\n[6/6] Ejecutando con Stack Machine...")
         print("=" * 60)
         
         try:
-            vm = StackMachine()
-            vm.load_ir_from_string(ir_content)
+            vm = StackMachine(memory=memory_class(), memoize=memo_size)
+            vm.load_module(module_ir)
             
             if debug_mode:
                 print("Funciones cargadas:")
@@ -159,11 +313,22 @@ def main():
                     print(f"    • {func_name}")
                 print()
             
-            vm.run("main")
+            vm.run("main", profiler=profiler)
             
             if debug_mode:
                 print(f"\nEstado final: {vm.debug_state()}")
             
+            for name, (hits, misses, size) in vm.memo_stats().items():
+                if hits:
+                    print(f"    Memo {name}: {hits} aciertos, {misses} fallos ({size} entradas)")
+            
+            if profiler is not None:
+                print("\nPERFIL DE EJECUCION")
+                print("=" * 60)
+                print(profiler.report(instructions=vm.functions))
+                profiler.write_collapsed("profile.folded")
+                print("\n    OK: Pilas colapsadas guardadas en 'profile.folded'")
+            
             print("\nEJECUCION COMPLETADA EXITOSAMENTE")
             
         except Exception as e:
@@ -179,6 +344,25 @@ def main():
         print("   python main.py archivo.gox --execute")
         print("   python main.py archivo.gox --vm-debug")
         print("   python main.py archivo.gox --compare-vm")
+        print("   python main.py archivo.gox --execute --engine=python")
+        print("   python main.py archivo.gox --profile")
+
+
+def run_compiled(filepath, debug_mode=False, memory=None):
+    """Ejecuta un modulo .goxc sin volver a compilar"""
+    vm = StackMachine(memory=memory)
+    try:
+        vm.load_goxc(filepath)
+        vm.run("main")
+        if debug_mode:
+            print(f"\nFunciones decodificadas: {vm.module_file.decoded_count}"
+                  f"/{len(vm.functions)}")
+            print(f"Estado final: {vm.debug_state()}")
+    except Exception as e:
+        print(f"\nERROR durante la ejecucion: {e}")
+        if debug_mode:
+            print(f"\nStack trace de la VM:")
+            print(vm.get_stack_trace())
 
 
 if __name__ == "__main__":
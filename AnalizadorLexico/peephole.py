@@ -0,0 +1,115 @@
+# peephole.py - Superinstrucciones sobre el código con saltos resueltos
+'''
+Peephole
+========
+Reescribe secuencias frecuentes del código ya bajado por lowering.py
+(saltos absolutos) en superinstrucciones, para pagar un solo despacho
+donde antes había varios:
+
+    LOCAL_GET x; CONSTI k; ADDI; LOCAL_SET x   ->  INC_LOCAL x k
+    LOCAL_GET x; CONSTI k; SUBI; LOCAL_SET x   ->  INC_LOCAL x -k
+    LTI; JUMPZ t                               ->  JUMP_IF_GE t
+    (igual para EQI, NEI, LEI, GTI, GEI)
+    LOCAL_GET a; LOCAL_GET b                   ->  LOCAL_GET2 a b
+    LOCAL_GET x; CONSTI k                      ->  LOCAL_CONST x k
+    (y las mismas dos formas con GLOBAL_GET / GLOBAL_SET:
+     INC_GLOBAL g k, GLOBAL_CONST g k)
+
+Los patrones viven en la tabla FUSIONS y se prueban en orden, así que
+basta agregar una entrada (y su handler en la máquina) para fusionar
+una secuencia nueva; hot_sequences() lista las secuencias más
+ejecutadas según un profiler.Profiler para elegir candidatas.
+
+Nunca se fusiona a través de un destino de salto: solo la primera
+instrucción de una secuencia puede recibir saltos. Los destinos se
+reubican al índice nuevo de cada instrucción.
+'''
+from collections import Counter, namedtuple
+
+from lowering import JUMP_OPS
+
+
+# pattern: opcodes consecutivos; build(instrucciones) -> operandos, o None si no aplica
+Fusion = namedtuple('Fusion', 'name pattern build')
+
+
+def _increment(sign):
+    def build(seq):
+        get, const, _, set_ = seq
+        if get[1] != set_[1]:
+            return None
+        return (get[1], sign * int(const[1]))
+    return build
+
+
+def _branch(seq):
+    return (seq[1][1],)
+
+
+def _pair(seq):
+    return (seq[0][1], seq[1][1])
+
+
+# La comparación que se niega: JUMPZ salta cuando la comparación da 0
+_BRANCHES = {'EQI': 'JUMP_IF_NE', 'NEI': 'JUMP_IF_EQ', 'LTI': 'JUMP_IF_GE',
+             'LEI': 'JUMP_IF_GT', 'GTI': 'JUMP_IF_LE', 'GEI': 'JUMP_IF_LT'}
+
+FUSIONS = [
+    Fusion('INC_LOCAL', ('LOCAL_GET', 'CONSTI', 'ADDI', 'LOCAL_SET'), _increment(1)),
+    Fusion('INC_LOCAL', ('LOCAL_GET', 'CONSTI', 'SUBI', 'LOCAL_SET'), _increment(-1)),
+    Fusion('INC_GLOBAL', ('GLOBAL_GET', 'CONSTI', 'ADDI', 'GLOBAL_SET'), _increment(1)),
+    Fusion('INC_GLOBAL', ('GLOBAL_GET', 'CONSTI', 'SUBI', 'GLOBAL_SET'), _increment(-1)),
+    *[Fusion(name, (compare, 'JUMPZ'), _branch) for compare, name in _BRANCHES.items()],
+    Fusion('LOCAL_GET2', ('LOCAL_GET', 'LOCAL_GET'), _pair),
+    Fusion('LOCAL_CONST', ('LOCAL_GET', 'CONSTI'), _pair),
+    Fusion('GLOBAL_CONST', ('GLOBAL_GET', 'CONSTI'), _pair),
+]
+
+# Superinstrucciones cuyo operando es un destino de salto
+FUSED_JUMPS = set(_BRANCHES.values())
+
+
+def fuse(instructions, fusions=FUSIONS):
+    """Devuelve el código con las superinstrucciones aplicadas y los saltos reubicados"""
+    jumps = JUMP_OPS | FUSED_JUMPS
+    targets = {instr[1] for instr in instructions if instr[0] in jumps}
+
+    out = []
+    new_index = []   # índice viejo -> índice nuevo
+    ip = 0
+    size = len(instructions)
+    while ip < size:
+        for fusion in fusions:
+            length = len(fusion.pattern)
+            seq = instructions[ip:ip + length]
+            if (len(seq) == length
+                    and all(instr[0] == op for instr, op in zip(seq, fusion.pattern))
+                    and not any(ip + k in targets for k in range(1, length))):
+                operands = fusion.build(seq)
+                if operands is not None:
+                    new_index.extend([len(out)] * length)
+                    out.append((fusion.name,) + tuple(operands))
+                    ip += length
+                    break
+        else:
+            new_index.append(len(out))
+            out.append(tuple(instructions[ip]))
+            ip += 1
+    new_index.append(len(out))   # saltos al final del código
+
+    return [(instr[0], new_index[instr[1]]) + tuple(instr[2:])
+            if instr[0] in jumps else instr
+            for instr in out]
+
+
+def hot_sequences(profiler, functions, length=2, top=10):
+    """
+    Secuencias de 'length' opcodes más ejecutadas, según los hits de un
+    profiler sobre 'functions' (nombre -> código con saltos resueltos).
+    """
+    counts = Counter()
+    for (function, ip), hits in profiler.hits.items():
+        code = functions.get(function, ())
+        if ip + length <= len(code):
+            counts[tuple(instr[0] for instr in code[ip:ip + length])] += hits
+    return counts.most_common(top)
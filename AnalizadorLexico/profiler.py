@@ -0,0 +1,100 @@
+# profiler.py - Profiler de la Stack Machine
+'''
+Profiler
+========
+Estadísticas de una ejecución de StackMachine.run(..., profiler=p):
+
+  - por opcode: veces ejecutado y tiempo acumulado de su handler,
+  - por función: llamadas, tiempo inclusivo (con lo que llama) y
+    exclusivo (solo sus propias instrucciones),
+  - por instrucción: veces que se ejecutó cada (función, ip),
+  - pilas colapsadas ('main;_actual_main;f 1234') para flame graphs.
+
+La máquina usa un bucle aparte cuando recibe un profiler, así que el
+bucle normal no tiene ningún costo extra. Los ip se refieren al código
+con los saltos ya resueltos (lowering.py).
+'''
+import time
+from collections import Counter, defaultdict
+
+
+class Profiler:
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.opcode_counts = Counter()
+        self.opcode_time = defaultdict(float)
+        self.calls = Counter()
+        self.inclusive = defaultdict(float)
+        self.exclusive = defaultdict(float)
+        self.hits = Counter()                 # (función, ip) -> ejecuciones
+        self.stack_time = defaultdict(float)  # 'a;b;c' -> tiempo exclusivo
+        self.total_time = 0.0
+        self._frames = []                     # [función, inicio, clave de pila]
+        self._active = Counter()              # activaciones abiertas por función
+
+    # ---------- eventos del bucle de la máquina ----------
+    def enter(self, function, now):
+        self.calls[function] += 1
+        self._active[function] += 1
+        key = f"{self._frames[-1][2]};{function}" if self._frames else function
+        self._frames.append([function, now, key])
+
+    def leave(self, now):
+        function, start, _ = self._frames.pop()
+        self._active[function] -= 1
+        # En recursión solo cuenta la activación más externa
+        if not self._active[function]:
+            self.inclusive[function] += now - start
+
+    def instruction(self, function, ip, op, elapsed):
+        self.opcode_counts[op] += 1
+        self.opcode_time[op] += elapsed
+        self.hits[(function, ip)] += 1
+        self.exclusive[function] += elapsed
+        self.stack_time[self._frames[-1][2]] += elapsed
+
+    def finish(self, now, start):
+        while self._frames:
+            self.leave(now)
+        self.total_time += now - start
+
+    # ---------- exportación ----------
+    def report(self, top=15, instructions=None):
+        """
+        Reporte de texto. 'instructions' (nombre -> lista de instrucciones)
+        permite mostrar el texto de las instrucciones más ejecutadas.
+        """
+        total = self.total_time or 1e-12
+        lines = [f"Tiempo total: {self.total_time:.4f} s, "
+                 f"{sum(self.opcode_counts.values()):,} instrucciones", ""]
+
+        lines.append(f"{'opcode':<12} {'veces':>12} {'tiempo (s)':>11} {'%':>6}")
+        for op, count in self.opcode_counts.most_common(top):
+            spent = self.opcode_time[op]
+            lines.append(f"{op:<12} {count:>12,} {spent:>11.4f} {100 * spent / total:>6.1f}")
+
+        lines.append("")
+        lines.append(f"{'función':<20} {'llamadas':>10} {'inclusivo':>10} {'exclusivo':>10}")
+        for function in sorted(self.calls, key=lambda f: -self.inclusive[f])[:top]:
+            lines.append(f"{function:<20} {self.calls[function]:>10,} "
+                         f"{self.inclusive[function]:>10.4f} {self.exclusive[function]:>10.4f}")
+
+        lines.append("")
+        lines.append(f"{'instrucción':<41} {'veces':>12}")
+        for (function, ip), count in self.hits.most_common(top):
+            text = ""
+            code = instructions.get(function) if instructions is not None else None
+            if code is not None:
+                text = " ".join(str(part) for part in code[ip]) if ip < len(code) else "RET"
+            lines.append(f"{f'{function}@{ip}':<20} {text:<20} {count:>12,}")
+        return "\n".join(lines)
+
+    def collapsed(self):
+        """Pilas colapsadas en microsegundos, formato de flamegraph.pl / speedscope"""
+        return "".join(f"{key} {round(spent * 1e6)}\n"
+                       for key, spent in sorted(self.stack_time.items())
+                       if round(spent * 1e6) > 0)
+
+    def write_collapsed(self, filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(self.collapsed())
@@ -1,8 +1,48 @@
+import contextlib
+import io
+import os
+import tempfile
 import unittest
 from lexer import tokenize
 from parser import Parser
 from ast_utility import to_json
 from model import Program, VarDecl, Number
+from lowering import resolve_jumps
+from ircode import IRModule, IRFunction
+from goxc import dumps, write_goxc, GoxcModule
+from check import Checker
+from ircode import IRCodeGenerator
+from iropt import optimize_function, optimize_module
+from stack_machine import StackMachine, Memory, PagedMemory, OutputBuffer
+from pybackend import PythonEngine
+from register_vm import RegisterMachine
+from batch_vm import BatchError, BatchMachine, run_batch
+from scheduler import DONE, FAILED, CooperativeMachine, Scheduler
+from vm import VirtualMachine
+from profiler import Profiler
+from verifier import VerifyError, max_stack_depths
+from peephole import fuse, hot_sequences
+from cfg import ControlFlowGraph, SSAError, build_ssa, function_arities
+from loopopt import optimize_loops, unroll_loops
+from consteval import (IMPURE, OUTPUT, PURE, evaluate_calls, function_purity,
+                       mark_pure_functions)
+
+
+def compile_gox(code):
+    ast = Parser(tokenize(code)).parse()
+    with contextlib.redirect_stdout(io.StringIO()):
+        errors = Checker().check(ast)
+    assert not errors, errors
+    return IRCodeGenerator().generate(ast.decls)
+
+
+def run_gox(code, engine=StackMachine):
+    vm = engine()
+    vm.load_module(compile_gox(code))
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        vm.run("main")
+    return out.getvalue()
 
 class TestLexer(unittest.TestCase):
     def test_token_var_decl(self):
@@ -57,5 +97,1062 @@ class TestASTUtility(unittest.TestCase):
         self.assertEqual(decl['var_type'], 'INT')  
         self.assertEqual(decl['init']['value'], 10)
 
+class TestLowering(unittest.TestCase):
+    def test_if_else_targets(self):
+        code = [('CONSTI', 1), ('IF',), ('CONSTI', 2), ('ELSE',),
+                ('CONSTI', 3), ('ENDIF',), ('RET',)]
+        self.assertEqual(resolve_jumps(code), [
+            ('CONSTI', 1), ('JUMPZ', 4), ('CONSTI', 2), ('JUMP', 5),
+            ('CONSTI', 3), ('RET',)
+        ])
+
+    def test_loop_targets(self):
+        code = [('LOOP',), ('LOCAL_GET', 'i'), ('CBREAK',),
+                ('LOCAL_GET', 'i'), ('LOCAL_SET', 'i'), ('ENDLOOP',)]
+        self.assertEqual(resolve_jumps(code), [
+            ('LOCAL_GET', 'i'), ('JUMPZ', 5), ('LOCAL_GET', 'i'),
+            ('LOCAL_SET', 'i'), ('JUMP', 0)
+        ])
+
+    def test_unbalanced_markers(self):
+        with self.assertRaises(RuntimeError):
+            resolve_jumps([('LOOP',), ('CONSTI', 1)])
+
+class TestGoxc(unittest.TestCase):
+    def test_roundtrip_is_lazy(self):
+        module = IRModule()
+        add = IRFunction("add", ["x", "y"])
+        add.add_local("t")
+        for instr in [("LOCAL_GET", "x"), ("LOCAL_GET", "y"), ("ADDI",), ("RET",)]:
+            add.add_instr(*instr)
+        main = IRFunction("main", return_type='V')
+        main.add_instr("CONSTI", 2**70)
+        main.add_instr("CONSTI", 1)
+        main.add_instr("CALL", "add")
+        main.add_instr("DROP")
+        module.add_function(add)
+        module.add_function(main)
+
+        loaded = GoxcModule(dumps(module))
+        self.assertEqual(loaded.function_info["add"].params, ["x", "y"])
+        self.assertEqual(loaded.function_info["add"].locals, {"t": "I"})
+        self.assertEqual(loaded.function_info["add"].max_stack, 2)
+        functions = loaded.lazy_functions()
+        self.assertIn("add", functions)
+        self.assertEqual(loaded.decoded_count, 0)
+        self.assertEqual(functions["main"], [("CONSTI", 2**70), ("CONSTI", 1),
+                                             ("CALL", "add"), ("DROP",)])
+        self.assertEqual(loaded.decoded_count, 1)
+
+class TestOptimizer(unittest.TestCase):
+    def test_folds_and_prunes(self):
+        code = """
+        func f(x int) int {
+            var a int = 2 * 3 - 1;
+            if (a > 4) {
+                return x * a + -1;
+            } else {
+                return 0;
+            }
+        }
+        print f(3);
+        print 10 / 0;
+        """
+        module = compile_gox(code)
+        removed = optimize_module(module, inline_limit=0)
+        self.assertEqual(module.functions[0].instructions, [
+            ("LOCAL_GET", "x"), ("CONSTI", 5), ("MULI",), ("CONSTI", -1), ("ADDI",), ("RET",)])
+        self.assertGreater(removed["f"], 0)
+        # La división por cero no se pliega: sigue fallando al ejecutar
+        self.assertIn(("DIVI",), module.functions[-1].instructions)
+        vm = StackMachine()
+        vm.load_module(module)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            with self.assertRaises(RuntimeError):
+                vm.run("main")
+        self.assertEqual(out.getvalue(), "14\n")
+
+    def test_propagation_respects_order_and_loops(self):
+        func = IRFunction("g", ["p"])
+        for name in ("a", "b"):
+            func.add_local(name)
+        for instr in [("LOCAL_GET", "a"), ("PRINTI",),          # lee el 0 inicial
+                      ("CONSTI", 4), ("LOCAL_SET", "a"),
+                      ("LOOP",), ("CONSTI", 1), ("LOCAL_SET", "b"), ("ENDLOOP",),
+                      ("LOCAL_GET", "a"), ("LOCAL_GET", "b"), ("ADDI",), ("RET",)]:
+            func.add_instr(*instr)
+        optimize_function(func)
+        self.assertEqual(func.instructions[:4],
+                         [("LOCAL_GET", "a"), ("PRINTI",), ("CONSTI", 4), ("LOCAL_SET", "a")])
+        self.assertEqual(func.instructions[-4:],
+                         [("CONSTI", 4), ("LOCAL_GET", "b"), ("ADDI",), ("RET",)])
+
+    def test_dead_code_and_stores(self):
+        code = """
+        func g(x int) int { print x; return x; }
+        func f(x int) int {
+            var unused int = 0;
+            unused = g(x) + x * 2;
+            while (x > 0) {
+                if (x == 2) { return x; print 1; }
+                x = x - 1;
+            }
+            return 0;
+            print 2;
+        }
+        print f(3);
+        """
+        module = compile_gox(code)
+        optimize_module(module, inline_limit=0)
+        f = module.functions[1]
+        self.assertNotIn("unused", f.locals)
+        self.assertEqual(f.instructions[:4],
+                         [("LOCAL_GET", "x"), ("CALL", "g"), ("DROP",), ("LOOP",)])
+        self.assertNotIn(("PRINTI",), f.instructions)
+        self.assertEqual(run_gox(code), "3\n2\n")
+        vm = StackMachine()
+        vm.load_module(module)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            vm.run("main")
+        self.assertEqual(out.getvalue(), "3\n2\n")
+
+    def test_unused_functions_are_dropped(self):
+        library = "".join(f"func lib{i}(x int) int {{ return lib{i + 1}(x) + {i}; }}\n"
+                          for i in reversed(range(200)))
+        code = "func lib200(x int) int { return x; }\n" + library + """
+        func used(x int) int { return lib198(x) * 2; }
+        print used(1);
+        """
+        module = compile_gox(code)
+        removed = optimize_module(module, inline_limit=0)
+        self.assertEqual(sorted(func.name for func in module.functions),
+                         ["_actual_main", "lib198", "lib199", "lib200", "main", "used"])
+        self.assertEqual(removed["lib0"], 5)
+        vm = StackMachine()
+        vm.load_module(module)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            vm.run("main")
+        self.assertEqual(out.getvalue(), f"{2 * (1 + 198 + 199)}\n")
+
+class TestInliner(unittest.TestCase):
+    CODE = """
+    var g int = 0;
+    func mod(a int, b int) int {
+        if (b == 0) { return 0; }
+        return a - b * (a / b);
+    }
+    func bump(k int) { g = g + k; }
+    func val() int { g = g + 100; return g; }
+    func fact(n int) int {
+        if (n < 2) { return 1; }
+        return n * fact(n - 1);
+    }
+    func gcd(a int, b int) int {
+        while (b != 0) {
+            var t int = b;
+            b = mod(a, b);
+            a = t;
+        }
+        return a;
+    }
+    bump(3);
+    print mod(7, 0) + gcd(1071, 462);
+    print g + val();
+    var r int = mod(17, 5);
+    print fact(5) + r;
+    """
+
+    def test_inlines_small_non_recursive_functions(self):
+        module = compile_gox(self.CODE)
+        optimize_module(module)
+        names = {func.name: func for func in module.functions}
+        # mod y bump quedan sin llamadas; fact es recursiva y se mantiene
+        self.assertNotIn("mod", names)
+        self.assertNotIn("bump", names)
+        self.assertIn("fact", names)
+        self.assertIn("mod$return", names["gcd"].locals)
+        calls = [instr[1] for func in module.functions for instr in func.instructions
+                 if instr[0] in ("CALL", "TAILCALL")]
+        self.assertNotIn("mod", calls)
+
+        expected = run_gox(self.CODE)
+        self.assertEqual(expected, "21\n106\n122\n")
+        for engine in (StackMachine, lambda: StackMachine(verify=False), PythonEngine):
+            vm = engine()
+            vm.load_module(module)
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                vm.run("main")
+            self.assertEqual(out.getvalue(), expected)
+
+    def test_size_limit(self):
+        module = compile_gox(self.CODE)
+        optimize_module(module, inline_limit=5)
+        names = {func.name for func in module.functions}
+        self.assertIn("mod", names)
+        self.assertNotIn("bump", names)
+
+class TestCFG(unittest.TestCase):
+    CODE = """
+    func collatz(n int) int {
+        var steps int = 0;
+        while (n != 1) {
+            if (n % 2 == 0) { n = n / 2; } else { n = 3 * n + 1; }
+            steps = steps + 1;
+        }
+        return steps;
+    }
+    func first_div(n int) int {
+        var d int = 2;
+        while (d * d <= n) {
+            if (n % d == 0) { return d; }
+            d = d + 1;
+        }
+        return n;
+    }
+    print collatz(27);
+    print first_div(91) + first_div(97);
+    """
+
+    def test_blocks_and_dominators(self):
+        module = compile_gox(self.CODE)
+        func = module.functions[0]
+        cfg = ControlFlowGraph(func, function_arities(module))
+        # entrada, cabecera, if, then, else, unión, salida, cierre
+        self.assertEqual([[s.id for s in b.succs] for b in cfg.blocks],
+                         [[1], [2, 6], [3, 4], [5], [5], [1], [], []])
+        self.assertEqual(cfg.idom[5], 2)
+        self.assertTrue(cfg.dominates(1, 5))
+        self.assertFalse(cfg.dominates(3, 5))
+        self.assertEqual(cfg.frontiers[3], {5})
+        self.assertEqual(cfg.frontiers[5], {1})
+
+    def test_ssa_phis_and_roundtrip(self):
+        module = compile_gox(self.CODE)
+        arities = function_arities(module)
+        cfg = build_ssa(module.functions[0], arities)
+        header_phis = sorted(phi.var for phi in cfg.blocks[1].phis)
+        self.assertEqual(header_phis, ["n", "steps"])
+        self.assertEqual([phi.var for phi in cfg.blocks[5].phis], ["n"])
+        self.assertIn("PHI", cfg.to_dot())
+        self.assertIn('"collatz.B1" -> "collatz.B2";', cfg.to_dot())
+
+        expected = run_gox(self.CODE)
+        self.assertEqual(expected, "111\n104\n")
+        module.functions = [build_ssa(func, arities).to_function() for func in module.functions]
+        for engine in (StackMachine, PythonEngine):
+            vm = engine()
+            vm.load_module(module)
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                vm.run("main")
+            self.assertEqual(out.getvalue(), expected)
+
+    def test_rejects_values_across_blocks(self):
+        func = IRFunction("f", return_type='I')
+        for instr in [("CONSTI", 1), ("CONSTI", 0), ("IF",), ("CONSTI", 2), ("ADDI",),
+                      ("ENDIF",), ("RET",)]:
+            func.add_instr(*instr)
+        with self.assertRaises(SSAError):
+            build_ssa(func, {"f": (0, 1)})
+
+
+class TestLoopOpt(unittest.TestCase):
+    CODE = """
+    func suma(n int, a int, b int) int {
+        var s int = 0;
+        var i int = 0;
+        while (i < n) {
+            s = s + (a * b + i) % (a + b) + i * 3;
+            i = i + 1;
+        }
+        return s;
+    }
+    func diez() int {
+        var s int = 0;
+        var i int = 0;
+        while (i < 10) {
+            s = s + i % 3;
+            i = i + 1;
+        }
+        return s;
+    }
+    print suma(50, 7, 11);
+    print diez();
+    """
+
+    def run_module(self, module):
+        vm = StackMachine()
+        vm.load_module(module)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            vm.run("main")
+        return out.getvalue(), vm
+
+    def loop_body(self, func):
+        ops = [instr[0] for instr in func.instructions]
+        return ops[ops.index("LOOP"):ops.index("ENDLOOP")]
+
+    def test_hoists_invariants_and_reduces_strength(self):
+        expected = run_gox(self.CODE)
+        module = compile_gox(self.CODE)
+        optimize_module(module)
+        stats = optimize_loops(module)
+        self.assertEqual(stats["hoisted"], 2)
+        self.assertEqual(stats["reduced"], 1)
+        suma = next(f for f in module.functions if f.name == "suma")
+        # a * b y a + b quedan antes del LOOP; i * 3 pasa a ser una suma
+        self.assertNotIn("MULI", self.loop_body(suma))
+        self.assertIn("MULI", [instr[0] for instr in suma.instructions])
+        self.assertEqual(self.run_module(module)[0], expected)
+
+    def test_unroll_preserves_output(self):
+        expected = run_gox(self.CODE)
+        module = compile_gox(self.CODE)
+        optimize_module(module)
+        optimize_loops(module, unroll=4)
+        diez = next(f for f in module.functions if f.name == "diez")
+        # 10 vueltas de a 4: dos copias antes del bucle y cuatro dentro
+        self.assertEqual(self.loop_body(diez).count("MODI"), 4)
+        self.assertEqual([instr[0] for instr in diez.instructions].count("MODI"), 6)
+        self.assertEqual(self.run_module(module)[0], expected)
+
+    def test_full_unroll_and_unknown_loops(self):
+        module = compile_gox(self.CODE)
+        optimize_module(module)
+        funcs = {func.name: func for func in module.functions}
+        self.assertEqual(unroll_loops(funcs["diez"], 16), 1)
+        self.assertNotIn(("LOOP",), funcs["diez"].instructions)
+        # n es un parámetro: no se sabe cuántas vueltas da
+        self.assertEqual(unroll_loops(funcs["suma"], 4), 0)
+        # un segundo CBREAK (break) impide desenrollar
+        with_break = IRFunction("f", return_type='I')
+        with_break.add_local("i")
+        for instr in [("CONSTI", 0), ("LOCAL_SET", "i"), ("LOOP",),
+                      ("LOCAL_GET", "i"), ("CONSTI", 10), ("LTI",), ("CBREAK",),
+                      ("LOCAL_GET", "i"), ("CONSTI", 5), ("NEI",), ("CBREAK",),
+                      ("LOCAL_GET", "i"), ("CONSTI", 1), ("ADDI",), ("LOCAL_SET", "i"),
+                      ("ENDLOOP",), ("LOCAL_GET", "i"), ("RET",)]:
+            with_break.add_instr(*instr)
+        self.assertEqual(unroll_loops(with_break, 4), 0)
+
+class TestConstEval(unittest.TestCase):
+    CODE = """
+    var base int = 7;
+    var contador int = 0;
+    func sq(x int) int { return x * x; }
+    func tabla(n int) int {
+        var i int = 1;
+        while (i <= n) { print sq(i); i = i + 1; }
+        return n;
+    }
+    func cuenta() int { contador = contador + 1; return contador; }
+    var area int = sq(base);
+    print area;
+    print tabla(3) + cuenta();
+    """
+
+    def run_module(self, module):
+        vm = StackMachine()
+        vm.load_module(module)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            vm.run("main")
+        return out.getvalue()
+
+    def test_purity(self):
+        module = compile_gox(self.CODE)
+        purity = function_purity(module)
+        self.assertEqual(purity["sq"], PURE)
+        self.assertEqual(purity["tabla"], OUTPUT)
+        self.assertEqual(purity["cuenta"], IMPURE)
+
+    def test_calls_become_constants(self):
+        expected = run_gox(self.CODE)
+        module = compile_gox(self.CODE)
+        optimize_module(module, inline_limit=0)
+        stats = evaluate_calls(module)
+        # sq(base) en la inicialización y tabla(3); cuenta() lee un global
+        self.assertEqual(stats["replaced"], 2)
+        # base al llamar a sq y area (ya constante) en el print
+        self.assertEqual(stats["globals"], 2)
+        names = {func.name for func in module.functions}
+        self.assertEqual(names, {"main", "_actual_main", "cuenta"})
+        entry = next(func for func in module.functions if func.name == "_actual_main")
+        self.assertIn(("CONSTI", 49), entry.instructions)
+        self.assertEqual(self.run_module(module), expected)
+
+    def test_budget_and_errors_stay_at_run_time(self):
+        code = """
+        func lento(n int) int {
+            var s int = 0;
+            while (n > 0) { s = s + n; n = n - 1; }
+            return s;
+        }
+        func falla(n int) int { return n / (n - n); }
+        print lento(1000);
+        print falla(3);
+        """
+        module = compile_gox(code)
+        optimize_module(module, inline_limit=0)
+        stats = evaluate_calls(module, budget=500)
+        self.assertEqual(stats["replaced"], 0)
+        self.assertEqual(stats["failed"], 2)
+        self.assertLessEqual(stats["spent"], 1000)
+        with self.assertRaisesRegex(RuntimeError, "División por cero"):
+            self.run_module(module)
+        stats = evaluate_calls(module)
+        self.assertEqual(stats["replaced"], 1)
+
+
+class TestIntrinsics(unittest.TestCase):
+    CODE = """
+    func periodo(a int, n int) int {
+        var r int = 1;
+        while (__powmod(a, r, n) != 1) { r = r + 1; }
+        return r;
+    }
+    var n int = 10403;
+    print periodo(2, n);
+    print __gcd(n, 202) + __isqrt(n) + __mod(n, 1000);
+    """
+
+    def check(self, code):
+        ast = Parser(tokenize(code)).parse()
+        with contextlib.redirect_stdout(io.StringIO()):
+            return Checker().check(ast)
+
+    def test_checker_signatures(self):
+        self.assertEqual(self.check("print __gcd(4, 6);"), [])
+        errors = self.check("print __powmod(2, 3); print __isqrt(true);")
+        self.assertEqual([e.kind for e in errors], ["ArgMismatch", "TypeError"])
+
+    def test_same_output_in_every_engine(self):
+        module = compile_gox(self.CODE)
+        ops = {instr[0] for func in module.functions for instr in func.instructions}
+        self.assertIn("INTRINSIC", ops)
+        self.assertNotIn("CALL", {instr[0] for instr in module.functions[0].instructions})
+        expected = "5100\n" + f"{101 + 101 + 403}\n"
+        for engine in (StackMachine, lambda: StackMachine(verify=False),
+                       PythonEngine, RegisterMachine):
+            self.assertEqual(run_gox(self.CODE, engine), expected)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "m.goxc")
+            write_goxc(module, path)
+            vm = StackMachine()
+            vm.load_goxc(path)
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                vm.run("main")
+            vm.module_file.close()
+        self.assertEqual(out.getvalue(), expected)
+
+    def test_folding_errors_and_user_functions(self):
+        module = compile_gox("print __powmod(3, 4, 7); var z int = 0; print __mod(5, z);")
+        optimize_module(module)
+        entry = next(func for func in module.functions if func.name == "_actual_main")
+        self.assertIn(("CONSTI", 4), entry.instructions)
+        self.assertNotIn(("INTRINSIC", "__powmod"), entry.instructions)
+        self.assertIn(("INTRINSIC", "__mod"), entry.instructions)
+        vm = StackMachine()
+        vm.load_module(module)
+        with self.assertRaisesRegex(RuntimeError, "División por cero"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                vm.run("main")
+        # Una función del programa con el mismo nombre tiene prioridad
+        code = "func __mod(a int, b int) int { return 1; } print __mod(7, 2);"
+        module = compile_gox(code)
+        self.assertIn(("CALL", "__mod"), module.functions[2].instructions)
+        self.assertEqual(run_gox(code), "1\n")
+
+
+class TestBatch(unittest.TestCase):
+    CODE = """
+    func fib(n int) int {
+        if (n < 2) { return n; }
+        return fib(n - 1) + fib(n - 2);
+    }
+    func primero(n int, d int) int {
+        var i int = d;
+        while (i < n) {
+            if (n % i == 0) { return i; }
+            i = i + 1;
+        }
+        return n;
+    }
+    var x int = 0;
+    print fib(x) + primero(x + 2, 2);
+    print 100 / (x - 3);
+    print x * 2;
+    """
+
+    def reference(self, code, name, value):
+        module = compile_gox(code)
+        entry = next(func for func in module.functions if func.name == "_actual_main")
+        index = entry.instructions.index(("GLOBAL_SET", name))
+        entry.instructions[index - 1] = ("CONSTI", value)
+        vm = StackMachine()
+        vm.load_module(module)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            try:
+                vm.run("main")
+            except RuntimeError as e:
+                return out.getvalue(), str(e)
+        return out.getvalue(), None
+
+    def test_lanes_match_stack_machine(self):
+        values = [0, 1, 3, 7, 10, 12]
+        module = compile_gox(self.CODE)
+        optimize_module(module)
+        outputs, errors = run_batch(module, {"x": values})
+        for lane, value in enumerate(values):
+            self.assertEqual((outputs[lane], errors.get(lane)),
+                             self.reference(self.CODE, "x", value))
+        # Solo el carril con x == 3 divide por cero
+        self.assertEqual(errors, {2: "División por cero"})
+
+    def test_factorize_inputs(self):
+        source = open("factorize.gox", encoding="utf-8").read()
+        values = list(range(2, 40))
+        outputs, errors = run_batch(compile_gox(source), {"num": values})
+        self.assertEqual(errors, {})
+        for value in (2, 12, 37):
+            self.assertEqual(outputs[value - 2], self.reference(source, "num", value)[0])
+
+    def test_rejects_memory_and_unknown_globals(self):
+        module = IRModule()
+        func = IRFunction("main", return_type='V')
+        func.instructions = [("CONSTI", 0), ("PEEKI",), ("DROP",), ("RET",)]
+        module.add_function(func)
+        with self.assertRaisesRegex(BatchError, "PEEKI"):
+            BatchMachine().load_module(module)
+        machine = BatchMachine()
+        machine.load_module(compile_gox(self.CODE))
+        with self.assertRaisesRegex(BatchError, "no se asigna"):
+            machine.run({"y": [1, 2]})
+
+
+class TestScheduler(unittest.TestCase):
+    LONG = """
+    var i int = 0;
+    var s int = 0;
+    while (i < 5000) {
+        s = s + i % 7;
+        i = i + 1;
+    }
+    print s;
+    """
+    SHORT = """
+    print 1;
+    print 2;
+    """
+
+    def reference(self, module):
+        vm = StackMachine()
+        vm.load_module(module)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            vm.run("main")
+        return out.getvalue()
+
+    def test_outputs_match_stack_machine(self):
+        source = open("factorize.gox", encoding="utf-8").read()
+        modules = [compile_gox(self.LONG), compile_gox(source), compile_gox(self.SHORT)]
+        for slice_size in (1, 50, 100000):
+            scheduler = Scheduler(slice_size)
+            jobs = [scheduler.submit(module) for module in modules]
+            scheduler.run_all()
+            for job, module in zip(jobs, modules):
+                self.assertEqual(job.state, DONE)
+                self.assertEqual(job.text(), self.reference(module))
+
+    def test_short_job_finishes_first(self):
+        scheduler = Scheduler(100)
+        long_job = scheduler.submit(compile_gox(self.LONG), name="largo")
+        short_job = scheduler.submit(compile_gox(self.SHORT), name="corto")
+        scheduler.run_all()
+        self.assertLess(short_job.finished, long_job.finished)
+        self.assertEqual(short_job.slices, 3)   # Una pausa por cada print
+        stats = scheduler.stats()
+        self.assertEqual(stats['done'], 2)
+        self.assertEqual(stats['instructions'], long_job.instructions + short_job.instructions)
+        self.assertEqual(stats['switches'], long_job.slices + short_job.slices - 2)
+
+    def test_error_only_fails_its_job(self):
+        scheduler = Scheduler(10, yield_on_output=False)
+        bad = scheduler.submit(compile_gox("var x int = 0;\nprint 1;\nprint 5 / x;\n"))
+        good = scheduler.submit(compile_gox(self.SHORT))
+        scheduler.run_all()
+        self.assertEqual((bad.state, bad.error, bad.text()), (FAILED, "División por cero", "1\n"))
+        self.assertEqual((good.state, good.text()), (DONE, "1\n2\n"))
+        self.assertEqual(scheduler.stats()['output_pauses'], 0)
+
+    def test_machine_slices(self):
+        vm = CooperativeMachine(output=io.StringIO(), yield_on_output=False)
+        vm.load_module(compile_gox(self.LONG))
+        vm.start()
+        self.assertFalse(vm.run_slice(10))
+        self.assertEqual(vm.executed, 10)
+        while not vm.run_slice(1000):
+            pass
+        vm.output.flush()
+        self.assertEqual(vm.output.sink.getvalue(), self.reference(compile_gox(self.LONG)))
+
+
+class TestMemo(unittest.TestCase):
+    CODE = """
+    var llamadas int = 0;
+    func fib(n int) int {
+        if (n < 2) { return n; }
+        return fib(n - 1) + fib(n - 2);
+    }
+    func doble(n int) int { llamadas = llamadas + 1; return n * 2; }
+    func muestra(n int) int { print n; return n; }
+    print fib(20);
+    print doble(3) + doble(3);
+    print muestra(4) + muestra(4);
+    print llamadas;
+    """
+
+    def run_memo(self, module, verify=True, memoize=64):
+        vm = StackMachine(verify=verify, memoize=memoize)
+        vm.load_module(module)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            vm.run("main")
+        return out.getvalue(), vm.memo_stats()
+
+    def test_marks_only_pure_functions(self):
+        module = compile_gox(self.CODE)
+        self.assertEqual(mark_pure_functions(module), ["fib"])
+
+    def test_same_output_with_cache(self):
+        expected = run_gox(self.CODE)
+        module = compile_gox(self.CODE)
+        mark_pure_functions(module)
+        for verify in (True, False):
+            output, stats = self.run_memo(module, verify)
+            self.assertEqual(output, expected)
+            hits, misses, size = stats["fib"]
+            self.assertGreater(hits, 0)
+            self.assertEqual(misses, 21)
+            self.assertEqual(list(stats), ["fib"])
+
+    def test_cache_is_bounded(self):
+        module = compile_gox(self.CODE)
+        mark_pure_functions(module)
+        output, stats = self.run_memo(module, memoize=4)
+        self.assertEqual(output, run_gox(self.CODE))
+        self.assertLessEqual(stats["fib"][2], 4)
+        _, stats = self.run_memo(module, memoize=0)
+        self.assertEqual(stats, {})
+
+
+class TestStackMachine(unittest.TestCase):
+    def test_any_function_receives_params(self):
+        code = """
+        func resta3(a int, b int, c int) int {
+            return a - b - c;
+        }
+        print resta3(10, 3, 2);
+        """
+        self.assertEqual(run_gox(code), "5\n")
+
+    def test_void_call_leaves_no_value(self):
+        code = """
+        func show(n int) {
+            print n % 4;
+        }
+        show(7);
+        """
+        vm = StackMachine()
+        vm.load_module(compile_gox(code))
+        with contextlib.redirect_stdout(io.StringIO()):
+            vm.run("main")
+        self.assertEqual(vm.signatures["show"].returns, 0)
+        self.assertEqual(vm.stack, [])
+
+    def test_text_ir_carries_signatures(self):
+        code = "func f(x int, y int) int { var t int = x * y; return t; } print f(6, 7);"
+        vm = StackMachine()
+        vm.load_ir_from_string(compile_gox(code).dump())
+        self.assertEqual(vm.signatures["f"].slots, {"x": 0, "y": 1, "t": 2})
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            vm.run("main")
+        self.assertEqual(out.getvalue(), "42\n")
+
+    def test_deep_recursion_uses_frame_stack(self):
+        code = """
+        func sum(n int, acc int) int {
+            if (n == 0) {
+                return acc;
+            }
+            return sum(n - 1, acc + n);
+        }
+        print sum(20000, 0);
+        """
+        self.assertEqual(run_gox(code), "200010000\n")
+
+    def test_tail_calls_reuse_frame(self):
+        code = """
+        func finish(n int) int {
+            return n * 2;
+        }
+        func count(n int, acc int) int {
+            if (n == 0) {
+                return finish(acc);
+            }
+            return count(n - 1, acc + 1);
+        }
+        print count(30000, 0);
+        """
+        module = compile_gox(code)
+        self.assertIn(("TAILCALL", "finish"), module.functions[1].instructions)
+        depths = []
+        vm = StackMachine(verify=False)
+        vm.load_module(module)
+        tailcall = vm.handlers["TAILCALL"]
+        vm.handlers["TAILCALL"] = lambda name: depths.append(len(vm.call_stack)) or tailcall(name)
+        vm.code.clear()
+        vm._decode_all()
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            vm.run("main")
+        self.assertEqual(out.getvalue(), "60000\n")
+        self.assertEqual(max(depths), min(depths))
+        self.assertEqual(run_gox(code, PythonEngine), "60000\n")
+
+    def test_unknown_instruction_fails_at_load(self):
+        ir = "MODULE:::\nFUNCTION::: main, [], [] V\nlocals: {}\n('FOO',)\n('RET',)"
+        with self.assertRaises(RuntimeError):
+            StackMachine().load_ir_from_string(ir)
+
+class TestMemory(unittest.TestCase):
+    def test_aligned_and_unaligned_access(self):
+        mem = Memory(16)
+        mem.write_int(4, -7)
+        mem.write_int(9, 123456)
+        mem.write_float(12, 2.5)
+        self.assertEqual(mem.read_int(4), -7)
+        self.assertEqual(mem.read_int(9), 123456)
+        self.assertEqual(mem.read_float(12), 2.5)
+        self.assertEqual(bytes(mem.data[4:8]), (-7).to_bytes(4, 'little', signed=True))
+        mem.grow(64)   # Con vistas ya creadas
+        mem.write_int(60, 5)
+        self.assertEqual((mem.read_int(4), mem.read_int(60)), (-7, 5))
+        with self.assertRaises(IndexError):
+            mem.read_int(62)
+
+    def test_bulk_instructions(self):
+        ir = """MODULE:::
+FUNCTION::: main, [], [] V
+locals: {}
+('CONSTI', 0)
+('CONSTI', 65)
+('CONSTI', 8)
+('MEMSET',)
+('CONSTI', 16)
+('CONSTI', 2)
+('CONSTI', 4)
+('MEMCPY',)
+('CONSTI', 0)
+('CONSTI', 16)
+('CONSTI', 4)
+('MEMCMP',)
+('PRINTI',)
+('CONSTI', 16)
+('CONSTI', 20)
+('CONSTI', 4)
+('MEMCMP',)
+('PRINTI',)
+('RET',)"""
+        for verify in (True, False):
+            vm = StackMachine(verify=verify)
+            vm.load_ir_from_string(ir)
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                vm.run("main")
+            self.assertEqual(out.getvalue(), "0\n1\n")
+            self.assertEqual(bytes(vm.memory.data[14:22]), b"\0\0AAAA\0\0")
+
+    def test_paged_memory_matches_flat(self):
+        flat, paged = Memory(3 * 4096), PagedMemory(3 * 4096)
+        for mem in (flat, paged):
+            mem.write_int(4094, 0x01020304)      # Cruza el límite de página
+            mem.write_float(8192, 1.25)
+            mem.fill(100, 9, 5000)
+            mem.copy(10000, 98, 12)
+        for address in (4094, 8192, 10000, 10004, 10008):
+            self.assertEqual(paged.read_int(address), flat.read_int(address))
+        self.assertEqual(paged.read_float(8192), 1.25)
+        self.assertEqual(paged.compare(0, 10000, 12), flat.compare(0, 10000, 12))
+
+    def test_paged_memory_is_sparse(self):
+        mem = PagedMemory()
+        mem.grow(1 << 40)
+        self.assertEqual(mem.read_int(1 << 39), 0)
+        mem.write_byte((1 << 40) - 1, 7)
+        self.assertEqual(mem.read_byte((1 << 40) - 1), 7)
+        self.assertEqual(mem.resident_bytes, PagedMemory.PAGE_SIZE)
+
+class TestOutputBuffer(unittest.TestCase):
+    def test_sinks_and_threshold(self):
+        code = 'var i int = 0; while (i < 3) { print "n=" + i; i = i + 1; }'
+        text, raw = io.StringIO(), bytearray()
+        for sink in (text, raw):
+            vm = StackMachine(output=sink)
+            vm.load_module(compile_gox(code))
+            vm.run("main")
+        self.assertEqual(text.getvalue(), "n=0\nn=1\nn=2\n")
+        self.assertEqual(raw, b"n=0\nn=1\nn=2\n")
+        self.assertEqual(run_gox(code, PythonEngine), text.getvalue())
+
+        sink = io.StringIO()
+        buffer = OutputBuffer(sink, threshold=4)
+        buffer.write("ab")
+        self.assertEqual(sink.getvalue(), "")
+        buffer.write("cd")
+        self.assertEqual(sink.getvalue(), "abcd")
+
+    def test_flushes_on_error(self):
+        sink = io.StringIO()
+        vm = StackMachine(output=sink)
+        vm.load_module(compile_gox("var z int = 0; print 1; print 5 / z;"))
+        with self.assertRaises(RuntimeError):
+            vm.run("main")
+        self.assertEqual(sink.getvalue(), "1\n")
+
+class TestStringPool(unittest.TestCase):
+    CODE = 'var n int = 3; print "n = " + n + "!"; print "n = ";'
+
+    def test_literals_are_pooled(self):
+        module = compile_gox(self.CODE)
+        self.assertEqual(module.strings, ["n = ", "!"])
+        code = module.functions[-1].instructions
+        self.assertEqual(code.count(("PRINTS", 0)), 2)
+        self.assertNotIn("PRINTB", [instr[0] for instr in code])
+
+    def test_all_loaders_and_engines(self):
+        module = compile_gox(self.CODE)
+        expected = "n = 3\n!n = "
+        self.assertEqual(run_gox(self.CODE), expected)
+        self.assertEqual(run_gox(self.CODE, PythonEngine), expected)
+
+        self.assertEqual(GoxcModule(dumps(module)).strings, module.strings)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "strings.goxc")
+            write_goxc(module, path)
+            for load in ("text", "goxc"):
+                vm = StackMachine()
+                if load == "text":
+                    vm.load_ir_from_string(module.dump())
+                else:
+                    vm.load_goxc(path)
+                with contextlib.redirect_stdout(io.StringIO()) as out:
+                    vm.run("main")
+                self.assertEqual(out.getvalue(), expected)
+            vm.module_file.close()
+
+            ir_path = os.path.join(tmp, "strings.ir")
+            with open(ir_path, "w", encoding="utf-8") as f:
+                f.write(module.dump())
+            legacy = VirtualMachine()
+            legacy.load_ir(ir_path)
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                legacy.run("main")
+            self.assertEqual(out.getvalue(), expected)
+
+class TestVerifier(unittest.TestCase):
+    def test_rejects_unbalanced_code(self):
+        for body in ["('CONSTI', 1)\n('RET',)",
+                     "('ADDI',)\n('RET',)",
+                     "('CONSTI', 0)\n('IF',)\n('CONSTI', 1)\n('ENDIF',)\n('RET',)"]:
+            ir = f"MODULE:::\nFUNCTION::: main, [], [] V\nlocals: {{}}\n{body}"
+            with self.assertRaises(VerifyError):
+                StackMachine().load_ir_from_string(ir)
+            StackMachine(verify=False).load_ir_from_string(ir)
+
+    def test_max_depth_and_dropped_results(self):
+        code = """
+        func f(a int, b int, c int) int { return a * (b + (c - 1)); }
+        f(1, 2, 3);
+        print f(2, 3, 4) > 1;
+        """
+        module = compile_gox(code)
+        self.assertIn(("DROP",), module.functions[2].instructions)
+        self.assertEqual(max_stack_depths(module)["f"], 4)
+        self.assertEqual(run_gox(code), "1\n")
+        vm = StackMachine()
+        vm.load_module(module)
+        with contextlib.redirect_stdout(io.StringIO()):
+            vm.run("main")
+        self.assertEqual(vm.signatures["_actual_main"].max_stack, 3)
+
+class TestPeephole(unittest.TestCase):
+    def test_fuses_and_remaps_jumps(self):
+        code = resolve_jumps([
+            ('LOOP',),
+            ('LOCAL_GET', 'i'), ('CONSTI', 10), ('LTI',), ('CBREAK',),
+            ('LOCAL_GET', 'i'), ('CONSTI', 1), ('ADDI',), ('LOCAL_SET', 'i'),
+            ('ENDLOOP',),
+            ('LOCAL_GET', 'i'), ('LOCAL_GET', 'j'), ('ADDI',), ('PRINTI',),
+        ])
+        self.assertEqual(fuse(code), [
+            ('LOCAL_CONST', 'i', 10), ('JUMP_IF_GE', 4),
+            ('INC_LOCAL', 'i', 1), ('JUMP', 0),
+            ('LOCAL_GET2', 'i', 'j'), ('ADDI',), ('PRINTI',),
+        ])
+
+    def test_jump_targets_are_not_fused_over(self):
+        code = [('CONSTI', 1), ('JUMPZ', 3), ('LOCAL_GET', 'a'), ('LOCAL_GET', 'b'), ('RET',)]
+        self.assertEqual(fuse(code), code)
+
+    def test_same_output_and_fewer_dispatches(self):
+        code = """
+        func mod(a int, b int) int { return a - (a / b) * b; }
+        var i int = 0;
+        var s int = 0;
+        while (i < 300) {
+            if (mod(i, 7) == 3) { s = s + i; }
+            i = i + 1;
+        }
+        print s;
+        """
+        module = compile_gox(code)
+        counts = {}
+        for fused in (False, True):
+            vm = StackMachine(superinstructions=fused)
+            vm.load_module(module)
+            profiler = Profiler()
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                vm.run("main", profiler=profiler)
+            self.assertEqual(out.getvalue(), "6450\n")
+            self.assertEqual(run_gox(code, lambda: StackMachine(superinstructions=fused)), "6450\n")
+            counts[fused] = sum(profiler.opcode_counts.values())
+            if not fused:
+                hot = [seq for seq, _ in hot_sequences(profiler, vm.functions)]
+                self.assertIn(('LOCAL_GET', 'LOCAL_GET'), hot)
+        self.assertLess(counts[True], 0.8 * counts[False])
+
+    def test_goxc_header_depth_is_an_upper_bound(self):
+        module = compile_gox("var i int = 0; while (i < 3) { i = i + 1; } print i;")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "m.goxc")
+            write_goxc(module, path)
+            vm = StackMachine()
+            vm.load_goxc(path)
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                vm.run("main")
+            vm.module_file.close()
+        self.assertEqual(out.getvalue(), "3\n")
+
+class TestProfiler(unittest.TestCase):
+    def test_profile_counts_and_stacks(self):
+        code = """
+        func sq(x int) int { return x * x; }
+        func total(n int) int {
+            var s int = 0;
+            while (n > 0) { s = s + sq(n); n = n - 1; }
+            return s;
+        }
+        print total(10);
+        """
+        vm = StackMachine()
+        vm.load_module(compile_gox(code))
+        profiler = Profiler()
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            vm.run("main", profiler=profiler)
+        self.assertEqual(out.getvalue(), "385\n")
+        self.assertEqual(profiler.calls["sq"], 10)
+        self.assertEqual(profiler.opcode_counts["MULI"], 10)
+        self.assertEqual(profiler.opcode_counts["CALL"], 12)
+        self.assertEqual(profiler.hits[("sq", 2)], 10)
+        self.assertGreaterEqual(profiler.inclusive["total"], profiler.exclusive["total"])
+        self.assertIn("main;_actual_main;total;sq ", profiler.collapsed())
+        self.assertIn("MULI", profiler.report(instructions=vm.functions))
+
+        # El código normal no se tocó: una corrida sin profiler sigue igual
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            vm.run("main")
+        self.assertEqual(out.getvalue(), "385\n")
+
+class TestPythonEngine(unittest.TestCase):
+    PROGRAMS = [
+        """
+        func gcd(a int, b int) int {
+            while (b != 0) {
+                var t int = b;
+                b = a % b;
+                a = t;
+            }
+            return a;
+        }
+        print "gcd = " + gcd(1071, 462);
+        """,
+        """
+        var g int = 0;
+        func val() int { g = g + 100; return g; }
+        func sgn(x int) int {
+            if (x < 0) { return -1; }
+            if (x == 0) { return 0; }
+            return 1;
+        }
+        val();
+        print g + val();
+        print sgn(-4) + sgn(0) + sgn(9);
+        """,
+    ]
+
+    def test_same_output_as_stack_machine(self):
+        for code in self.PROGRAMS:
+            self.assertEqual(run_gox(code, PythonEngine), run_gox(code))
+
+    def test_operand_stack_is_eliminated(self):
+        engine = PythonEngine()
+        engine.load_module(compile_gox("func inc(a int) int { a = a + 1; return a; }"))
+        self.assertIn("v_a = (v_a + 1)", engine.source)
+
+
+class TestRegisterMachine(unittest.TestCase):
+    PROGRAMS = TestPythonEngine.PROGRAMS + [
+        """
+        func fact(n int, acc int) int {
+            if (n == 0) { return acc; }
+            return fact(n - 1, acc * n);
+        }
+        func fib(n int) int {
+            if (n < 2) { return n; }
+            return fib(n - 1) + fib(n - 2);
+        }
+        print fact(20, 1);
+        print fib(15);
+        """,
+    ]
+
+    def test_same_output_as_stack_machine(self):
+        for code in self.PROGRAMS:
+            self.assertEqual(run_gox(code, RegisterMachine), run_gox(code))
+
+    def test_three_address_code(self):
+        vm = RegisterMachine()
+        vm.load_module(compile_gox("""
+        func count(n int) int {
+            var i int = 0;
+            while (i < n) { i = i + 1; }
+            return i;
+        }
+        """))
+        ops = [instr[0] for instr in vm.functions["count"].instructions]
+        # Sin LOCAL_GET / CONSTI: la comparación salta y la suma escribe en i
+        self.assertEqual(ops, ["MOVE", "JUMP_IF_GE", "ADDI", "JUMP", "RET"])
+        self.assertIn("ADDI r1, r1, r", vm.functions["count"].dump())
+
+    def test_memory_and_errors(self):
+        func = IRFunction("main", return_type='V')
+        for instr in [("CONSTI", 64), ("GROW",), ("CONSTI", 8), ("CONSTI", 42), ("POKEI",),
+                      ("CONSTI", 8), ("PEEKI",), ("PRINTI",),
+                      ("CONSTI", 1), ("CONSTI", 0), ("DIVI",), ("PRINTI",), ("RET",)]:
+            func.add_instr(*instr)
+        module = IRModule()
+        module.add_function(func)
+        out = io.StringIO()
+        vm = RegisterMachine(output=out)
+        vm.load_module(module)
+        with self.assertRaisesRegex(RuntimeError, "División por cero"):
+            vm.run("main")
+        self.assertEqual(out.getvalue(), "42\n")
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,378 @@
+# pybackend.py - Backend que compila el IR a Python nativo
+'''
+Backend Python
+==============
+Segundo motor de ejecución para programas con mucho cómputo. Cada
+IRFunction se traduce a una función de Python que luego se compila con
+compile() y la ejecuta directamente CPython:
+
+  - los locales (y parámetros) son variables locales de Python,
+  - los globales son variables del módulo generado,
+  - la pila de operandos se simula en tiempo de compilación: cada valor
+    apilado es una expresión de Python, así que 'LOCAL_GET a; CONSTI 1;
+    ADDI; LOCAL_SET a' se convierte en 'v_a = (v_a + 1)',
+  - un TAILCALL a la misma función (fuera de bucles) se convierte en
+    reasignar los parámetros y volver al inicio de un 'while True'.
+
+El control de flujo se traduce desde los marcadores estructurados
+(IF/ELSE/ENDIF, LOOP/CBREAK/ENDLOOP) a if/else y while de Python, que
+es como CPython ejecuta mejor los saltos. La salida por stdout es la
+misma que la de StackMachine.
+'''
+import re
+
+from intrinsics import INTRINSICS
+from stack_machine import Memory, OutputBuffer
+
+
+class BackendError(Exception):
+    '''El IR no se puede traducir a Python.'''
+    pass
+
+
+# Operadores binarios -> plantilla de expresión
+BINARY_OPS = {
+    'ADDI': '({} + {})', 'SUBI': '({} - {})', 'MULI': '({} * {})',
+    'DIVI': '({} // {})', 'MODI': '({} % {})',
+    'ADDF': '(float({}) + float({}))', 'SUBF': '(float({}) - float({}))',
+    'MULF': '(float({}) * float({}))', 'DIVF': '(float({}) / float({}))',
+    'EQI': '({} == {})', 'NEI': '({} != {})', 'LTI': '({} < {})',
+    'LEI': '({} <= {})', 'GTI': '({} > {})', 'GEI': '({} >= {})',
+    'EQF': '(abs(float({}) - float({})) < 1e-9)',
+    'NEF': '(abs(float({}) - float({})) >= 1e-9)',
+    'ANDI': '(1 if {} and {} else 0)', 'ORI': '(1 if {} or {} else 0)',
+}
+
+UNARY_OPS = {
+    'ITOF': 'float({})', 'FTOI': 'int({})',
+    'PEEKI': '_mem.read_int({})', 'PEEKF': '_mem.read_float({})',
+    'PEEKB': '_mem.read_byte({})',
+}
+
+
+# Expresiones que ninguna sentencia puede cambiar: literales y temporales
+_STABLE = re.compile(r"-?\d[\d.e+-]*|t\d+")
+
+
+def _local_name(name):
+    """Variable de Python de un local; los de funciones expandidas ('f$x') van aparte"""
+    if '$' in name:
+        return 'w_' + name.replace('_', '__').replace('$', '_d')
+    return f"v_{name}"
+
+
+class _Value:
+    """Valor en la pila simulada: expresión de Python y si tiene efectos"""
+    __slots__ = ('expr', 'pure')
+
+    def __init__(self, expr, pure=True):
+        self.expr = expr
+        self.pure = pure
+
+
+class _FunctionCompiler:
+    """Traduce una IRFunction a las líneas de un 'def' de Python"""
+
+    def __init__(self, func, signatures, strings=()):
+        self.func = func
+        self.signatures = signatures
+        self.strings = strings
+        self.returns = func.return_type != 'V'
+        self.lines = []
+        self.self_loop = any(instr[0] == 'TAILCALL' and instr[1] == func.name
+                             for instr in func.instructions)
+        self.base_indent = 2 if self.self_loop else 1
+        self.indent = self.base_indent
+        self.stack = []
+        self.pending_text = []     # PRINTS / PRINTB constantes aún no emitidos
+        self.written_globals = set()
+        self.temps = 0
+        self.loops = []            # (índice de la cabecera, nº de líneas al abrir)
+        self.block_sizes = []      # nº de líneas al abrir cada bloque
+
+    # ---------- emisión ----------
+    def emit(self, line):
+        self._flush_text()
+        self.lines.append('    ' * self.indent + line)
+
+    def _flush_text(self):
+        if self.pending_text:
+            text = ''.join(self.pending_text)
+            self.pending_text = []
+            self.lines.append('    ' * self.indent + f"_write({text!r})")
+
+    def statement(self, line):
+        """Emite una sentencia; antes vuelca lo que quede en la pila"""
+        self._spill()
+        self.emit(line)
+
+    def _spill(self):
+        # Valores que quedan debajo de una sentencia (p. ej. el retorno de
+        # 'f(x);' usado como sentencia, o los operandos pendientes de una
+        # llamada expandida por iropt.py): se evalúan ahora, en orden,
+        # antes de que la sentencia cambie las variables que leen
+        for index, value in enumerate(self.stack):
+            if not value.pure or not _STABLE.fullmatch(value.expr):
+                temp = self._temp()
+                self.emit(f"{temp} = {value.expr}")
+                self.stack[index] = _Value(temp)
+
+    def _discard(self):
+        self._spill()
+        self.stack = []
+
+    def _temp(self):
+        self.temps += 1
+        return f"t{self.temps}"
+
+    def pop(self):
+        if not self.stack:
+            raise BackendError(f"Pila vacía en '{self.func.name}'")
+        return self.stack.pop()
+
+    def open_block(self):
+        self.indent += 1
+        self.block_sizes.append(len(self.lines))
+
+    def close_block(self):
+        self._flush_text()
+        if len(self.lines) == self.block_sizes.pop():
+            self.lines.append('    ' * self.indent + 'pass')
+        self.indent -= 1
+
+    # ---------- traducción ----------
+    def compile(self):
+        func = self.func
+        params = ', '.join(_local_name(p) for p in func.params)
+        header = f"def f_{func.name}({params}):"
+        for name in func.locals:
+            if name not in func.params:
+                self.emit(f"{_local_name(name)} = 0")
+
+        for instr in func.instructions:
+            self.translate(instr[0], instr[1:])
+
+        self._flush_text()
+        self._discard()
+        last = self.lines[-1].strip().split(' ')[0] if self.lines else ''
+        if not (last in ('return', 'continue') and
+                self.lines[-1].startswith('    ' * self.base_indent + last)):
+            self.emit("return 0" if self.returns else "return")
+        if self.self_loop:
+            self.lines.insert(0, "    while True:")
+        if self.written_globals:
+            names = ', '.join(f"g_{g}" for g in sorted(self.written_globals))
+            self.lines.insert(0, f"    global {names}")
+        return [header] + self.lines
+
+    def translate(self, op, args):
+        if op in ('CONSTI', 'PUSHI'):
+            self.stack.append(_Value(repr(int(args[0]))))
+        elif op == 'CONSTF':
+            self.stack.append(_Value(repr(float(args[0]))))
+        elif op in BINARY_OPS:
+            b, a = self.pop(), self.pop()
+            self.stack.append(_Value(BINARY_OPS[op].format(a.expr, b.expr), a.pure and b.pure))
+        elif op in UNARY_OPS:
+            a = self.pop()
+            self.stack.append(_Value(UNARY_OPS[op].format(a.expr), False))
+        elif op == 'LOCAL_GET':
+            self.stack.append(_Value(_local_name(args[0])))
+        elif op == 'LOCAL_SET':
+            value = self.pop()
+            self.statement(f"{_local_name(args[0])} = {value.expr}")
+        elif op == 'GLOBAL_GET':
+            self.stack.append(_Value(f"g_{args[0]}"))
+        elif op == 'GLOBAL_SET':
+            value = self.pop()
+            self.written_globals.add(args[0])
+            self.statement(f"g_{args[0]} = {value.expr}")
+        elif op == 'CALL':
+            self._call(args[0])
+        elif op == 'INTRINSIC':
+            self._intrinsic(args[0])
+        elif op == 'TAILCALL':
+            self._tailcall(args[0])
+        elif op == 'RET':
+            if self.returns:
+                value = self.pop() if self.stack else _Value('0')
+                self._discard()
+                self.emit(f"return {value.expr}")
+            else:
+                self._discard()
+                self.emit("return")
+        elif op == 'PRINTI':
+            value = self.pop()
+            self.statement(f"_write(f'{{int({value.expr})}}\\n')")
+        elif op == 'PRINTF':
+            value = self.pop()
+            self.statement(f"_write(f'{{float({value.expr})}}\\n')")
+        elif op == 'PRINTB':
+            value = self.pop()
+            if value.expr.isdigit():
+                self._spill()
+                self.pending_text.append(chr(int(value.expr)))
+            else:
+                self.statement(f"_write(chr(int({value.expr})))")
+        elif op == 'DROP':
+            value = self.pop()
+            if not value.pure:
+                self.statement(value.expr)
+        elif op == 'PRINTS':
+            self._spill()
+            self.pending_text.append(self.strings[int(args[0])])
+        elif op in ('POKEI', 'POKEF', 'POKEB'):
+            value, address = self.pop(), self.pop()
+            method = {'POKEI': 'write_int', 'POKEF': 'write_float', 'POKEB': 'write_byte'}[op]
+            self.statement(f"_mem.{method}({address.expr}, {value.expr})")
+        elif op == 'GROW':
+            value = self.pop()
+            self.statement(f"_mem.grow({value.expr})")
+        elif op in ('MEMCPY', 'MEMSET'):
+            count, value, address = self.pop(), self.pop(), self.pop()
+            method = 'copy' if op == 'MEMCPY' else 'fill'
+            self.statement(f"_mem.{method}({address.expr}, {value.expr}, {count.expr})")
+        elif op == 'MEMCMP':
+            count, b, a = self.pop(), self.pop(), self.pop()
+            self.stack.append(_Value(f"_mem.compare({a.expr}, {b.expr}, {count.expr})", False))
+        elif op == 'IF':
+            condition = self.pop()
+            self.statement(f"if {condition.expr}:")
+            self.open_block()
+        elif op == 'ELSE':
+            self._discard()
+            self.close_block()
+            self.emit("else:")
+            self.open_block()
+        elif op == 'ENDIF':
+            self._discard()
+            self.close_block()
+        elif op == 'LOOP':
+            self._discard()
+            self.emit("while True:")
+            self.open_block()
+            self.loops.append((len(self.lines) - 1, len(self.lines)))
+        elif op == 'CBREAK':
+            condition = self.pop()
+            header, size = self.loops[-1]
+            self._flush_text()
+            if len(self.lines) == size and not self.stack:
+                # La condición es lo primero del cuerpo: 'while cond:'
+                self.lines[header] = '    ' * (self.indent - 1) + f"while {condition.expr}:"
+                self.block_sizes[-1] = len(self.lines)
+            else:
+                self.statement(f"if not {condition.expr}:")
+                self.emit("    break")
+        elif op == 'CONTINUE':
+            self.statement("continue")
+        elif op == 'ENDLOOP':
+            self._discard()
+            self.close_block()
+            self.loops.pop()
+        else:
+            raise BackendError(f"Instrucción no soportada por el backend Python: {op}")
+
+    def _pop_args(self, name):
+        signature = self.signatures.get(name)
+        if signature is None:
+            raise BackendError(f"Función '{name}' no encontrada")
+        count = len(signature.params)
+        if len(self.stack) < count:
+            raise BackendError(f"Faltan argumentos para '{name}'")
+        args = self.stack[len(self.stack) - count:]
+        del self.stack[len(self.stack) - count:]
+        return signature, args
+
+    def _tailcall(self, name):
+        signature, args = self._pop_args(name)
+        if name == self.func.name and not self.loops:
+            # Recursión de cola: nuevos parámetros y de vuelta al inicio
+            if args:
+                targets = ', '.join(_local_name(p) for p in self.func.params)
+                values = ', '.join(a.expr for a in args)
+                self.statement(f"{targets} = {values}")
+            self._discard()
+            self.emit("continue")
+            return
+        expr = f"f_{name}({', '.join(a.expr for a in args)})"
+        if signature.return_type == 'V' or not self.returns:
+            self.statement(expr)
+            self._discard()
+            self.emit("return 0" if self.returns else "return")
+        else:
+            self._discard()
+            self.emit(f"return {expr}")
+
+    def _call(self, name):
+        signature, args = self._pop_args(name)
+        expr = f"f_{name}({', '.join(a.expr for a in args)})"
+        if signature.return_type == 'V':
+            self.statement(expr)
+        else:
+            self.stack.append(_Value(expr, False))
+
+    def _intrinsic(self, name):
+        if name not in INTRINSICS:
+            raise BackendError(f"Intrínseca '{name}' no encontrada")
+        count = INTRINSICS[name].arity
+        if len(self.stack) < count:
+            raise BackendError(f"Faltan argumentos para '{name}'")
+        args = self.stack[len(self.stack) - count:]
+        del self.stack[len(self.stack) - count:]
+        self.stack.append(_Value(f"_i{name}({', '.join(a.expr for a in args)})", False))
+
+
+def generate_source(module):
+    """Genera el código fuente Python de un IRModule completo"""
+    signatures = {func.name: func for func in module.functions}
+    global_names = set(module.global_vars)
+    for func in module.functions:
+        for instr in func.instructions:
+            if instr[0] in ('GLOBAL_GET', 'GLOBAL_SET'):
+                global_names.add(instr[1])
+
+    lines = ["# Generado por pybackend.py a partir del IR"]
+    for name in sorted(global_names):
+        lines.append(f"g_{name} = 0")
+    for func in module.functions:
+        lines.append("")
+        lines.extend(_FunctionCompiler(func, signatures, module.strings).compile())
+    return "\n".join(lines) + "\n"
+
+
+class PythonEngine:
+    """
+    Motor de ejecución con la misma interfaz básica que StackMachine
+    (load_module / run) que ejecuta el IR compilado a Python.
+    """
+
+    def __init__(self, memory=None, output=None):
+        self.memory = memory if memory is not None else Memory()
+        self.output = output if isinstance(output, OutputBuffer) else OutputBuffer(output)
+        self.source = ""
+        self.namespace = {}
+
+    def load_module(self, module):
+        self.source = generate_source(module)
+        self.namespace = {'_write': self.output.write, '_mem': self.memory}
+        # Intrínsecas: __gcd -> _i__gcd
+        self.namespace.update({f"_i{name}": intrinsic.function
+                               for name, intrinsic in INTRINSICS.items()})
+        code = compile(self.source, "<goxlang>", "exec")
+        exec(code, self.namespace)
+
+    @property
+    def globals(self):
+        return {name[2:]: value for name, value in self.namespace.items()
+                if name.startswith('g_')}
+
+    def run(self, entry_function="main"):
+        function = self.namespace.get(f"f_{entry_function}")
+        if function is None:
+            raise RuntimeError(f"Función '{entry_function}' no encontrada")
+        try:
+            function()
+        except ZeroDivisionError:
+            raise RuntimeError("División por cero") from None
+        finally:
+            self.output.flush()
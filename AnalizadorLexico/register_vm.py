@@ -0,0 +1,469 @@
+# register_vm.py - Máquina de registros para GoxLang
+'''
+Máquina de registros
+====================
+Tercer motor de ejecución. En lugar de apilar y desapilar cada operando,
+ejecuta una forma de tres direcciones del IR en la que cada operando es
+un índice en el arreglo de registros del frame:
+
+    LOCAL_GET i; CONSTI 1; ADDI; LOCAL_SET i   ->  ADDI r1, r1, r6
+    LOCAL_GET i; LOCAL_GET n; LTI; JUMPZ 9     ->  JUMP_IF_GE 9, r1, r0
+
+El arreglo de registros de un frame tiene, en orden:
+
+  - los slots de parámetros y locales (los mismos de StackMachine),
+  - un temporal por posición de la pila de operandos (la profundidad
+    máxima la da verifier.py),
+  - las constantes de la función, cargadas una vez en la plantilla con
+    la que se crea cada frame.
+
+La traducción simula la pila de operandos al cargar: un LOCAL_GET o una
+constante no generan código, solo apilan el registro que ya tiene el
+valor; una operación escribe en el temporal de su posición, y si la
+sigue un LOCAL_SET se escribe directo en el local. En los destinos de
+salto cada posición de la pila vuelve a su temporal, así que todos los
+caminos llegan con los valores en el mismo lugar.
+
+CALL copia los registros de los argumentos a los parámetros del frame
+nuevo y RET escribe el valor en el registro destino del llamador. Las
+llamadas no usan la pila de Python. INTRINSIC llama a la función de
+intrinsics.py con los registros de los argumentos, sin frame. La salida y los errores son los
+mismos que los de StackMachine.
+'''
+from intrinsics import INTRINSICS, lookup as lookup_intrinsic
+from lowering import JUMP_OPS, resolve_jumps
+from stack_machine import FunctionSignature, Memory, OutputBuffer
+from verifier import epilogue, stack_heights
+
+
+# Operaciones de dos operandos: destino, a, b
+BINARY_OPS = ('ADDI', 'SUBI', 'MULI', 'DIVI', 'MODI', 'ADDF', 'SUBF', 'MULF', 'DIVF',
+              'EQI', 'NEI', 'LTI', 'LEI', 'GTI', 'GEI', 'EQF', 'NEF', 'ANDI', 'ORI')
+
+UNARY_OPS = ('ITOF', 'FTOI', 'PEEKI', 'PEEKF', 'PEEKB')
+
+# Instrucciones cuyo primer operando es el registro que escriben
+VALUE_OPS = {'MOVE', 'GLOBAL_GET', 'CALL', 'INTRINSIC', 'MEMCMP', *BINARY_OPS, *UNARY_OPS}
+
+# Comparación seguida de JUMPZ -> salto por la comparación negada
+_NEGATED = {'EQI': 'JUMP_IF_NE', 'NEI': 'JUMP_IF_EQ', 'LTI': 'JUMP_IF_GE',
+            'LEI': 'JUMP_IF_GT', 'GTI': 'JUMP_IF_LE', 'GEI': 'JUMP_IF_LT'}
+
+# Opcodes enteros en el orden en que los desempaqueta _execute
+REGISTER_OPS = (
+    'MOVE', 'ADDI', 'SUBI', 'MULI', 'DIVI', 'MODI', 'ADDF', 'SUBF', 'MULF', 'DIVF',
+    'EQI', 'NEI', 'LTI', 'LEI', 'GTI', 'GEI', 'EQF', 'NEF', 'ANDI', 'ORI',
+    'ITOF', 'FTOI', 'PEEKI', 'PEEKF', 'PEEKB', 'POKEI', 'POKEF', 'POKEB', 'GROW',
+    'MEMCPY', 'MEMSET', 'MEMCMP', 'GLOBAL_GET', 'GLOBAL_SET', 'CALL', 'TAILCALL', 'RET',
+    'JUMP', 'JUMPZ', 'JUMP_IF_EQ', 'JUMP_IF_NE', 'JUMP_IF_LT', 'JUMP_IF_LE',
+    'JUMP_IF_GT', 'JUMP_IF_GE', 'PRINTI', 'PRINTF', 'PRINTB', 'PRINTS', 'INTRINSIC')
+
+OPCODE_NUMBERS = {name: number for number, name in enumerate(REGISTER_OPS)}
+
+# Saltos en forma de registros: el destino es el primer operando
+REGISTER_JUMPS = {'JUMP', 'JUMPZ', *_NEGATED.values()}
+
+
+class RegisterFunction:
+    """
+    Una función traducida: instrucciones legibles (op, a, b, c), su
+    codificación con opcodes enteros y la plantilla de registros.
+    """
+    __slots__ = ('name', 'param_count', 'returns', 'instructions', 'code',
+                 'template', 'rest', 'names')
+
+    def __init__(self, name, param_count, returns, instructions, template, names):
+        self.name = name
+        self.param_count = param_count
+        self.returns = returns
+        self.instructions = instructions
+        self.code = [(OPCODE_NUMBERS[op], a, b, c) for op, a, b, c in instructions]
+        self.template = template
+        # Lo que sigue a los parámetros en un frame nuevo
+        self.rest = template[param_count:]
+        self.names = names      # registro -> nombre del local o constante
+
+    def dump(self):
+        """Código en texto, con los registros nombrados: 'ADDI r1, r1, r6'"""
+        lines = [f"FUNCTION {self.name} ({len(self.template)} registros)"]
+        if self.names:
+            lines.append("  " + ", ".join(f"r{r}={name}" for r, name in sorted(self.names.items())))
+        for ip, (op, a, b, c) in enumerate(self.instructions):
+            operands = [_operand_text(op, index, value)
+                        for index, value in enumerate((a, b, c)) if value is not None]
+            lines.append(f"  {ip:4d}: {op} {', '.join(operands)}".rstrip())
+        return "\n".join(lines)
+
+
+def _operand_text(op, index, value):
+    if index == 0 and op in REGISTER_JUMPS:
+        return str(value)
+    if isinstance(value, int):
+        return f"r{value}"
+    if isinstance(value, tuple):
+        return "(" + ", ".join(f"r{r}" for r in value) + ")"
+    return repr(value) if op == 'PRINTS' else str(value)
+
+
+class _Lowering:
+    """Traduce el código con saltos resueltos de una función a registros"""
+
+    def __init__(self, func, signatures, strings):
+        self.func = func
+        self.signatures = signatures
+        self.strings = strings
+        self.signature = signatures[func.name]
+        self.instructions = resolve_jumps(func.instructions) + epilogue(self.signature.returns)
+        self.heights, depth = stack_heights(func.name, self.instructions, signatures)
+        self.slots = self.signature.slots
+        self.temp = len(self.slots)          # registro de la posición 0 de la pila
+        self.constants = {}                  # (tipo, valor) -> registro
+        self.first_constant = self.temp + depth
+        self.code = []
+        self.stack = []       # registro con el valor de cada posición; None: código muerto
+        self.barrier = 0      # primer índice de código después del último destino
+        self.positions = {}   # ip viejo -> índice en self.code
+
+    def constant(self, value):
+        key = (type(value), value)
+        if key not in self.constants:
+            self.constants[key] = self.first_constant + len(self.constants)
+        return self.constants[key]
+
+    def slot(self, name):
+        if name not in self.slots:
+            raise RuntimeError(f"Local '{name}' no declarado en '{self.func.name}'")
+        return self.slots[name]
+
+    def emit(self, op, a=None, b=None, c=None):
+        self.code.append((op, a, b, c))
+
+    def value(self, op, *operands):
+        """Emite una operación que deja su resultado en el temporal del tope"""
+        dest = self.temp + len(self.stack)
+        self.emit(op, dest, *operands)
+        self.stack.append(dest)
+
+    def pop(self):
+        return self.stack.pop()
+
+    def pop_many(self, count):
+        """Los 'count' registros del tope, el más profundo primero"""
+        start = len(self.stack) - count
+        values = tuple(self.stack[start:])
+        del self.stack[start:]
+        return values
+
+    def last(self):
+        """Última instrucción emitida si no hay un destino de salto en medio"""
+        return self.code[-1] if len(self.code) > self.barrier else None
+
+    def canonical(self):
+        """Lleva cada posición de la pila a su temporal (antes de un salto)"""
+        for k, register in enumerate(self.stack):
+            if register != self.temp + k:
+                self.emit('MOVE', self.temp + k, register)
+                self.stack[k] = self.temp + k
+
+    def store(self, slot):
+        value = self.pop()
+        # Los valores apilados con LOCAL_GET de este local se copian antes
+        for k, register in enumerate(self.stack):
+            if register == slot:
+                self.emit('MOVE', self.temp + k, slot)
+                self.stack[k] = self.temp + k
+        last = self.last()
+        if (last is not None and last[0] in VALUE_OPS and last[1] == value
+                and self.temp <= value < self.first_constant):
+            self.code[-1] = (last[0], slot, *last[2:])
+        elif value != slot:
+            self.emit('MOVE', slot, value)
+
+    def branch(self, target):
+        condition = self.pop()
+        last = self.last()
+        if last is not None and last[0] in _NEGATED and last[1] == condition:
+            self.code.pop()
+            self.canonical()
+            self.emit(_NEGATED[last[0]], target, last[2], last[3])
+        else:
+            self.canonical()
+            self.emit('JUMPZ', target, condition)
+
+    def lower(self):
+        targets = {instr[1] for instr in self.instructions if instr[0] in JUMP_OPS}
+        for ip, instr in enumerate(self.instructions):
+            if ip in targets:
+                if self.stack is not None:
+                    self.canonical()
+                self.positions[ip] = self.barrier = len(self.code)
+                if self.heights[ip] is not None:
+                    self.stack = [self.temp + k for k in range(self.heights[ip])]
+            if self.heights[ip] is None or self.stack is None:
+                continue
+            self.translate(instr[0], instr[1:])
+
+        code = [(op, self.positions[a], b, c) if op in REGISTER_JUMPS else (op, a, b, c)
+                for op, a, b, c in self.code]
+        template = [0] * self.first_constant
+        names = {index: name for name, index in self.slots.items()}
+        for (_, value), register in sorted(self.constants.items(), key=lambda item: item[1]):
+            template.append(value)
+            names[register] = repr(value)
+        return RegisterFunction(self.func.name, self.signature.param_count,
+                                self.signature.returns, code, template, names)
+
+    def translate(self, op, args):
+        if op in ('CONSTI', 'PUSHI'):
+            self.stack.append(self.constant(int(args[0])))
+        elif op == 'CONSTF':
+            self.stack.append(self.constant(float(args[0])))
+        elif op == 'LOCAL_GET':
+            self.stack.append(self.slot(args[0]))
+        elif op == 'LOCAL_SET':
+            self.store(self.slot(args[0]))
+        elif op == 'GLOBAL_GET':
+            self.value('GLOBAL_GET', args[0])
+        elif op == 'GLOBAL_SET':
+            self.emit('GLOBAL_SET', args[0], self.pop())
+        elif op in BINARY_OPS:
+            a, b = self.pop_many(2)
+            self.value(op, a, b)
+        elif op in UNARY_OPS:
+            self.value(op, self.pop())
+        elif op in ('POKEI', 'POKEF', 'POKEB'):
+            self.emit(op, *self.pop_many(2))
+        elif op in ('MEMCPY', 'MEMSET'):
+            self.emit(op, *self.pop_many(3))
+        elif op == 'MEMCMP':
+            a, b, count = self.pop_many(3)
+            self.value('MEMCMP', a, (b, count))
+        elif op in ('PRINTI', 'PRINTF', 'PRINTB', 'GROW'):
+            self.emit(op, self.pop())
+        elif op == 'PRINTS':
+            index = int(args[0])
+            if not 0 <= index < len(self.strings):
+                raise RuntimeError(f"Cadena {index} no encontrada en el pool")
+            self.emit('PRINTS', self.strings[index])
+        elif op == 'DROP':
+            self.pop()
+        elif op == 'CALL':
+            callee = self.signatures[args[0]]
+            params = self.pop_many(callee.param_count)
+            if callee.returns:
+                self.value('CALL', args[0], params)
+            else:
+                self.emit('CALL', None, args[0], params)
+        elif op == 'INTRINSIC':
+            intrinsic = lookup_intrinsic(args[0])
+            self.value('INTRINSIC', args[0], self.pop_many(intrinsic.arity))
+        elif op == 'TAILCALL':
+            callee = self.signatures[args[0]]
+            params = self.pop_many(callee.param_count)
+            self.emit('TAILCALL', args[0], params)
+            self.stack = None
+        elif op == 'RET':
+            self.emit('RET', self.pop() if self.signature.returns else None)
+            self.stack = None
+        elif op == 'JUMP':
+            self.canonical()
+            self.emit('JUMP', args[0])
+            self.stack = None
+        elif op == 'JUMPZ':
+            self.branch(args[0])
+        else:
+            raise RuntimeError(f"Instrucción no implementada: {op}")
+
+
+def lower_module(module):
+    """nombre -> RegisterFunction de cada función de un IRModule"""
+    signatures = {func.name: FunctionSignature.from_ir(func) for func in module.functions}
+    return {func.name: _Lowering(func, signatures, module.strings).lower()
+            for func in module.functions}
+
+
+class RegisterMachine:
+    """
+    Motor de ejecución con la misma interfaz básica que StackMachine
+    (load_module / run) que ejecuta la forma de registros del IR.
+    """
+
+    def __init__(self, memory=None, output=None):
+        self.memory = memory if memory is not None else Memory()
+        self.output = output if isinstance(output, OutputBuffer) else OutputBuffer(output)
+        self.globals = {}
+        self.functions = {}     # nombre -> RegisterFunction
+        self.result = None      # Valor devuelto por la función de entrada
+
+    def load_module(self, module):
+        self.functions.update(lower_module(module))
+
+    def dump(self):
+        return "\n\n".join(function.dump() for function in self.functions.values())
+
+    def run(self, entry_function="main"):
+        function = self.functions.get(entry_function)
+        if function is None:
+            raise RuntimeError(f"Función '{entry_function}' no encontrada")
+        try:
+            self._execute(function)
+        finally:
+            self.output.flush()
+
+    def _execute(self, function):
+        """
+        Bucle de despacho por opcode entero, como StackMachine._execute_fast.
+        frames guarda (código, registros, ip, destino) de cada llamador.
+        """
+        (MOVE, ADDI, SUBI, MULI, DIVI, MODI, ADDF, SUBF, MULF, DIVF,
+         EQI, NEI, LTI, LEI, GTI, GEI, EQF, NEF, ANDI, ORI,
+         ITOF, FTOI, PEEKI, PEEKF, PEEKB, POKEI, POKEF, POKEB, GROW,
+         MEMCPY, MEMSET, MEMCMP, GLOBAL_GET, GLOBAL_SET, CALL, TAILCALL, RET,
+         JUMP, JUMPZ, JUMP_IF_EQ, JUMP_IF_NE, JUMP_IF_LT, JUMP_IF_LE,
+         JUMP_IF_GT, JUMP_IF_GE, PRINTI, PRINTF, PRINTB, PRINTS,
+         INTRINSIC) = range(len(REGISTER_OPS))
+
+        functions = self.functions
+        intrinsics = {name: intrinsic.function for name, intrinsic in INTRINSICS.items()}
+        globals_ = self.globals
+        memory = self.memory
+        write = self.output.write
+
+        frames = []
+        code = function.code
+        regs = list(function.template)
+        ip = 0
+        while True:
+            op, a, b, c = code[ip]
+            ip += 1
+            if op == MOVE:
+                regs[a] = regs[b]
+            elif op == ADDI:
+                regs[a] = regs[b] + regs[c]
+            elif op == JUMP_IF_GE:
+                if regs[b] >= regs[c]:
+                    ip = a
+            elif op == JUMP_IF_NE:
+                if regs[b] != regs[c]:
+                    ip = a
+            elif op == JUMP_IF_EQ:
+                if regs[b] == regs[c]:
+                    ip = a
+            elif op == JUMP_IF_LT:
+                if regs[b] < regs[c]:
+                    ip = a
+            elif op == JUMP_IF_GT:
+                if regs[b] > regs[c]:
+                    ip = a
+            elif op == JUMP_IF_LE:
+                if regs[b] <= regs[c]:
+                    ip = a
+            elif op == JUMP:
+                ip = a
+            elif op == SUBI:
+                regs[a] = regs[b] - regs[c]
+            elif op == MULI:
+                regs[a] = regs[b] * regs[c]
+            elif op == MODI:
+                if regs[c] == 0:
+                    raise RuntimeError("División por cero")
+                regs[a] = regs[b] % regs[c]
+            elif op == DIVI:
+                if regs[c] == 0:
+                    raise RuntimeError("División por cero")
+                regs[a] = regs[b] // regs[c]
+            elif op == GLOBAL_GET:
+                regs[a] = globals_.get(b, 0)
+            elif op == GLOBAL_SET:
+                globals_[a] = regs[b]
+            elif op == JUMPZ:
+                if regs[b] == 0:
+                    ip = a
+            elif op == LTI:
+                regs[a] = 1 if regs[b] < regs[c] else 0
+            elif op == LEI:
+                regs[a] = 1 if regs[b] <= regs[c] else 0
+            elif op == GTI:
+                regs[a] = 1 if regs[b] > regs[c] else 0
+            elif op == GEI:
+                regs[a] = 1 if regs[b] >= regs[c] else 0
+            elif op == EQI:
+                regs[a] = 1 if regs[b] == regs[c] else 0
+            elif op == NEI:
+                regs[a] = 1 if regs[b] != regs[c] else 0
+            elif op == CALL:
+                callee = functions[b]
+                frames.append((code, regs, ip, a))
+                regs = [regs[r] for r in c]
+                regs += callee.rest
+                code = callee.code
+                ip = 0
+            elif op == TAILCALL:
+                callee = functions[a]
+                regs = [regs[r] for r in b]
+                regs += callee.rest
+                code = callee.code
+                ip = 0
+            elif op == RET:
+                # Un TAILCALL puede haber cambiado la aridad del frame
+                value = regs[a] if a is not None else 0
+                if not frames:
+                    self.result = value
+                    break
+                code, regs, ip, dest = frames.pop()
+                if dest is not None:
+                    regs[dest] = value
+            elif op == INTRINSIC:
+                regs[a] = intrinsics[b](*[regs[r] for r in c])
+            elif op == PRINTI:
+                write(f"{int(regs[a])}\n")
+            elif op == PRINTS:
+                write(a)
+            elif op == PRINTB:
+                write(chr(int(regs[a])))
+            elif op == PRINTF:
+                write(f"{float(regs[a])}\n")
+            elif op == ANDI:
+                regs[a] = 1 if regs[b] and regs[c] else 0
+            elif op == ORI:
+                regs[a] = 1 if regs[b] or regs[c] else 0
+            elif op == ADDF:
+                regs[a] = float(regs[b]) + float(regs[c])
+            elif op == SUBF:
+                regs[a] = float(regs[b]) - float(regs[c])
+            elif op == MULF:
+                regs[a] = float(regs[b]) * float(regs[c])
+            elif op == DIVF:
+                if regs[c] == 0:
+                    raise RuntimeError("División por cero")
+                regs[a] = float(regs[b]) / float(regs[c])
+            elif op == EQF:
+                regs[a] = 1 if abs(float(regs[b]) - float(regs[c])) < 1e-9 else 0
+            elif op == NEF:
+                regs[a] = 1 if abs(float(regs[b]) - float(regs[c])) >= 1e-9 else 0
+            elif op == ITOF:
+                regs[a] = float(regs[b])
+            elif op == FTOI:
+                regs[a] = int(regs[b])
+            elif op == PEEKI:
+                regs[a] = memory.read_int(regs[b])
+            elif op == PEEKF:
+                regs[a] = memory.read_float(regs[b])
+            elif op == PEEKB:
+                regs[a] = memory.read_byte(regs[b])
+            elif op == POKEI:
+                memory.write_int(regs[a], regs[b])
+            elif op == POKEF:
+                memory.write_float(regs[a], regs[b])
+            elif op == POKEB:
+                memory.write_byte(regs[a], regs[b])
+            elif op == GROW:
+                memory.grow(regs[a])
+            elif op == MEMCPY:
+                memory.copy(regs[a], regs[b], regs[c])
+            elif op == MEMSET:
+                memory.fill(regs[a], regs[b], regs[c])
+            elif op == MEMCMP:
+                regs[a] = memory.compare(regs[b], regs[c[0]], regs[c[1]])
+            else:
+                raise RuntimeError(f"Instrucción no implementada: {op}")
@@ -0,0 +1,276 @@
+# scheduler.py - Ejecución cooperativa de muchas máquinas de pila con asyncio
+'''
+Planificador cooperativo
+========================
+StackMachine.run() no devuelve el control hasta que el programa termina:
+un programa largo hace esperar a todos los que vienen detrás. Aquí cada
+programa corre en una CooperativeMachine, que ejecuta de a porciones
+(run_slice) y se detiene al cumplir el presupuesto de instrucciones o,
+con yield_on_output, después de cada PRINT*.
+
+Scheduler envuelve cada máquina en una tarea de asyncio que ejecuta una
+porción y cede el control con 'await asyncio.sleep(0)'. El event loop
+atiende las tareas listas en orden de llegada, así que las máquinas se
+turnan en round-robin dentro de un solo hilo y un programa corto termina
+en pocas vueltas aunque comparta el proceso con uno largo.
+
+  - Cada Job tiene su propio destino de salida (por defecto un
+    io.StringIO, Job.text()) y la salida se vuelca al final de cada
+    porción.
+  - Un error en tiempo de ejecución (división por cero, función que no
+    existe) termina solo su Job, en estado FAILED con Job.error.
+  - Scheduler.stats() da porciones, cambios de contexto, pausas por
+    salida, instrucciones ejecutadas y latencias.
+
+Las máquinas usan el bucle de handlers (verify=False), que guarda todo
+su estado en el objeto y se puede retomar; el bucle rápido de código
+verificado mantiene ip y pila en variables locales y no se puede cortar
+a la mitad.
+
+Uso:
+    python scheduler.py a.goxc b.goxc ... [--slice N]
+'''
+import asyncio
+import io
+import sys
+import time
+
+from stack_machine import StackMachine
+
+SLICE_SIZE = 1000
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+# Errores de ejecución del programa: terminan el Job, no el planificador
+_PROGRAM_ERRORS = (RuntimeError, IndexError, ValueError, OverflowError)
+
+
+class CooperativeMachine(StackMachine):
+    """
+    StackMachine que se ejecuta de a porciones. start() prepara el frame
+    inicial y cada run_slice(n) ejecuta hasta n instrucciones; 'executed'
+    y 'output_pauses' acumulan instrucciones y pausas por salida.
+    """
+
+    def __init__(self, memory=None, output=None, memoize=0, yield_on_output=True):
+        super().__init__(verify=False, memory=memory, output=output, memoize=memoize)
+        self.yield_on_output = yield_on_output
+        self.paused = False
+        self.executed = 0
+        self.output_pauses = 0
+
+    def start(self, entry_function="main"):
+        self.stack = []
+        self.call_stack = []
+        self._start(entry_function)
+
+    def run_slice(self, budget):
+        """
+        Ejecuta hasta 'budget' instrucciones del mismo despacho que
+        _execute; devuelve True si el programa terminó.
+        """
+        code = self.instructions
+        count = 0
+        try:
+            for count in range(1, budget + 1):
+                if code[self.ip]():
+                    if not self.running:
+                        return True
+                    code = self.instructions
+                    if self.paused:
+                        self.paused = False
+                        self.output_pauses += 1
+                        self.ip += 1
+                        return False
+                self.ip += 1
+            return False
+        finally:
+            self.executed += count
+
+    # Los PRINT* devuelven True para que run_slice vea la pausa
+    def _printed(self):
+        if self.yield_on_output:
+            self.paused = True
+            return True
+        return None
+
+    def _exec_printi(self):
+        super()._exec_printi()
+        return self._printed()
+
+    def _exec_printf(self):
+        super()._exec_printf()
+        return self._printed()
+
+    def _exec_printb(self):
+        super()._exec_printb()
+        return self._printed()
+
+    def _exec_prints(self, text):
+        super()._exec_prints(text)
+        return self._printed()
+
+
+class Job:
+    """
+    Un programa dentro del Scheduler: su máquina, estado (PENDING,
+    RUNNING, DONE, FAILED), porciones e instrucciones ejecutadas y los
+    tiempos en que entró al event loop, empezó y terminó (según el reloj
+    del Scheduler).
+    """
+
+    def __init__(self, name, machine, entry, sink):
+        self.name = name
+        self.machine = machine
+        self.entry = entry
+        self.sink = sink
+        self.state = PENDING
+        self.error = None
+        self.slices = 0
+        self.submitted = None
+        self.started = None
+        self.finished = None
+        self.task = None
+
+    @property
+    def instructions(self):
+        return self.machine.executed
+
+    @property
+    def latency(self):
+        """Tiempo desde que entró al event loop hasta terminar, o None si no terminó"""
+        return None if self.finished is None else self.finished - self.submitted
+
+    def text(self):
+        """Salida del programa cuando el destino es un io.StringIO"""
+        return self.sink.getvalue()
+
+
+class Scheduler:
+    """
+    Intercala la ejecución de muchas CooperativeMachine en un event loop
+    de asyncio. submit() agrega un programa (un IRModule o la ruta de un
+    .goxc); run() es la corrutina que espera a que terminen todos y
+    run_all() la ejecuta con asyncio.run. Dentro de un event loop que ya
+    corre, submit() arranca la tarea en el momento y se puede esperar
+    con 'await job.task'.
+    """
+
+    def __init__(self, slice_size=SLICE_SIZE, yield_on_output=True, clock=time.perf_counter):
+        if slice_size < 1:
+            raise ValueError("slice_size debe ser al menos 1")
+        self.slice_size = slice_size
+        self.yield_on_output = yield_on_output
+        self.clock = clock
+        self.jobs = []
+
+    def submit(self, program, entry="main", sink=None, name=None, memory=None, memoize=0):
+        """Carga el programa en una máquina nueva y devuelve su Job"""
+        sink = sink if sink is not None else io.StringIO()
+        machine = CooperativeMachine(memory=memory, output=sink, memoize=memoize,
+                                     yield_on_output=self.yield_on_output)
+        if isinstance(program, str):
+            machine.load_goxc(program)
+        else:
+            machine.load_module(program)
+        job = Job(name or f"job{len(self.jobs)}", machine, entry, sink)
+        self.jobs.append(job)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return job   # La tarea se crea en run()
+        self._spawn(job)
+        return job
+
+    def _spawn(self, job):
+        job.submitted = self.clock()
+        job.task = asyncio.ensure_future(self._drive(job))
+
+    async def _drive(self, job):
+        """Ejecuta el Job de a porciones, cediendo el control entre ellas"""
+        machine = job.machine
+        job.state = RUNNING
+        job.started = self.clock()
+        try:
+            machine.start(job.entry)
+            while True:
+                finished = machine.run_slice(self.slice_size)
+                job.slices += 1
+                machine.output.flush()
+                if finished:
+                    break
+                await asyncio.sleep(0)
+        except _PROGRAM_ERRORS as error:
+            job.state = FAILED
+            job.error = str(error)
+        else:
+            job.state = DONE
+        finally:
+            machine.output.flush()
+            job.finished = self.clock()
+
+    async def run(self):
+        """Espera a que terminen todos los Job, también los que se agreguen mientras tanto"""
+        while True:
+            for job in self.jobs:
+                if job.task is None:
+                    self._spawn(job)
+            pending = [job.task for job in self.jobs if not job.task.done()]
+            if not pending:
+                return self.jobs
+            await asyncio.wait(pending)
+
+    def run_all(self):
+        return asyncio.run(self.run())
+
+    def stats(self):
+        """
+        Estadísticas de los Job terminados: cantidad, fallidos, porciones,
+        cambios de contexto (porciones que no terminaron su programa),
+        pausas por salida, instrucciones y latencia media y máxima.
+        """
+        finished = [job for job in self.jobs if job.finished is not None]
+        latencies = [job.latency for job in finished]
+        slices = sum(job.slices for job in self.jobs)
+        return {
+            'jobs': len(self.jobs),
+            'done': sum(job.state == DONE for job in self.jobs),
+            'failed': sum(job.state == FAILED for job in self.jobs),
+            'slices': slices,
+            'switches': slices - len(finished),
+            'output_pauses': sum(job.machine.output_pauses for job in self.jobs),
+            'instructions': sum(job.instructions for job in self.jobs),
+            'mean_latency': sum(latencies) / len(latencies) if latencies else 0.0,
+            'max_latency': max(latencies, default=0.0),
+        }
+
+
+# ════════════════════════════════════════════════════════════════
+#  EJECUCIÓN DE VARIOS MÓDULOS COMPILADOS
+# ════════════════════════════════════════════════════════════════
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    slice_size = SLICE_SIZE
+    if "--slice" in args:
+        index = args.index("--slice")
+        slice_size = int(args[index + 1])
+        del args[index:index + 2]
+    if not args:
+        print("Uso: python scheduler.py a.goxc b.goxc ... [--slice N]")
+        sys.exit(1)
+
+    scheduler = Scheduler(slice_size)
+    for filename in args:
+        scheduler.submit(filename, name=filename)
+    scheduler.run_all()
+
+    for job in scheduler.jobs:
+        print(f"--- {job.name} ({job.state}, {job.instructions:,} instrucciones, "
+              f"{job.latency:.3f} s) ---")
+        print(job.text(), end="")
+        if job.error:
+            print(f"ERROR: {job.error}")
+    stats = scheduler.stats()
+    print(f"\n{stats['jobs']} programas, {stats['slices']} porciones de {slice_size}, "
+          f"{stats['output_pauses']} pausas por salida, latencia media {stats['mean_latency']:.3f} s")
@@ -1,37 +1,91 @@
 # stack_machine.py - Máquina de Pila Completa para GoxLang
+import ast
+import io
+import operator
 import re
 import struct
+import sys
+from collections import OrderedDict
+from functools import partial
+
+from lowering import resolve_jumps
+from peephole import fuse
+from goxc import GoxcModule, OPCODE_NUMBERS
+from intrinsics import lookup as lookup_intrinsic
+from verifier import VerifyError, epilogue, verify_function
 
 class Memory:
-    """Memoria lineal byte-addressable"""
+    """
+    Memoria lineal byte-addressable. Los accesos alineados a 4 bytes usan
+    vistas memoryview.cast('i') / cast('f') cacheadas sobre el bytearray,
+    así que PEEK/POKE no copian ni empaquetan; los no alineados usan
+    struct.unpack_from / pack_into, que tampoco crean copias.
+    """
+    _INT = struct.Struct('<i')
+    _FLOAT = struct.Struct('<f')
+    # Las vistas usan el orden nativo; el formato de la memoria es little endian
+    _NATIVE_VIEWS = sys.byteorder == 'little'
+    
     def __init__(self, initial_size=4096):
         self.data = bytearray(initial_size)
         self.size = initial_size
+        self._ints = None
+        self._floats = None
         
     def grow(self, new_size):
         if new_size > self.size:
+            # Un bytearray con vistas exportadas no se puede redimensionar
+            self._release_views()
             self.data.extend(bytearray(new_size - self.size))
             self.size = new_size
     
+    def _release_views(self):
+        for view in (self._ints, self._floats):
+            if view is not None:
+                view.release()
+        self._ints = self._floats = None
+    
+    def _int_view(self):
+        if self._ints is None:
+            usable = self.size - self.size % 4
+            self._ints = memoryview(self.data)[:usable].cast('i')
+        return self._ints
+    
+    def _float_view(self):
+        if self._floats is None:
+            usable = self.size - self.size % 4
+            self._floats = memoryview(self.data)[:usable].cast('f')
+        return self._floats
+    
     def _check_bounds(self, address, size):
         if address < 0 or address + size > self.size:
             raise IndexError(f"Dirección de memoria fuera de límites: {address}")
     
     def read_int(self, address):
         self._check_bounds(address, 4)
-        return struct.unpack('<i', self.data[address:address+4])[0]
+        if address & 3 == 0 and self._NATIVE_VIEWS:
+            return (self._ints or self._int_view())[address >> 2]
+        return self._INT.unpack_from(self.data, address)[0]
     
     def write_int(self, address, value):
         self._check_bounds(address, 4)
-        self.data[address:address+4] = struct.pack('<i', value)
+        if address & 3 == 0 and self._NATIVE_VIEWS:
+            (self._ints or self._int_view())[address >> 2] = value
+        else:
+            self._INT.pack_into(self.data, address, value)
     
     def read_float(self, address):
         self._check_bounds(address, 4)
-        return struct.unpack('<f', self.data[address:address+4])[0]
+        if address & 3 == 0 and self._NATIVE_VIEWS:
+            return (self._floats or self._float_view())[address >> 2]
+        return self._FLOAT.unpack_from(self.data, address)[0]
     
     def write_float(self, address, value):
         self._check_bounds(address, 4)
-        self.data[address:address+4] = struct.pack('<f', value)
+        if address & 3 == 0 and self._NATIVE_VIEWS:
+            (self._floats or self._float_view())[address >> 2] = float(value)
+        else:
+            self._FLOAT.pack_into(self.data, address, value)
     
     def read_byte(self, address):
         self._check_bounds(address, 1)
@@ -40,42 +94,377 @@ class Memory:
     def write_byte(self, address, value):
         self._check_bounds(address, 1)
         self.data[address] = value & 0xFF
+    
+    # --- Operaciones en bloque (asignación de slices) ---
+    def copy(self, dst, src, count):
+        if count <= 0:
+            return
+        self._check_bounds(src, count)
+        self._check_bounds(dst, count)
+        self.data[dst:dst + count] = self.data[src:src + count]
+    
+    def fill(self, address, value, count):
+        if count <= 0:
+            return
+        self._check_bounds(address, count)
+        self.data[address:address + count] = bytes((value & 0xFF,)) * count
+    
+    def compare(self, a, b, count):
+        """-1, 0 o 1 comparando count bytes desde a y desde b"""
+        if count <= 0:
+            return 0
+        self._check_bounds(a, count)
+        self._check_bounds(b, count)
+        left, right = self.data[a:a + count], self.data[b:b + count]
+        return (left > right) - (left < right)
+
+class PagedMemory:
+    """
+    Memoria lineal dispersa con la misma interfaz que Memory. El espacio
+    de direcciones se divide en páginas de PAGE_SIZE bytes que se crean
+    en la primera escritura; las páginas nunca escritas se leen de una
+    única página de ceros compartida (copy-on-write). GROW solo amplía
+    el límite, así que la memoria residente es proporcional a las
+    páginas tocadas. La última página usada se guarda con sus vistas
+    cast('i') / cast('f') para que los accesos seguidos no consulten la
+    tabla de páginas.
+    """
+    PAGE_BITS = 12
+    PAGE_SIZE = 1 << PAGE_BITS
+    _OFFSET_MASK = PAGE_SIZE - 1
+    _ZERO_PAGE = bytes(PAGE_SIZE)
+    _INT = Memory._INT
+    _FLOAT = Memory._FLOAT
+    _NATIVE_VIEWS = Memory._NATIVE_VIEWS
+    
+    def __init__(self, initial_size=4096):
+        self.size = initial_size
+        self.pages = {}            # número de página -> (bytearray, vista 'i', vista 'f')
+        self._last_number = -1
+        self._last = None
+    
+    @property
+    def resident_bytes(self):
+        return len(self.pages) * self.PAGE_SIZE
+    
+    def grow(self, new_size):
+        if new_size > self.size:
+            self.size = new_size
+    
+    def _check_bounds(self, address, size):
+        if address < 0 or address + size > self.size:
+            raise IndexError(f"Dirección de memoria fuera de límites: {address}")
+    
+    def _page(self, number):
+        """Página escrita (y cacheada) o None si nunca se escribió"""
+        if number == self._last_number:
+            return self._last
+        entry = self.pages.get(number)
+        if entry is not None:
+            self._last_number, self._last = number, entry
+        return entry
+    
+    def _writable_page(self, number):
+        entry = self._page(number)
+        if entry is None:
+            data = bytearray(self._ZERO_PAGE)
+            entry = (data, memoryview(data).cast('i'), memoryview(data).cast('f'))
+            self.pages[number] = entry
+            self._last_number, self._last = number, entry
+        return entry
+    
+    def _read_span(self, address, count):
+        """Copia count bytes que pueden cruzar páginas"""
+        out = bytearray()
+        while count > 0:
+            offset = address & self._OFFSET_MASK
+            chunk = min(count, self.PAGE_SIZE - offset)
+            entry = self._page(address >> self.PAGE_BITS)
+            out += entry[0][offset:offset + chunk] if entry else bytes(chunk)
+            address += chunk
+            count -= chunk
+        return out
+    
+    def _write_span(self, address, data):
+        pos = 0
+        while pos < len(data):
+            offset = address & self._OFFSET_MASK
+            chunk = min(len(data) - pos, self.PAGE_SIZE - offset)
+            page = self._writable_page(address >> self.PAGE_BITS)[0]
+            page[offset:offset + chunk] = data[pos:pos + chunk]
+            address += chunk
+            pos += chunk
+    
+    def read_int(self, address):
+        self._check_bounds(address, 4)
+        offset = address & self._OFFSET_MASK
+        if offset & 3 == 0 and self._NATIVE_VIEWS:
+            entry = self._page(address >> self.PAGE_BITS)
+            return entry[1][offset >> 2] if entry else 0
+        return self._INT.unpack(self._read_span(address, 4))[0]
+    
+    def write_int(self, address, value):
+        self._check_bounds(address, 4)
+        offset = address & self._OFFSET_MASK
+        if offset & 3 == 0 and self._NATIVE_VIEWS:
+            self._writable_page(address >> self.PAGE_BITS)[1][offset >> 2] = value
+        else:
+            self._write_span(address, self._INT.pack(value))
+    
+    def read_float(self, address):
+        self._check_bounds(address, 4)
+        offset = address & self._OFFSET_MASK
+        if offset & 3 == 0 and self._NATIVE_VIEWS:
+            entry = self._page(address >> self.PAGE_BITS)
+            return entry[2][offset >> 2] if entry else 0.0
+        return self._FLOAT.unpack(self._read_span(address, 4))[0]
+    
+    def write_float(self, address, value):
+        self._check_bounds(address, 4)
+        offset = address & self._OFFSET_MASK
+        if offset & 3 == 0 and self._NATIVE_VIEWS:
+            self._writable_page(address >> self.PAGE_BITS)[2][offset >> 2] = float(value)
+        else:
+            self._write_span(address, self._FLOAT.pack(value))
+    
+    def read_byte(self, address):
+        self._check_bounds(address, 1)
+        entry = self._page(address >> self.PAGE_BITS)
+        return entry[0][address & self._OFFSET_MASK] if entry else 0
+    
+    def write_byte(self, address, value):
+        self._check_bounds(address, 1)
+        page = self._writable_page(address >> self.PAGE_BITS)[0]
+        page[address & self._OFFSET_MASK] = value & 0xFF
+    
+    # --- Operaciones en bloque ---
+    def copy(self, dst, src, count):
+        if count <= 0:
+            return
+        self._check_bounds(src, count)
+        self._check_bounds(dst, count)
+        self._write_span(dst, self._read_span(src, count))
+    
+    def fill(self, address, value, count):
+        if count <= 0:
+            return
+        self._check_bounds(address, count)
+        if value & 0xFF == 0:
+            # Ceros: las páginas que nunca se escribieron ya los tienen
+            end = address + count
+            while address < end:
+                offset = address & self._OFFSET_MASK
+                chunk = min(end - address, self.PAGE_SIZE - offset)
+                entry = self._page(address >> self.PAGE_BITS)
+                if entry:
+                    entry[0][offset:offset + chunk] = bytes(chunk)
+                address += chunk
+            return
+        self._write_span(address, bytes((value & 0xFF,)) * count)
+    
+    def compare(self, a, b, count):
+        if count <= 0:
+            return 0
+        self._check_bounds(a, count)
+        self._check_bounds(b, count)
+        left, right = self._read_span(a, count), self._read_span(b, count)
+        return (left > right) - (left < right)
+
+
+# Implementaciones de memoria seleccionables (main.py --memory=...)
+MEMORY_KINDS = {'flat': Memory, 'paged': PagedMemory}
+
+class OutputBuffer:
+    """
+    Salida del programa con buffer. PRINTI/PRINTF/PRINTB escriben aquí y
+    el texto acumulado se vuelca al destino cuando supera 'threshold'
+    caracteres y al terminar run() (también si hubo un error).
+
+    El destino puede ser cualquier objeto con write(str) (sys.stdout,
+    io.StringIO, un archivo de texto), un archivo binario o un bytearray
+    (se escribe en UTF-8). Con sink=None se usa el sys.stdout vigente en
+    el momento de volcar, así funciona con contextlib.redirect_stdout.
+    """
+    def __init__(self, sink=None, threshold=8192):
+        self.sink = sink
+        self.threshold = threshold
+        self.parts = []
+        self.pending = 0
+    
+    def write(self, text):
+        self.parts.append(text)
+        self.pending += len(text)
+        if self.pending >= self.threshold:
+            self.flush()
+    
+    def flush(self):
+        if not self.parts:
+            return
+        text = ''.join(self.parts)
+        self.parts = []
+        self.pending = 0
+        sink = self.sink if self.sink is not None else sys.stdout
+        if isinstance(sink, bytearray):
+            sink += text.encode('utf-8')
+        elif isinstance(sink, (io.RawIOBase, io.BufferedIOBase)):
+            sink.write(text.encode('utf-8'))
+        else:
+            sink.write(text)
+        if hasattr(sink, 'flush'):
+            sink.flush()
+
+class FunctionSignature:
+    """
+    Entrada de la tabla de firmas: parámetros, distribución de slots
+    (primero los parámetros, luego los locales) y aridad de retorno.
+    """
+    def __init__(self, name, params, param_types=None, locals_=None, return_type='I'):
+        self.name = name
+        self.params = list(params)
+        self.param_types = list(param_types or ['I'] * len(self.params))
+        self.return_type = return_type
+        self.param_count = len(self.params)
+        self.returns = 0 if return_type == 'V' else 1
+        layout = self.params + [n for n in (locals_ or {}) if n not in self.params]
+        self.slots = {name: index for index, name in enumerate(layout)}
+        # Valores iniciales de los slots que no son parámetros
+        self.local_defaults = [0] * (len(layout) - self.param_count)
+        self.max_stack = None  # Profundidad de pila, la fija el verificador
+        self.pure = False      # Marcada por consteval.mark_pure_functions
+        self.memo = None       # MemoCache de sus resultados, si la máquina memoiza
+
+    @classmethod
+    def from_ir(cls, func):
+        signature = cls(func.name, func.params, func.param_types, func.locals, func.return_type)
+        signature.pure = getattr(func, 'pure', False)
+        return signature
+
+# Entradas por función de la memoización por defecto (main.py --memo=N)
+MEMO_SIZE = 1024
+
+# Resultado ausente en un MemoCache (cualquier valor puede estar guardado)
+_MISSING = object()
+
+class MemoCache:
+    """
+    Resultados de una función pura por tupla de argumentos, en un LRU de
+    a lo sumo 'size' entradas, con contadores de aciertos y fallos.
+    """
+    __slots__ = ('entries', 'size', 'hits', 'misses')
+
+    def __init__(self, size):
+        self.entries = OrderedDict()
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entries = self.entries
+        if key in entries:
+            entries.move_to_end(key)
+            self.hits += 1
+            return entries[key]
+        self.misses += 1
+        return _MISSING
+
+    def put(self, key, value):
+        entries = self.entries
+        entries[key] = value
+        if len(entries) > self.size:
+            entries.popitem(last=False)
 
 class CallFrame:
-    """Frame de activación para funciones"""
-    def __init__(self, function_name, return_address, params_count=0):
+    """
+    Frame de activación: código de la función, ip de retorno en el
+    código del llamador y arreglo de slots de locales.
+    """
+    __slots__ = ('function_name', 'return_address', 'signature', 'code',
+                 'locals', 'params_count', 'stack_base', 'returns',
+                 'operands', 'sp', 'memo')
+
+    def __init__(self, function_name, return_address, signature, code=None, locals_=None):
         self.function_name = function_name
         self.return_address = return_address
-        self.locals = {}
-        self.params_count = params_count
+        self.signature = signature
+        self.code = code
+        self.locals = locals_ if locals_ is not None else [0] * len(signature.slots)
+        self.params_count = signature.param_count
+        self.stack_base = 0
+        self.returns = signature.returns  # Lo que espera el llamador original
+        # Camino verificado: pila de operandos propia y su tope guardado
+        self.operands = None
+        self.sp = 0
+        # (MemoCache, argumentos) donde RET guarda el resultado
+        self.memo = None
         
     def set_local(self, name, value):
-        self.locals[name] = value
+        self.locals[self.signature.slots[name]] = value
         
     def get_local(self, name):
-        return self.locals.get(name, 0)
+        return self.locals[self.signature.slots[name]]
+
+# Opcodes enteros en el orden en que los desempaqueta _execute_fast
+_FAST_OPCODES = tuple(OPCODE_NUMBERS[name] for name in (
+    'CONSTI', 'CONSTF', 'ADDI', 'SUBI', 'MULI', 'DIVI', 'MODI',
+    'ADDF', 'SUBF', 'MULF', 'DIVF',
+    'EQI', 'NEI', 'LTI', 'LEI', 'GTI', 'GEI', 'EQF', 'NEF', 'ANDI', 'ORI', 'ITOF', 'FTOI',
+    'PEEKI', 'POKEI', 'PEEKF', 'POKEF', 'PEEKB', 'POKEB', 'GROW',
+    'MEMCPY', 'MEMSET', 'MEMCMP',
+    'LOCAL_GET', 'LOCAL_SET', 'GLOBAL_GET', 'GLOBAL_SET', 'CALL', 'TAILCALL', 'RET',
+    'JUMP', 'JUMPZ', 'PRINTI', 'PRINTF', 'PRINTB', 'PRINTS', 'DROP',
+    'INC_LOCAL', 'LOCAL_GET2', 'LOCAL_CONST', 'INC_GLOBAL', 'GLOBAL_CONST',
+    'JUMP_IF_EQ', 'JUMP_IF_NE', 'JUMP_IF_LT', 'JUMP_IF_LE', 'JUMP_IF_GT', 'JUMP_IF_GE',
+    'INTRINSIC'))
 
 class StackMachine:
     """
     Máquina virtual basada en pila para GoxLang IR.
     Compatible con el output de tu IRCodeGenerator existente.
+    
+    Con verify=True (por defecto) cada función pasa por verifier.py al
+    cargarse y se ejecuta en el bucle rápido sin comprobaciones; con
+    verify=False se usa el bucle de handlers, que tolera código
+    desbalanceado.
+    
+    Con superinstructions=True (por defecto) el código bajado pasa por
+    peephole.py, que fusiona secuencias frecuentes en una instrucción.
+    
+    Con memoize=N > 0 los resultados de las funciones marcadas como puras
+    (FunctionSignature.pure) se guardan en un MemoCache de N entradas por
+    función: un CALL con argumentos ya vistos apila el resultado sin
+    ejecutar la función. memo_stats() da aciertos y fallos.
     """
     
-    def __init__(self):
+    def __init__(self, verify=True, memory=None, output=None, superinstructions=True,
+                 memoize=0):
         # Componentes principales
         self.stack = []
         self.call_stack = []
-        self.memory = Memory()
+        self.memory = memory if memory is not None else Memory()
+        # Destino de PRINT*: un OutputBuffer, o el sink para crear uno
+        self.output = output if isinstance(output, OutputBuffer) else OutputBuffer(output)
         self.globals = {}
         
         # Control de ejecución
-        self.functions = {}
+        self.functions = {}      # IR con saltos resueltos, por nombre
+        self.signatures = {}
+        self.strings = []        # Pool de cadenas del módulo (PRINTS)
+        self.code = {}           # Código pre-decodificado, por nombre
+        self.profiled_code = {}  # Código de handlers para run(profiler=...)
         self.ip = 0
-        self.instructions = []
+        self.instructions = []   # Código pre-decodificado en ejecución
+        self.locals = []         # Slots del frame activo
         self.running = True
+        self.verify = verify
+        self.superinstructions = superinstructions
+        self.memoize = memoize
         
-        # Control de flujo
-        self.loop_stack = []
+        # Tabla opcode -> handler, construida una sola vez
+        self.handlers = {
+            attr[len('_exec_'):].upper(): getattr(self, attr)
+            for attr in dir(self) if attr.startswith('_exec_')
+        }
+        self._ret_handler = self.handlers['RET']
 
     # ════════════════════════════════════════════════════════════════
     #  CARGA DE PROGRAMA - Compatible con tu formato IR existente
@@ -87,6 +476,29 @@ class StackMachine:
             content = f.read()
         self.load_ir_from_string(content)
     
+    def load_module(self, module):
+        """Carga un IRModule ya generado, sin pasar por el texto de output.ir"""
+        self.strings = list(module.strings)
+        for func in module.functions:
+            self.functions[func.name] = self._lower(func.instructions)
+            signature = FunctionSignature.from_ir(func)
+            if self.memoize and signature.pure and signature.returns:
+                signature.memo = MemoCache(self.memoize)
+            self.signatures[func.name] = signature
+        self._decode_all()
+    
+    def load_goxc(self, filename):
+        """Carga un módulo .goxc; cada función se decodifica en su primer CALL"""
+        self.module_file = GoxcModule.open(filename)
+        self.strings = self.module_file.strings
+        self.functions = self.module_file.lazy_functions(self._lower)
+        for name, info in self.module_file.function_info.items():
+            signature = FunctionSignature(
+                name, info.params, info.param_types, info.locals, info.return_type)
+            # El verificador debe llegar a la misma profundidad que la cabecera
+            signature.max_stack = info.max_stack
+            self.signatures[name] = signature
+    
     def load_ir_from_string(self, ir_content):
         """Parsea el formato IR de tu IRCodeGenerator"""
         lines = [line.strip() for line in ir_content.split('\n') if line.strip()]
@@ -97,19 +509,25 @@ class StackMachine:
         for line in lines:
             if line.startswith("MODULE:::"):
                 continue
+            elif line.startswith("STRINGS:::"):
+                self.strings = ast.literal_eval(line[len("STRINGS:::"):].strip())
             elif line.startswith("FUNCTION:::"):
                 # Guardar función anterior
                 if current_func:
-                    self.functions[current_func] = current_instructions
+                    self.functions[current_func] = self._lower(current_instructions)
                 
                 # Parsear: FUNCTION::: name, [params], [types] return_type
-                parts = line.split(',', 1)
-                func_name = parts[0].split()[-1]
-                current_func = func_name
+                signature = self._parse_function_header(line)
+                self.signatures[signature.name] = signature
+                current_func = signature.name
                 current_instructions = []
                 
-            elif line.startswith("locals:"):
-                continue  # Ignorar metadata de locals
+            elif line.startswith("locals:") and current_func:
+                signature = self.signatures[current_func]
+                locals_ = ast.literal_eval(line[len("locals:"):].strip())
+                self.signatures[current_func] = FunctionSignature(
+                    signature.name, signature.params, signature.param_types,
+                    locals_, signature.return_type)
             elif line.startswith("(") and current_func:
                 # Parsear instrucción en formato tupla
                 instruction = self._parse_instruction_tuple(line)
@@ -118,7 +536,24 @@ class StackMachine:
         
         # Guardar última función
         if current_func:
-            self.functions[current_func] = current_instructions
+            self.functions[current_func] = self._lower(current_instructions)
+        self._decode_all()
+    
+    def _lower(self, instructions):
+        """Saltos resueltos y, si corresponde, superinstrucciones"""
+        code = resolve_jumps(instructions)
+        return fuse(code) if self.superinstructions else code
+    
+    _HEADER_RE = re.compile(r"FUNCTION:::\s*(\w+),\s*(\[.*?\]),\s*(\[.*?\])\s*(\w+)")
+
+    def _parse_function_header(self, line):
+        """Convierte 'FUNCTION::: name, [params], [types] ret' en una firma"""
+        match = self._HEADER_RE.match(line)
+        if not match:
+            raise RuntimeError(f"Cabecera de función inválida: {line}")
+        name, params, types, return_type = match.groups()
+        return FunctionSignature(name, ast.literal_eval(params),
+                                 ast.literal_eval(types), None, return_type)
     
     def _parse_instruction_tuple(self, line):
         """Convierte ('OP', 'arg1', 'arg2') a ['OP', 'arg1', 'arg2']"""
@@ -145,47 +580,483 @@ class StackMachine:
         
         return result if result else None
 
+    # ════════════════════════════════════════════════════════════════
+    #  PRE-DECODIFICACIÓN
+    # ════════════════════════════════════════════════════════════════
+    
+    def _decode_all(self):
+        for name in self.functions:
+            self._code_for(name)
+    
+    def _code_for(self, func_name):
+        """Código pre-decodificado de una función (se decodifica una vez)"""
+        code = self.code.get(func_name)
+        if code is None:
+            if func_name not in self.functions:
+                raise RuntimeError(f"Función '{func_name}' no encontrada")
+            instructions = self.functions[func_name]
+            if self.verify:
+                code = self._decode_verified(func_name, instructions)
+            else:
+                code = self._decode(func_name, instructions)
+            self.code[func_name] = code
+        return code
+    
+    def _operands(self, func_name, op, args):
+        """Resuelve los operandos: slot del local, entero o flotante"""
+        def slot(name):
+            slots = self.signatures[func_name].slots
+            if name not in slots:
+                raise RuntimeError(f"Local '{name}' no declarado en '{func_name}'")
+            return slots[name]
+        
+        if op in ('LOCAL_GET', 'LOCAL_SET'):
+            return (slot(args[0]),)
+        if op in ('INC_LOCAL', 'LOCAL_CONST'):
+            return (slot(args[0]), int(args[1]))
+        if op in ('INC_GLOBAL', 'GLOBAL_CONST'):
+            return (args[0], int(args[1]))
+        if op == 'LOCAL_GET2':
+            return (slot(args[0]), slot(args[1]))
+        if op in ('CONSTI', 'PUSHI'):
+            return (int(args[0]),)
+        if op == 'CONSTF':
+            return (float(args[0]),)
+        if op == 'INTRINSIC':
+            # El operando pasa a ser la función de Python y su aridad
+            intrinsic = lookup_intrinsic(args[0])
+            return (intrinsic.function, intrinsic.arity)
+        if op == 'PRINTS':
+            # El operando pasa a ser la cadena misma
+            index = int(args[0])
+            if not 0 <= index < len(self.strings):
+                raise RuntimeError(f"Cadena {index} no encontrada en el pool")
+            return (self.strings[index],)
+        return args
+    
+    def _decode(self, func_name, instructions):
+        """
+        Convierte cada instrucción en un callable sin argumentos: el handler
+        enlazado, o un partial con el operando ya resuelto (slot del local,
+        entero, destino del salto). Se agrega un RET final para las
+        funciones que terminan sin return.
+        """
+        code = []
+        for instr in instructions:
+            op, args = instr[0], instr[1:]
+            handler = self.handlers.get(op)
+            if handler is None:
+                raise RuntimeError(f"Instrucción no implementada: {op}")
+            args = self._operands(func_name, op, args)
+            code.append(partial(handler, *args) if args else handler)
+        code.append(self._ret_handler)
+        return code
+    
+    def _decode_verified(self, func_name, instructions):
+        """
+        Verifica la función y la convierte en tuplas (opcode entero,
+        operando) para _execute_fast. El cierre implícito deja 0 en la pila
+        si la función devuelve valor, así RET siempre encuentra la aridad.
+        """
+        signature = self.signatures[func_name]
+        instructions = list(instructions) + epilogue(signature.returns)
+        depth = verify_function(func_name, instructions, self.signatures)
+        # Las superinstrucciones pueden bajar la profundidad, nunca subirla
+        if signature.max_stack is not None and depth > signature.max_stack:
+            raise VerifyError(f"{func_name}: la cabecera declara pila {signature.max_stack}, "
+                              f"el código necesita {depth}")
+        signature.max_stack = depth
+        
+        code = []
+        for instr in instructions:
+            op, args = instr[0], instr[1:]
+            args = self._operands(func_name, op, args)
+            if op == 'PUSHI':
+                op = 'CONSTI'   # Mismo efecto: una comparación menos en el bucle
+            # Las superinstrucciones de dos operandos los reciben como tupla
+            arg = args[0] if len(args) == 1 else (tuple(args) or None)
+            code.append((OPCODE_NUMBERS[op], arg))
+        return code
+
     # ════════════════════════════════════════════════════════════════
     #  EJECUCIÓN PRINCIPAL
     # ════════════════════════════════════════════════════════════════
     
-    def run(self, entry_function="main"):
-        """Ejecuta programa desde función especificada"""
-        if entry_function not in self.functions:
-            raise RuntimeError(f"Función '{entry_function}' no encontrada")
+    def run(self, entry_function="main", profiler=None):
+        """
+        Ejecuta programa desde función especificada. Con un
+        profiler.Profiler se usa _execute_profiled sobre el código de
+        handlers (en su propio caché); sin él, el bucle normal.
+        """
+        if profiler is not None:
+            saved = self.code, self.verify
+            self.code, self.verify = self.profiled_code, False
+            try:
+                self._start(entry_function)
+                self._execute_profiled(profiler)
+            finally:
+                self.code, self.verify = saved
+                self.output.flush()
+            return
         
-        # Frame inicial
-        initial_frame = CallFrame(entry_function, -1)
-        self.call_stack.append(initial_frame)
+        initial_frame = self._start(entry_function)
+        try:
+            if self.verify:
+                initial_frame.operands = [0] * initial_frame.signature.max_stack
+                self._execute_fast()
+            else:
+                self._execute()
+        finally:
+            self.output.flush()
+    
+    def _start(self, entry_function):
+        code = self._code_for(entry_function)
         
-        # Cargar instrucciones
-        self.instructions = self.functions[entry_function]
+        # Frame inicial: al retornar de él termina la ejecución
+        initial_frame = CallFrame(entry_function, -1, self.signatures[entry_function], code)
+        initial_frame.stack_base = len(self.stack)
+        self.call_stack.append(initial_frame)
+        self.locals = initial_frame.locals
+        self.instructions = code
         self.ip = 0
         self.running = True
-        
-        # Ejecutar
-        while self.running and self.ip < len(self.instructions):
-            self._execute_instruction()
+        return initial_frame
+    
+    def _execute(self):
+        """
+        Bucle de despacho único. CALL y RET solo apilan/desapilan frames y
+        cambian instructions/ip, así que la recursión de GoxLang no usa la
+        pila de Python. Los handlers que cambian de código devuelven True;
+        el resto devuelve None y el bucle sigue con el mismo código.
+        """
+        code = self.instructions
+        while True:
+            if code[self.ip]():
+                if not self.running:
+                    break
+                code = self.instructions
             self.ip += 1
+
+    def _execute_profiled(self, profiler):
+        """
+        Mismo despacho que _execute, midiendo cada handler. Los cambios
+        de profundidad de call_stack marcan entrada y salida de funciones
+        (un TAILCALL cuenta como salida de una y entrada a otra).
+        """
+        clock = profiler.clock
+        call_stack = self.call_stack
+        functions = self.functions
+        
+        frame = call_stack[-1]
+        name = frame.function_name
+        source = functions[name]
+        code = self.instructions
+        started = clock()
+        profiler.enter(name, started)
+        try:
+            while True:
+                ip = self.ip
+                op = source[ip][0] if ip < len(source) else 'RET'
+                depth = len(call_stack)
+                start = clock()
+                switched = code[ip]()
+                end = clock()
+                profiler.instruction(name, ip, op, end - start)
+                if switched:
+                    if not self.running:
+                        break
+                    if len(call_stack) < depth or op == 'TAILCALL':
+                        profiler.leave(end)
+                    if len(call_stack) > depth or op == 'TAILCALL':
+                        profiler.enter(call_stack[-1].function_name, end)
+                    code = self.instructions
+                    name = call_stack[-1].function_name
+                    source = functions[name]
+                self.ip += 1
+        finally:
+            profiler.finish(clock(), started)
     
-    def _execute_instruction(self):
-        """Ejecuta instrucción actual"""
-        if self.ip >= len(self.instructions):
-            return
-            
-        instr = self.instructions[self.ip]
-        if not instr:
-            return
-            
-        op = instr[0]
-        args = instr[1:] if len(instr) > 1 else []
+    def _execute_fast(self):
+        """
+        Bucle para código verificado: despacho por opcode entero en un solo
+        if/elif, con la pila de operandos de cada frame preasignada a su
+        profundidad máxima y el tope en la variable local sp. No hay
+        comprobaciones de underflow ni de aridad: el verificador ya
+        garantizó que cada instrucción encuentra sus operandos.
+        """
+        (CONSTI, CONSTF, ADDI, SUBI, MULI, DIVI, MODI, ADDF, SUBF, MULF, DIVF,
+         EQI, NEI, LTI, LEI, GTI, GEI, EQF, NEF, ANDI, ORI, ITOF, FTOI,
+         PEEKI, POKEI, PEEKF, POKEF, PEEKB, POKEB, GROW, MEMCPY, MEMSET, MEMCMP,
+         LOCAL_GET, LOCAL_SET, GLOBAL_GET, GLOBAL_SET, CALL, TAILCALL, RET,
+         JUMP, JUMPZ, PRINTI, PRINTF, PRINTB, PRINTS, DROP,
+         INC_LOCAL, LOCAL_GET2, LOCAL_CONST, INC_GLOBAL, GLOBAL_CONST,
+         JUMP_IF_EQ, JUMP_IF_NE, JUMP_IF_LT, JUMP_IF_LE, JUMP_IF_GT, JUMP_IF_GE,
+         INTRINSIC) = _FAST_OPCODES
         
-        # Dispatch dinámico
-        method_name = f"_exec_{op.lower()}"
-        if hasattr(self, method_name):
-            getattr(self, method_name)(*args)
-        else:
-            raise RuntimeError(f"Instrucción no implementada: {op}")
+        call_stack = self.call_stack
+        signatures = self.signatures
+        code_for = self._code_for
+        globals_ = self.globals
+        memory = self.memory
+        write = self.output.write
+        
+        frame = call_stack[-1]
+        code = frame.code
+        locals_ = frame.locals
+        stack = frame.operands
+        sp = 0
+        ip = 0
+        try:
+            while True:
+                op, arg = code[ip]
+                ip += 1
+                if op == LOCAL_GET:
+                    stack[sp] = locals_[arg]
+                    sp += 1
+                elif op == LOCAL_GET2:
+                    stack[sp] = locals_[arg[0]]
+                    stack[sp + 1] = locals_[arg[1]]
+                    sp += 2
+                elif op == LOCAL_CONST:
+                    stack[sp] = locals_[arg[0]]
+                    stack[sp + 1] = arg[1]
+                    sp += 2
+                elif op == CONSTI:
+                    stack[sp] = arg
+                    sp += 1
+                elif op == LOCAL_SET:
+                    sp -= 1
+                    locals_[arg] = stack[sp]
+                elif op == GLOBAL_GET:
+                    stack[sp] = globals_.get(arg, 0)
+                    sp += 1
+                elif op == GLOBAL_CONST:
+                    stack[sp] = globals_.get(arg[0], 0)
+                    stack[sp + 1] = arg[1]
+                    sp += 2
+                elif op == GLOBAL_SET:
+                    sp -= 1
+                    globals_[arg] = stack[sp]
+                elif op == JUMPZ:
+                    sp -= 1
+                    if stack[sp] == 0:
+                        ip = arg
+                elif op == JUMP:
+                    ip = arg
+                elif op == INC_LOCAL:
+                    locals_[arg[0]] += arg[1]
+                elif op == INC_GLOBAL:
+                    globals_[arg[0]] = globals_.get(arg[0], 0) + arg[1]
+                elif op == JUMP_IF_NE:
+                    sp -= 2
+                    if stack[sp] != stack[sp + 1]:
+                        ip = arg
+                elif op == JUMP_IF_GE:
+                    sp -= 2
+                    if stack[sp] >= stack[sp + 1]:
+                        ip = arg
+                elif op == JUMP_IF_EQ:
+                    sp -= 2
+                    if stack[sp] == stack[sp + 1]:
+                        ip = arg
+                elif op == JUMP_IF_LT:
+                    sp -= 2
+                    if stack[sp] < stack[sp + 1]:
+                        ip = arg
+                elif op == JUMP_IF_GT:
+                    sp -= 2
+                    if stack[sp] > stack[sp + 1]:
+                        ip = arg
+                elif op == JUMP_IF_LE:
+                    sp -= 2
+                    if stack[sp] <= stack[sp + 1]:
+                        ip = arg
+                elif op == ADDI:
+                    sp -= 1
+                    stack[sp - 1] += stack[sp]
+                elif op == SUBI:
+                    sp -= 1
+                    stack[sp - 1] -= stack[sp]
+                elif op == MULI:
+                    sp -= 1
+                    stack[sp - 1] *= stack[sp]
+                elif op == LTI:
+                    sp -= 1
+                    stack[sp - 1] = 1 if stack[sp - 1] < stack[sp] else 0
+                elif op == LEI:
+                    sp -= 1
+                    stack[sp - 1] = 1 if stack[sp - 1] <= stack[sp] else 0
+                elif op == GTI:
+                    sp -= 1
+                    stack[sp - 1] = 1 if stack[sp - 1] > stack[sp] else 0
+                elif op == GEI:
+                    sp -= 1
+                    stack[sp - 1] = 1 if stack[sp - 1] >= stack[sp] else 0
+                elif op == EQI:
+                    sp -= 1
+                    stack[sp - 1] = 1 if stack[sp - 1] == stack[sp] else 0
+                elif op == NEI:
+                    sp -= 1
+                    stack[sp - 1] = 1 if stack[sp - 1] != stack[sp] else 0
+                elif op == MODI:
+                    sp -= 1
+                    if stack[sp] == 0:
+                        raise RuntimeError("División por cero")
+                    stack[sp - 1] %= stack[sp]
+                elif op == DIVI:
+                    sp -= 1
+                    if stack[sp] == 0:
+                        raise RuntimeError("División por cero")
+                    stack[sp - 1] //= stack[sp]
+                elif op == CALL:
+                    signature = signatures[arg]
+                    base = sp - signature.param_count
+                    memo = signature.memo
+                    if memo is not None:
+                        key = tuple(stack[base:sp])
+                        value = memo.get(key)
+                        if value is not _MISSING:
+                            stack[base] = value
+                            sp = base + 1
+                            continue
+                    callee = code_for(arg)
+                    slots = stack[base:sp]
+                    slots += signature.local_defaults
+                    frame.sp = base
+                    frame = CallFrame(arg, ip, signature, callee, slots)
+                    frame.operands = stack = [0] * signature.max_stack
+                    if memo is not None:
+                        frame.memo = (memo, key)
+                    call_stack.append(frame)
+                    code = callee
+                    locals_ = slots
+                    sp = 0
+                    ip = 0
+                elif op == TAILCALL:
+                    callee = code_for(arg)
+                    signature = signatures[arg]
+                    count = signature.param_count
+                    if signature is frame.signature:
+                        locals_[:count] = stack[:count]
+                        locals_[count:] = signature.local_defaults
+                    else:
+                        locals_ = stack[:count] + signature.local_defaults
+                        frame.function_name = arg
+                        frame.signature = signature
+                        frame.code = callee
+                        frame.locals = locals_
+                        frame.params_count = count
+                        if signature.max_stack > len(stack):
+                            frame.operands = stack = [0] * signature.max_stack
+                    code = callee
+                    sp = 0
+                    ip = 0
+                elif op == RET:
+                    done = call_stack.pop()
+                    # Un TAILCALL puede haber cambiado la aridad del frame
+                    value = stack[sp - 1] if sp else 0
+                    if done.memo is not None:
+                        done.memo[0].put(done.memo[1], value)
+                    if not call_stack:
+                        if done.returns:
+                            self.stack.append(value)
+                        break
+                    frame = call_stack[-1]
+                    code = frame.code
+                    locals_ = frame.locals
+                    stack = frame.operands
+                    sp = frame.sp
+                    ip = done.return_address
+                    if done.returns:
+                        stack[sp] = value
+                        sp += 1
+                elif op == INTRINSIC:
+                    function, count = arg
+                    base = sp - count
+                    stack[base] = function(*stack[base:sp])
+                    sp = base + 1
+                elif op == DROP:
+                    sp -= 1
+                elif op == PRINTI:
+                    sp -= 1
+                    write(f"{int(stack[sp])}\n")
+                elif op == PRINTS:
+                    write(arg)
+                elif op == PRINTB:
+                    sp -= 1
+                    write(chr(int(stack[sp])))
+                elif op == PRINTF:
+                    sp -= 1
+                    write(f"{float(stack[sp])}\n")
+                elif op == ANDI:
+                    sp -= 1
+                    stack[sp - 1] = 1 if stack[sp - 1] and stack[sp] else 0
+                elif op == ORI:
+                    sp -= 1
+                    stack[sp - 1] = 1 if stack[sp - 1] or stack[sp] else 0
+                elif op == CONSTF:
+                    stack[sp] = arg
+                    sp += 1
+                elif op == ADDF:
+                    sp -= 1
+                    stack[sp - 1] = float(stack[sp - 1]) + float(stack[sp])
+                elif op == SUBF:
+                    sp -= 1
+                    stack[sp - 1] = float(stack[sp - 1]) - float(stack[sp])
+                elif op == MULF:
+                    sp -= 1
+                    stack[sp - 1] = float(stack[sp - 1]) * float(stack[sp])
+                elif op == DIVF:
+                    sp -= 1
+                    if stack[sp] == 0:
+                        raise RuntimeError("División por cero")
+                    stack[sp - 1] = float(stack[sp - 1]) / float(stack[sp])
+                elif op == EQF:
+                    sp -= 1
+                    stack[sp - 1] = 1 if abs(float(stack[sp - 1]) - float(stack[sp])) < 1e-9 else 0
+                elif op == NEF:
+                    sp -= 1
+                    stack[sp - 1] = 1 if abs(float(stack[sp - 1]) - float(stack[sp])) >= 1e-9 else 0
+                elif op == ITOF:
+                    stack[sp - 1] = float(stack[sp - 1])
+                elif op == FTOI:
+                    stack[sp - 1] = int(stack[sp - 1])
+                elif op == PEEKI:
+                    stack[sp - 1] = memory.read_int(stack[sp - 1])
+                elif op == PEEKF:
+                    stack[sp - 1] = memory.read_float(stack[sp - 1])
+                elif op == PEEKB:
+                    stack[sp - 1] = memory.read_byte(stack[sp - 1])
+                elif op == POKEI:
+                    sp -= 2
+                    memory.write_int(stack[sp], stack[sp + 1])
+                elif op == POKEF:
+                    sp -= 2
+                    memory.write_float(stack[sp], stack[sp + 1])
+                elif op == POKEB:
+                    sp -= 2
+                    memory.write_byte(stack[sp], stack[sp + 1])
+                elif op == GROW:
+                    sp -= 1
+                    memory.grow(stack[sp])
+                elif op == MEMCPY:
+                    sp -= 3
+                    memory.copy(stack[sp], stack[sp + 1], stack[sp + 2])
+                elif op == MEMSET:
+                    sp -= 3
+                    memory.fill(stack[sp], stack[sp + 1], stack[sp + 2])
+                elif op == MEMCMP:
+                    sp -= 2
+                    stack[sp - 1] = memory.compare(stack[sp - 1], stack[sp], stack[sp + 1])
+                else:
+                    raise RuntimeError(f"Instrucción no implementada: {op}")
+        finally:
+            # Estado visible para get_stack_trace / debug_state
+            self.ip = ip - 1
+            self.locals = locals_
+            self.instructions = code
+            frame.sp = sp
+            self.running = False
 
     # ════════════════════════════════════════════════════════════════
     #  IMPLEMENTACIÓN DE INSTRUCCIONES (Compatible con tu IR)
@@ -193,13 +1064,13 @@ class StackMachine:
     
     # --- Constantes ---
     def _exec_consti(self, value):
-        self.stack.append(int(value))
+        self.stack.append(value)
     
     def _exec_pushi(self, value):
-        self.stack.append(int(value))
+        self.stack.append(value)
     
     def _exec_constf(self, value):
-        self.stack.append(float(value))
+        self.stack.append(value)
     
     # --- Aritmética Entera ---
     def _exec_addi(self):
@@ -220,6 +1091,12 @@ class StackMachine:
             raise RuntimeError("División por cero")
         self.stack.append(a // b)
     
+    def _exec_modi(self):
+        b, a = self.stack.pop(), self.stack.pop()
+        if b == 0:
+            raise RuntimeError("División por cero")
+        self.stack.append(a % b)
+    
     # --- Aritmética Flotante ---
     def _exec_addf(self):
         b, a = self.stack.pop(), self.stack.pop()
@@ -326,20 +1203,25 @@ class StackMachine:
         new_size = self.stack.pop()
         self.memory.grow(new_size)
     
-    # --- Variables ---
-    def _exec_local_get(self, name):
-        if not self.call_stack:
-            raise RuntimeError("No hay frame activo")
-        frame = self.call_stack[-1]
-        value = frame.get_local(name)
-        self.stack.append(value)
+    # --- Memoria en bloque: operandos (destino, origen|valor, cantidad) ---
+    def _exec_memcpy(self):
+        count, src, dst = self.stack.pop(), self.stack.pop(), self.stack.pop()
+        self.memory.copy(dst, src, count)
     
-    def _exec_local_set(self, name):
-        if not self.call_stack:
-            raise RuntimeError("No hay frame activo")
-        value = self.stack.pop()
-        frame = self.call_stack[-1]
-        frame.set_local(name, value)
+    def _exec_memset(self):
+        count, value, address = self.stack.pop(), self.stack.pop(), self.stack.pop()
+        self.memory.fill(address, value, count)
+    
+    def _exec_memcmp(self):
+        count, b, a = self.stack.pop(), self.stack.pop(), self.stack.pop()
+        self.stack.append(self.memory.compare(a, b, count))
+    
+    # --- Variables (operando = slot del frame activo) ---
+    def _exec_local_get(self, slot):
+        self.stack.append(self.locals[slot])
+    
+    def _exec_local_set(self, slot):
+        self.locals[slot] = self.stack.pop()
     
     def _exec_global_get(self, name):
         value = self.globals.get(name, 0)
@@ -349,146 +1231,179 @@ class StackMachine:
         value = self.stack.pop()
         self.globals[name] = value
     
-    # ─── Llamadas a funciones (CORREGIDAS) ───
+    # ─── Llamadas a funciones ───
     def _exec_call(self, func_name):
-        """CALL - Llama a función CON manejo correcto de parámetros"""
-        if func_name not in self.functions:
-            raise RuntimeError(f"Función '{func_name}' no encontrada")
-        
-        # Obtener información de la función del IR
-        func_instructions = self.functions[func_name]
-        
-        # Determinar número de parámetros
-        param_count = self._get_param_count(func_name)
-        
-        # Extraer parámetros del stack (en orden inverso)
-        params = []
-        for _ in range(param_count):
-            if self.stack:
-                params.append(self.stack.pop())
-            else:
-                params.append(0)  # Default si no hay suficientes parámetros
-        
-        params.reverse()  # Restaurar orden correcto
-        
-        # Crear nuevo frame con parámetros
-        return_address = self.ip + 1
-        new_frame = CallFrame(func_name, return_address, param_count)
+        """CALL - Apila un frame armado según la tabla de firmas"""
+        code = self._code_for(func_name)
+        signature = self.signatures[func_name]
         
-        # Asignar parámetros a variables locales
-        param_names = self._get_param_names(func_name)
-        for i, param_name in enumerate(param_names):
-            if i < len(params):
-                new_frame.set_local(param_name, params[i])
+        # Los argumentos son los últimos param_count valores del stack
+        stack = self.stack
+        base = len(stack) - signature.param_count
+        if base < 0:
+            raise RuntimeError(f"Faltan argumentos para '{func_name}'")
+        memo = signature.memo
+        if memo is not None:
+            key = tuple(stack[base:])
+            value = memo.get(key)
+            if value is not _MISSING:
+                del stack[base:]
+                stack.append(value)
+                return None
+        slots = stack[base:]
+        del stack[base:]
+        slots += signature.local_defaults
         
+        new_frame = CallFrame(func_name, self.ip, signature, code, slots)
+        new_frame.stack_base = base
+        if memo is not None:
+            new_frame.memo = (memo, key)
         self.call_stack.append(new_frame)
         
-        # Guardar contexto actual
-        old_instructions = self.instructions
-        old_ip = self.ip
-        
-        # Cambiar a función llamada
-        self.instructions = func_instructions
-        self.ip = 0
-        
-        # Ejecutar función hasta RET
-        return_value = None
-        while self.ip < len(self.instructions) and self.running:
-            instr = self.instructions[self.ip]
-            if instr and instr[0] == 'RET':
-                # Capturar valor de retorno si hay algo en el stack
-                if self.stack:
-                    return_value = self.stack.pop()
-                break
-            self._execute_instruction()
-            self.ip += 1
-        
-        # Restaurar contexto
-        self.call_stack.pop()
-        self.instructions = old_instructions
-        self.ip = old_ip
+        self.locals = slots
+        self.instructions = code
+        self.ip = -1  # El bucle lo incrementa a 0
+        return True
+    
+    def _exec_intrinsic(self, function, count):
+        """INTRINSIC - reemplaza los argumentos por el resultado, sin frame"""
+        stack = self.stack
+        base = len(stack) - count
+        if base < 0:
+            raise RuntimeError("Faltan argumentos para la intrínseca")
+        value = function(*stack[base:])
+        del stack[base:]
+        stack.append(value)
+    
+    def _exec_tailcall(self, func_name):
+        """TAILCALL - 'return f(...)': reutiliza el frame actual para f"""
+        code = self._code_for(func_name)
+        signature = self.signatures[func_name]
+        frame = self.call_stack[-1]
         
-        # Poner valor de retorno en el stack
-        if return_value is not None:
-            self.stack.append(return_value)
+        stack = self.stack
+        count = signature.param_count
+        start = len(stack) - count
+        if start < frame.stack_base:
+            raise RuntimeError(f"Faltan argumentos para '{func_name}'")
+        if signature is frame.signature:
+            slots = frame.locals
+            slots[:count] = stack[start:]
+            slots[count:] = signature.local_defaults
         else:
-            self.stack.append(0)  # Default return value
+            slots = stack[start:] + signature.local_defaults
+            frame.function_name = func_name
+            frame.signature = signature
+            frame.code = code
+            frame.locals = slots
+            frame.params_count = count
+        # Descarta los argumentos y lo que quedara del cuerpo anterior
+        del stack[frame.stack_base:]
+        
+        self.locals = slots
+        self.instructions = code
+        self.ip = -1
+        return True
     
     def _exec_ret(self):
-        """RET - Retorna de función SIN limpiar el stack"""
-        # El valor de retorno ya está en el stack
-        # Solo marcamos que debemos salir del loop de ejecución
-        if len(self.call_stack) <= 1:
+        """RET - Desapila el frame y vuelve al código del llamador"""
+        frame = self.call_stack.pop()
+        
+        # Dejar exactamente return arity valores sobre la base del frame
+        stack = self.stack
+        base, returns = frame.stack_base, frame.returns
+        if len(stack) != base + returns:
+            value = stack[-1] if len(stack) > base else 0
+            del stack[base:]
+            if returns:
+                stack.append(value)
+        if frame.memo is not None:
+            frame.memo[0].put(frame.memo[1], stack[-1] if returns else 0)
+        
+        if not self.call_stack:
             self.running = False
-        else:
-            # Salir del bucle de ejecución de función
-            # El valor de retorno se mantiene en el stack
-            self.ip = len(self.instructions)
+            return True
+        caller = self.call_stack[-1]
+        self.locals = caller.locals
+        self.instructions = caller.code
+        self.ip = frame.return_address
+        return True
+    
+    # --- Control de Flujo (saltos resueltos en lowering.py) ---
+    def _exec_jump(self, target):
+        self.ip = target - 1  # Compensa el incremento automático
     
-    # --- Control de Flujo ---
-    def _exec_if(self):
+    def _exec_jumpz(self, target):
         condition = self.stack.pop()
         if condition == 0:  # Falso
-            self._skip_to_matching(['ELSE', 'ENDIF'], 'IF', 'ENDIF')
+            self.ip = target - 1
     
-    def _exec_else(self):
-        self._skip_to_matching(['ENDIF'], 'IF', 'ENDIF')
+    # --- Superinstrucciones (peephole.py) ---
+    def _exec_inc_local(self, slot, delta):
+        self.locals[slot] += delta
     
-    def _exec_endif(self):
-        pass  # Marca el fin del if
+    def _exec_local_get2(self, first, second):
+        self.stack.append(self.locals[first])
+        self.stack.append(self.locals[second])
     
-    def _exec_loop(self):
-        self.loop_stack.append(self.ip)
+    def _exec_local_const(self, slot, value):
+        self.stack.append(self.locals[slot])
+        self.stack.append(value)
     
-    def _exec_cbreak(self):
-        condition = self.stack.pop()
-        if condition == 0:  # Falso, salir del bucle
-            self._skip_to_matching(['ENDLOOP'], 'LOOP', 'ENDLOOP')
-            if self.loop_stack:
-                self.loop_stack.pop()
-    
-    def _exec_endloop(self):
-        if self.loop_stack:
-            self.ip = self.loop_stack[-1] - 1
-        else:
-            raise RuntimeError("ENDLOOP sin LOOP correspondiente")
+    def _exec_inc_global(self, name, delta):
+        self.globals[name] = self.globals.get(name, 0) + delta
+    
+    def _exec_global_const(self, name, value):
+        self.stack.append(self.globals.get(name, 0))
+        self.stack.append(value)
+    
+    def _jump_if(self, target, test):
+        b = self.stack.pop()
+        a = self.stack.pop()
+        if test(a, b):
+            self.ip = target - 1
+    
+    def _exec_jump_if_eq(self, target):
+        self._jump_if(target, operator.eq)
+    
+    def _exec_jump_if_ne(self, target):
+        self._jump_if(target, operator.ne)
+    
+    def _exec_jump_if_lt(self, target):
+        self._jump_if(target, operator.lt)
+    
+    def _exec_jump_if_le(self, target):
+        self._jump_if(target, operator.le)
+    
+    def _exec_jump_if_gt(self, target):
+        self._jump_if(target, operator.gt)
+    
+    def _exec_jump_if_ge(self, target):
+        self._jump_if(target, operator.ge)
+    
+    def _exec_drop(self):
+        self.stack.pop()
     
     # --- Entrada/Salida ---
     def _exec_printi(self):
         value = self.stack.pop()
-        print(int(value))
+        self.output.write(f"{int(value)}\n")
     
     def _exec_printf(self):
         value = self.stack.pop()
-        print(float(value))
+        self.output.write(f"{float(value)}\n")
     
     def _exec_printb(self):
         value = self.stack.pop()
-        print(chr(int(value)), end='')
+        self.output.write(chr(int(value)))
+    
+    def _exec_prints(self, text):
+        self.output.write(text)
 
     # ════════════════════════════════════════════════════════════════
     #  UTILIDADES
     # ════════════════════════════════════════════════════════════════
     
-    def _skip_to_matching(self, targets, open_token, close_token):
-        """Salta a instrucción objetivo respetando anidación"""
-        depth = 1
-        self.ip += 1
-        
-        while self.ip < len(self.instructions) and depth > 0:
-            instr = self.instructions[self.ip]
-            if instr:
-                op = instr[0]
-                if op == open_token:
-                    depth += 1
-                elif op == close_token:
-                    depth -= 1
-                elif op in targets and depth == 1:
-                    return
-            self.ip += 1
-        
-        self.ip -= 1  # Ajustar para incremento automático
-    
     def get_stack_trace(self):
         """Stack trace para debugging"""
         trace = []
@@ -496,48 +1411,25 @@ class StackMachine:
             trace.append(f"  en función '{frame.function_name}'")
         return "\n".join(trace)
     
+    def _operand_stack(self):
+        if self.verify and self.call_stack:
+            frame = self.call_stack[-1]
+            return (frame.operands or [])[:frame.sp]
+        return self.stack
+    
     def debug_state(self):
         """Estado actual para debugging"""
         return {
             "ip": self.ip,
-            "stack": self.stack[:10],  # Solo primeros 10
+            "stack": self._operand_stack()[:10],  # Solo primeros 10
             "current_function": self.call_stack[-1].function_name if self.call_stack else None,
             "globals": dict(list(self.globals.items())[:5])  # Solo primeros 5
         }
     
-    def _get_param_count(self, func_name):
-        """Determina el número de parámetros de una función del IR"""
-        if func_name == "add":
-            return 2
-        elif func_name == "factorial":
-            return 1
-        elif func_name in ["mod", "gcd", "powmod"]:
-            return 2
-        elif func_name == "find_period":
-            return 2
-        elif func_name == "shor":
-            return 1
-        else:
-            return 0
-
-    def _get_param_names(self, func_name):
-        """Obtiene los nombres de parámetros de una función"""
-        if func_name == "add":
-            return ["x", "y"]
-        elif func_name == "factorial":
-            return ["n"]
-        elif func_name == "mod":
-            return ["a", "b"]
-        elif func_name == "gcd":
-            return ["a", "b"]
-        elif func_name == "powmod":
-            return ["a", "x", "n"]
-        elif func_name == "find_period":
-            return ["a", "N"]
-        elif func_name == "shor":
-            return ["N"]
-        else:
-            return []
+    def memo_stats(self):
+        """nombre -> (aciertos, fallos, entradas) de las funciones memoizadas"""
+        return {name: (sig.memo.hits, sig.memo.misses, len(sig.memo.entries))
+                for name, sig in self.signatures.items() if sig.memo is not None}
 
 
 # ════════════════════════════════════════════════════════════════
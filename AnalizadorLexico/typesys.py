@@ -92,3 +92,15 @@ unary_ops = {
 def check_unaryop(op, operand_type):
 	return unary_ops.get((op, operand_type))
 
+# Funciones intrínsecas (intrinsics.py): nombre -> (tipos de parámetros, retorno)
+builtin_funcs = {
+	'__mod'    : (('int', 'int'), 'int'),
+	'__gcd'    : (('int', 'int'), 'int'),
+	'__powmod' : (('int', 'int', 'int'), 'int'),
+	'__isqrt'  : (('int',), 'int'),
+}
+
+# Firma de una función intrínseca, o None si el nombre no es de una.
+
+def check_builtin(name):
+	return builtin_funcs.get(name)
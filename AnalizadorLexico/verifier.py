@@ -0,0 +1,154 @@
+# verifier.py - Verificador estático de altura de pila
+'''
+Verificador de pila
+===================
+Recorre el código de una función (ya con los saltos resueltos) y
+calcula la altura exacta de la pila de operandos antes de cada
+instrucción. El código se rechaza si:
+
+  - alguna instrucción desapila más de lo que hay,
+  - dos caminos llegan a la misma instrucción con alturas distintas,
+  - RET no deja exactamente la aridad de retorno de la función,
+  - TAILCALL no tiene exactamente los argumentos de la función llamada,
+  - aparece una instrucción o intrínseca desconocida o un marcador sin resolver.
+
+Para el código aceptado se conoce la profundidad máxima de la pila, así
+que la máquina puede reservar la pila de cada frame de antemano y
+ejecutarlo sin comprobar underflow.
+'''
+
+from collections import namedtuple
+
+from intrinsics import INTRINSICS
+from lowering import resolve_jumps
+from peephole import FUSED_JUMPS
+
+
+class VerifyError(RuntimeError):
+    '''Código IR rechazado por el verificador.'''
+    pass
+
+
+# Efecto de cada instrucción sobre la pila: (valores que consume, que produce)
+STACK_EFFECTS = {
+    'CONSTI': (0, 1), 'PUSHI': (0, 1), 'CONSTF': (0, 1),
+    'LOCAL_GET': (0, 1), 'GLOBAL_GET': (0, 1),
+    'LOCAL_SET': (1, 0), 'GLOBAL_SET': (1, 0),
+    'ADDI': (2, 1), 'SUBI': (2, 1), 'MULI': (2, 1), 'DIVI': (2, 1), 'MODI': (2, 1),
+    'ADDF': (2, 1), 'SUBF': (2, 1), 'MULF': (2, 1), 'DIVF': (2, 1),
+    'EQI': (2, 1), 'NEI': (2, 1), 'LTI': (2, 1), 'LEI': (2, 1), 'GTI': (2, 1), 'GEI': (2, 1),
+    'EQF': (2, 1), 'NEF': (2, 1),
+    'ANDI': (2, 1), 'ORI': (2, 1),
+    'ITOF': (1, 1), 'FTOI': (1, 1),
+    'PEEKI': (1, 1), 'PEEKF': (1, 1), 'PEEKB': (1, 1),
+    'POKEI': (2, 0), 'POKEF': (2, 0), 'POKEB': (2, 0),
+    'GROW': (1, 0),
+    'MEMCPY': (3, 0), 'MEMSET': (3, 0), 'MEMCMP': (3, 1),
+    'PRINTI': (1, 0), 'PRINTF': (1, 0), 'PRINTB': (1, 0), 'PRINTS': (0, 0),
+    'DROP': (1, 0),
+    'JUMP': (0, 0), 'JUMPZ': (1, 0),
+    # Superinstrucciones (peephole.py)
+    'INC_LOCAL': (0, 0), 'LOCAL_GET2': (0, 2), 'LOCAL_CONST': (0, 2),
+    'INC_GLOBAL': (0, 0), 'GLOBAL_CONST': (0, 2),
+    **{name: (2, 0) for name in FUSED_JUMPS},
+}
+
+# Saltos que pueden seguir de largo
+CONDITIONAL_JUMPS = {'JUMPZ'} | FUSED_JUMPS
+
+
+# Lo único que el verificador necesita de la firma de una función
+Arity = namedtuple('Arity', 'param_count returns')
+
+
+def epilogue(returns):
+    """Cierre implícito de una función que termina sin return"""
+    return [('CONSTI', 0), ('RET',)] if returns else [('RET',)]
+
+
+def verify_function(name, instructions, signatures):
+    """
+    Verifica el código de una función y devuelve la profundidad máxima de
+    su pila de operandos. 'signatures' mapea nombre -> firma (con
+    param_count y returns) para las funciones que se pueden llamar.
+    """
+    return stack_heights(name, instructions, signatures)[1]
+
+
+def stack_heights(name, instructions, signatures):
+    """
+    Igual que verify_function, pero devuelve (alturas, profundidad
+    máxima): la altura de la pila antes de cada instrucción, o None si
+    la instrucción no se alcanza.
+    """
+    returns = signatures[name].returns
+    size = len(instructions)
+    heights = [None] * size
+    pending = [(0, 0)]
+    max_depth = 0
+
+    def fail(ip, msg):
+        raise VerifyError(f"{name}@{ip}: {msg}")
+
+    while pending:
+        ip, height = pending.pop()
+        while True:
+            if ip >= size:
+                fail(ip, "el código termina sin RET")
+            seen = heights[ip]
+            if seen is not None:
+                if seen != height:
+                    fail(ip, f"altura de pila inconsistente ({seen} vs {height})")
+                break
+            heights[ip] = height
+
+            instr = instructions[ip]
+            op = instr[0]
+            if op == 'RET':
+                if height != returns:
+                    fail(ip, f"RET con {height} valores en la pila (se esperaban {returns})")
+                break
+            if op in ('CALL', 'TAILCALL'):
+                callee = signatures.get(instr[1])
+                if callee is None:
+                    fail(ip, f"función '{instr[1]}' no encontrada")
+                pops, pushes = callee.param_count, callee.returns
+                if op == 'TAILCALL':
+                    if height != pops:
+                        fail(ip, f"TAILCALL con {height} valores (se esperaban {pops})")
+                    break
+            elif op == 'INTRINSIC':
+                if instr[1] not in INTRINSICS:
+                    fail(ip, f"intrínseca '{instr[1]}' no encontrada")
+                pops, pushes = INTRINSICS[instr[1]].arity, 1
+            elif op in STACK_EFFECTS:
+                pops, pushes = STACK_EFFECTS[op]
+            else:
+                fail(ip, f"instrucción no verificable: {op}")
+
+            if height < pops:
+                fail(ip, f"{op} desapila {pops} valores con {height} en la pila")
+            height += pushes - pops
+            max_depth = max(max_depth, height)
+
+            if op == 'JUMP':
+                ip = instr[1]
+                continue
+            if op in CONDITIONAL_JUMPS:
+                pending.append((instr[1], height))
+            ip += 1
+
+    return heights, max_depth
+
+
+def max_stack_depths(module):
+    """Verifica todas las funciones de un IRModule; devuelve nombre -> profundidad máxima"""
+    arities = {func.name: Arity(len(func.params), 0 if func.return_type == 'V' else 1)
+               for func in module.functions}
+    return {
+        func.name: verify_function(
+            func.name,
+            resolve_jumps(func.instructions) + epilogue(arities[func.name].returns),
+            arities)
+        for func in module.functions
+    }
@@ -1,4 +1,5 @@
 # vm.py
+import ast
 
 class VirtualMachine:
     def __init__(self):
@@ -8,6 +9,7 @@ class VirtualMachine:
         self.ip = 0
         self.instructions = []
         self.labels = {}
+        self.strings = []
 
     def load_ir(self, filename):
         with open(filename) as f:
@@ -15,10 +17,16 @@ class VirtualMachine:
 
         current_func = None
         for line in lines:
-            if line.startswith("FUNCTION"):
-                current_func = line.split()[1]
+            if line.startswith("STRINGS:::"):
+                self.strings = ast.literal_eval(line[len("STRINGS:::"):].strip())
+            elif line.startswith("FUNCTION"):
+                current_func = line.split()[1].rstrip(',')
                 self.functions[current_func] = []
-            elif current_func:
+            elif current_func and line.startswith("("):
+                # ('OP', arg) -> "OP arg"
+                instr = ast.literal_eval(line)
+                self.functions[current_func].append(" ".join(str(part) for part in instr))
+            elif current_func and not line.startswith("locals:"):
                 self.functions[current_func].append(line)
 
     def run(self, func_name="main"):
@@ -40,6 +48,8 @@ class VirtualMachine:
             print(self.stack.pop())
         elif op == "PRINTB":
             print(chr(self.stack.pop()), end='')
+        elif op == "PRINTS":
+            print(self.strings[int(args[0])], end='')
         elif op == "ADDI":
             b = self.stack.pop()
             a = self.stack.pop()
@@ -80,6 +90,8 @@ class VirtualMachine:
             b = self.stack.pop()
             a = self.stack.pop()
             self.stack.append(int(a >= b))
+        elif op == "DROP":
+            self.stack.pop()
         elif op == "GLOBAL_SET":
             self.globals[args[0]] = self.stack.pop()
         elif op == "GLOBAL_GET":
@@ -87,8 +99,14 @@ class VirtualMachine:
         elif op == "CALL":
             # Save state
             return_ip = self.ip
+            return_instructions = self.instructions
             self.run(args[0])
+            self.instructions = return_instructions
             self.ip = return_ip
+        elif op == "TAILCALL":
+            # Equivale a CALL seguido de RET
+            self.run(args[0])
+            self.ip = len(self.instructions)
         elif op == "RET":
             self.ip = len(self.instructions)  # finish current run
         elif op == "IF":